@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from wpm.analytics import LinearFit, Series, Trend, ewma, moving_average
+
+
+class SeriesTests(unittest.TestCase):
+    def setUp(self):
+        self.series = Series()
+        # Wednesday 2018-01-03 through Sunday 2018-02-04, one race per day
+        start = datetime.datetime(2018, 1, 3, 10, 30, 0, 1)
+        for day in range(33):
+            self.series.add(start + datetime.timedelta(days=day), 50.0 + day, 1.0)
+
+    def test_weeks_start_on_monday(self):
+        buckets = self.series.buckets("week")
+        self.assertEqual(buckets[0][0], datetime.date(2018, 1, 1))
+        self.assertEqual(buckets[0][1].count, 5)
+        self.assertEqual(buckets[1][0], datetime.date(2018, 1, 8))
+        self.assertEqual(buckets[1][1].count, 7)
+        self.assertEqual(sum(wpm.count for _, wpm, _ in buckets), 33)
+
+    def test_months(self):
+        buckets = self.series.buckets("month")
+        self.assertEqual([start for start, _, _ in buckets],
+                         [datetime.date(2018, 1, 1), datetime.date(2018, 2, 1)])
+        self.assertEqual(buckets[0][1].count, 29)
+        self.assertAlmostEqual(buckets[0][1].mean, 64.0)
+        self.assertEqual((buckets[1][1].low, buckets[1][1].high), (79.0, 82.0))
+
+    def test_days(self):
+        self.assertEqual(len(self.series.buckets("day")), 33)
+
+    def test_trend(self):
+        trend = Trend(self.series, "week")
+        self.assertAlmostEqual(trend.wpm_per_week, 7.0)
+
+
+class SmoothingTests(unittest.TestCase):
+    def test_moving_average(self):
+        self.assertEqual(moving_average([1, 2, 3, 4], 2), [1.0, 1.5, 2.5, 3.5])
+
+    def test_ewma(self):
+        self.assertEqual(ewma([2.0, 4.0], 3), [2.0, 3.0])
+
+    def test_linear_fit(self):
+        line = LinearFit()
+        for x, y in zip([0, 1, 2, 3], [1, 3, 5, 7]):
+            line.add(x, y)
+        self.assertAlmostEqual(line.slope, 2.0)
+        self.assertAlmostEqual(line.intercept, 1.0)
@@ -0,0 +1,53 @@
+import sys
+import threading
+import unittest
+
+from wpm.background import Background
+
+if sys.version_info[0:2] >= (3, 5):
+    import asyncio
+    from wpm.tasks import BackgroundTask
+else:
+    asyncio = None
+
+
+class BackgroundTests(unittest.TestCase):
+    def test_without_loop(self):
+        backgrounds = [Background()]
+        if asyncio is not None:
+            backgrounds.append(BackgroundTask())
+        for background in backgrounds:
+            calls = []
+            background.submit(lambda: calls.append("job"),
+                              lambda: calls.append("done"))
+            self.assertEqual(calls, ["job", "done"])
+            self.assertEqual(len(background), 0)
+
+    @unittest.skipIf(asyncio is None, "Needs asyncio tasks")
+    def test_loop(self):
+        background = BackgroundTask()
+        jobs = []
+        done = []
+
+        def job(n):
+            jobs.append((n, threading.current_thread()))
+
+        loop = asyncio.new_event_loop()
+        try:
+            task = loop.create_task(background.run())
+            loop.run_until_complete(asyncio.sleep(0))
+            for n in range(5):
+                background.submit(lambda n=n: job(n), lambda n=n: done.append(n))
+            while len(done) < 5:
+                loop.run_until_complete(asyncio.sleep(0.001))
+            background.submit(lambda: job(5))
+            task.cancel()
+            loop.run_until_complete(asyncio.wait([task]))
+        finally:
+            loop.close()
+        background.flush()
+
+        self.assertEqual([n for n, _ in jobs], list(range(6)))
+        self.assertEqual(done, list(range(5)))
+        self.assertNotEqual(jobs[0][1], threading.current_thread())
+        self.assertEqual(jobs[5][1], threading.current_thread())
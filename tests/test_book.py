@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.book import Book, Bookmarks, section_end
+from wpm.error import WpmError
+
+
+class BookTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "book.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.filename, "wb") as file_obj:
+            file_obj.write(data)
+
+    def test_section_end(self):
+        data = b"one two\n\nthree four\n  \nfive"
+        self.assertEqual(section_end(data, 0, 1, 100), 9)
+        self.assertEqual(section_end(data, 0, 10, 100), 23)
+        self.assertEqual(section_end(data, 23, 1, 100), len(data))
+
+        # Long paragraphs are broken after a space, or a whole character
+        self.assertEqual(section_end(b"abc def ghi", 0, 1, 9), 8)
+        self.assertEqual(section_end(u"abcædef".encode("utf-8"), 0, 1, 4),
+                         3)
+
+    def test_sections(self):
+        # Sections end at the first paragraph break 400 bytes into them
+        paragraphs = [u"Paragraph %d,\n%s" % (n, u" word"*50)
+                      for n in range(5)]
+        self.write(u"\n\n".join(paragraphs).encode("utf-8"))
+
+        quotes = Book(self.filename).random_iterator()
+        sections = [quotes.next() for _ in range(6)]
+        self.assertTrue(sections[0].text.startswith("Paragraph 0, word"))
+        self.assertTrue(sections[1].text.startswith("Paragraph 2, word"))
+        self.assertTrue(sections[2].text.startswith("Paragraph 4, word"))
+        self.assertEqual(sections[0].text.count("Paragraph"), 2)
+
+        # The book starts over after the last section
+        self.assertEqual(sections[3].text, sections[0].text)
+        self.assertEqual(quotes.previous().start, sections[1].start)
+
+        # Sections get the same ID wherever the book was opened
+        resumed = Book(self.filename, sections[1].start).random_iterator()
+        self.assertEqual(resumed.next().text_id, sections[1].text_id)
+        self.assertNotEqual(sections[0].text_id, sections[1].text_id)
+
+    def test_stale_offset(self):
+        self.write(b"Some text")
+        self.assertEqual(Book(self.filename, 1000).start, 0)
+
+        self.write(b" \n ")
+        self.assertRaises(WpmError, Book, self.filename)
+
+    def test_bookmarks(self):
+        bookmarks = Bookmarks(os.path.join(self.directory, "bookmarks"))
+        self.assertEqual(bookmarks.get(self.filename), 0)
+        bookmarks.set(self.filename, 123)
+        self.assertEqual(bookmarks.get(self.filename), 123)
+        self.assertEqual(bookmarks.get(self.filename + "2"), 0)
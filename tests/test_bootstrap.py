@@ -0,0 +1,38 @@
+import unittest
+
+from wpm.bootstrap import cached_intervals, interval, seed_for
+
+
+class BootstrapTests(unittest.TestCase):
+    values = [61.0, 64.5, 58.2, 70.1, 66.3, 59.9, 62.4, 80.2, 63.3, 65.0]
+
+    def test_contains_mean(self):
+        mean = sum(self.values) / len(self.values)
+        for method in ("percentile", "bca"):
+            low, high = interval(self.values, 0.05, method, 500, seed=1)
+            self.assertLess(low, mean)
+            self.assertGreater(high, mean)
+
+    def test_deterministic(self):
+        first = interval(self.values, 0.05, "bca", 500, seed=7)
+        second = interval(self.values, 0.05, "bca", 500, seed=7)
+        self.assertEqual(first, second)
+        self.assertEqual(seed_for(("a", 1, 10)), seed_for(("a", 1, 10)))
+
+    def test_degenerate(self):
+        self.assertEqual(interval([], 0.05), (0, 0))
+        self.assertEqual(interval([50.0], 0.05), (50.0, 50.0))
+        self.assertEqual(interval([50.0, 50.0], 0.05, "bca"), (50.0, 50.0))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            interval(self.values, 0.05, "normal")
+
+    def test_cached_intervals(self):
+        jobs = [(("tag", None, n), self.values[:n]) for n in (5, 10)]
+        serial = cached_intervals(jobs, 0.1, "percentile", 300, processes=1)
+        self.assertEqual(len(serial), 2)
+        self.assertEqual(serial[1], interval(self.values, 0.1, "percentile",
+                                             300, seed_for((jobs[1][0], 0.1,
+                                                            "percentile",
+                                                            300))))
@@ -0,0 +1,81 @@
+import unittest
+
+from wpm.engine import (CORRECT, CORRECTED, FINISHED, IGNORED, INCORRECT,
+                        TIME_UP, Engine, keystrokes, run)
+
+SECOND = 1000000000
+
+
+class EngineTests(unittest.TestCase):
+    def test_typing(self):
+        engine = Engine(u"ab c")
+        events = run(engine, [(u"a", 0), (u"x", 1), (u"KEY_BACKSPACE", 2),
+                              (u"b", 3), (u" ", 4), (u"KEY_BACKSPACE", 5),
+                              (u"c", SECOND)])
+        self.assertEqual(events, [CORRECT, INCORRECT, CORRECTED, CORRECT,
+                                  CORRECT, IGNORED, FINISHED])
+        self.assertEqual(engine.error_offsets, [1])
+        self.assertEqual(engine.correction_offsets, [1])
+        self.assertEqual(engine.recorder.count, 7)
+        self.assertTrue(engine.finished)
+
+        self.assertAlmostEqual(engine.elapsed(5*SECOND), 1.0)
+        self.assertAlmostEqual(engine.cps(1.0), 4.0)
+        self.assertAlmostEqual(engine.wpm(1.0), 48.0)
+        self.assertAlmostEqual(engine.accuracy, 0.8)
+
+        # Nothing happens after the race
+        self.assertEqual(engine.type(u"a", 2*SECOND), IGNORED)
+
+    def test_leading_backspace(self):
+        engine = Engine(u"ab")
+        events = run(engine, [(u"KEY_BACKSPACE", 0), (u"a", 10*SECOND),
+                              (u"b", 11*SECOND)])
+        self.assertEqual(events, [IGNORED, CORRECT, FINISHED])
+
+        # The keystrokes are timed from the first character
+        self.assertEqual(len(engine.recorder), 2)
+        self.assertAlmostEqual(engine.recorder.elapsed(1), 1.0)
+        self.assertAlmostEqual(engine.elapsed(0), 1.0)
+
+    def test_prompt(self):
+        engine = Engine(u"ab cd")
+        run(engine, [(u"a", 0), (u"b", 1), (u"x", 2), (u"y", 3)])
+        self.assertEqual((engine.position, engine.incorrect), (2, 2))
+        self.assertEqual(engine.edit, u"abxy")
+
+        # Erasing goes back into the correctly typed part of the word
+        run(engine, [(u"\x7f", 4)]*3)
+        self.assertEqual((engine.position, engine.incorrect), (1, 0))
+        self.assertEqual(engine.edit, u"a")
+
+        # Typos past the end of the text are not taken
+        run(engine, keystrokes(u"b c?xyz", start=5))
+        self.assertEqual((engine.position, engine.incorrect), (4, 1))
+
+    def test_timed(self):
+        engine = Engine(u"ab", duration=2)
+        keys = keystrokes(u"abcdab", cps=2.0)
+        events = run(engine, keys, [u"cd", u"ab"])
+        self.assertEqual(events, [CORRECT, FINISHED, CORRECT, FINISHED,
+                                  TIME_UP])
+        self.assertEqual(engine.typed, 4)
+        self.assertEqual(engine.elapsed(10*SECOND), 2.0)
+        self.assertAlmostEqual(engine.wpm(engine.elapsed(0)), 24.0)
+
+        engine = Engine(u"abc", duration=1)
+        run(engine, [(u"a", 0), (u"x", 1)])
+        self.assertFalse(engine.expire(SECOND - 1))
+        self.assertTrue(engine.expire(SECOND))
+        self.assertAlmostEqual(engine.accuracy, 0.5)
+
+    def test_keystrokes(self):
+        keys = keystrokes(u"ab", cps=4.0, start=10, typos=[1])
+        self.assertEqual(keys, [(u"a", 10),
+                                (u"#", 10 + SECOND // 4),
+                                (u"KEY_BACKSPACE", 10 + SECOND // 2),
+                                (u"b", 10 + 3*SECOND // 4)])
+
+        engine = Engine(u"ab")
+        self.assertEqual(run(engine, keys)[-1], FINISHED)
+        self.assertEqual(engine.total_incorrect, 1)
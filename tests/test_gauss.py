@@ -0,0 +1,41 @@
+import math
+import unittest
+
+from wpm.gauss import (confidence_interval, erf_inv, phi_inv,
+                       prediction_interval, z_score)
+
+
+class GaussTests(unittest.TestCase):
+    def test_phi_inv(self):
+        # Reference values from tables of the standard normal distribution
+        known = {
+            0.5: 0.0,
+            0.975: 1.959963984540054,
+            0.9995: 3.2905267314918945,
+            0.995: 2.5758293035489004,
+            1e-10: -6.361340902404056,
+        }
+        for p, z in known.items():
+            self.assertAlmostEqual(phi_inv(p), z, places=12)
+
+    def test_symmetry(self):
+        for p in (1e-6, 0.01, 0.2, 0.425, 0.49):
+            self.assertAlmostEqual(phi_inv(p), -phi_inv(1.0 - p), places=7)
+
+    def test_erf_inv(self):
+        for z in (-0.999, -0.5, 0.0, 0.3, 0.9999):
+            self.assertAlmostEqual(math.erf(erf_inv(z)), z, places=12)
+
+    def test_domain(self):
+        for p in (0.0, 1.0, -0.1):
+            with self.assertRaises(ValueError):
+                phi_inv(p)
+
+    def test_intervals(self):
+        self.assertAlmostEqual(z_score(0.05), 1.959963984540054)
+        low, high = confidence_interval(100.0, 10.0, 4, 0.05)
+        self.assertAlmostEqual(high - 100.0, 1.959963984540054*5.0)
+        self.assertAlmostEqual(100.0 - low, high - 100.0)
+        low, high = prediction_interval(100.0, 10.0, 0.001)
+        self.assertAlmostEqual(high - 100.0, 32.905267314918945)
+        self.assertEqual(confidence_interval(1.0, 1.0, 0, 0.05), (0, 0))
@@ -0,0 +1,77 @@
+import random
+import unittest
+
+from wpm.histogram import Histogram, histogram, plot
+
+
+class HistogramTests(unittest.TestCase):
+    def test_maximum_is_plotted(self):
+        low, width, histo = histogram([10.0, 15.0, 20.0], 4)
+        self.assertEqual(sorted(histo), [0, 2, 3])
+        self.assertEqual(sum(histo.values()), 3)
+
+    def test_widens(self):
+        histo = Histogram(bins=8, width=1.0)
+        for value in (10.0, 12.5, 17.9):
+            histo.add(value)
+        self.assertEqual(histo.width, 1.0)
+
+        histo.add(30.0)
+        self.assertEqual(histo.width, 4.0)
+        self.assertLess(histo.last - histo.first, 8)
+        self.assertEqual(histo.counts, {2: 1, 3: 1, 4: 1, 7: 1})
+        self.assertEqual((histo.low, histo.high), (10.0, 30.0))
+
+    def test_matches_batch(self):
+        generator = random.Random(4)
+        values = [generator.gauss(80, 10) for _ in range(500)]
+        histo = Histogram()
+        for value in values:
+            histo.add(value)
+
+        self.assertEqual(len(histo), 500)
+        self.assertLessEqual(len(histo.counts), histo.bins)
+        for index, count in histo.counts.items():
+            low = index*histo.width
+            expected = sum(1 for value in values
+                           if low <= value < low + histo.width)
+            self.assertEqual(count, expected)
+
+    def test_merge(self):
+        generator = random.Random(5)
+        whole = Histogram(bins=16)
+        parts = [Histogram(bins=16), Histogram(bins=16)]
+        for n in range(500):
+            value = generator.uniform(20, 60 + 40*(n % 2))
+            whole.add(value)
+            parts[n % 2].add(value)
+        self.assertNotEqual(parts[0].width, parts[1].width)
+        parts[0].merge(parts[1])
+
+        self.assertEqual(parts[0].width, whole.width)
+        self.assertEqual(parts[0].counts, whole.counts)
+        self.assertEqual((parts[0].first, parts[0].last),
+                         (whole.first, whole.last))
+        self.assertEqual((parts[0].low, parts[0].high),
+                         (whole.low, whole.high))
+        self.assertEqual(len(parts[0]), 500)
+
+    def test_render(self):
+        histo = Histogram(bins=64, width=1.0)
+        for value in range(40, 80):
+            histo.add(value + 0.5)
+
+        slots, low, width, counts = histo.render(10)
+        self.assertEqual((slots, low, width), (10, 40.0, 4.0))
+        self.assertEqual(sum(counts.values()), 40)
+        self.assertEqual(len(list(plot(slots, low, width, counts))), 10)
+        self.assertIs(histo.render(10)[3], counts)
+
+    def test_serialization(self):
+        histo = Histogram()
+        for value in (55.0, 61.2, 61.4, 70.0):
+            histo.add(value)
+        copy = Histogram.from_list(histo.to_list())
+        self.assertEqual(copy.counts, histo.counts)
+        self.assertEqual((copy.first, copy.last), (histo.first, histo.last))
+        self.assertEqual(len(copy), 4)
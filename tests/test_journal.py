@@ -0,0 +1,95 @@
+import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm import journal
+from wpm.journal import Journal, commit
+from wpm.stats import Stats
+from wpm.summary import Summary
+
+
+def game(minute):
+    timestamp = datetime.datetime(2018, 4, 1, 9, 0, 0, 1) + \
+            datetime.timedelta(minutes=minute)
+    return (0, 60.0, 0.98, 1, 1, minute % 7, timestamp, "default")
+
+
+def session(filename, first, count):
+    journal = Journal(filename)
+    for minute in range(first, first + count):
+        journal.append("qwerty", game(minute))
+    commit(filename)
+
+
+class JournalTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def races(self):
+        return [game for _, game in Stats.iter_rows(self.filename)]
+
+    def test_append(self):
+        Journal(self.filename).append("qwerty", game(1))
+        self.assertEqual(commit(self.filename), 1)
+
+        Journal(self.filename).append("qwerty", game(2))
+        self.assertEqual(commit(self.filename), 1)
+        self.assertEqual([race[0] for race in self.races()], [1, 2])
+        self.assertEqual(os.listdir(self.directory).count("wpm.csv"), 1)
+
+        summary = Summary.load(self.filename)
+        self.assertIsNotNone(summary)
+        self.assertEqual(len(summary.results("qwerty")), 2)
+
+    def test_pattern_in_filename(self):
+        self.filename = os.path.join(self.directory, "wpm[1].csv")
+        Journal(self.filename).append("qwerty", game(1))
+        Journal(os.path.join(self.directory, "wpm1.csv")).append("qwerty",
+                                                                 game(2))
+        self.assertEqual(len(Journal.committable(self.filename)), 1)
+        self.assertEqual(commit(self.filename), 1)
+
+    def test_interleaved_and_stale(self):
+        Journal(self.filename).append("qwerty", game(5))
+        commit(self.filename)
+
+        # A session that died without committing, with an older race
+        dead = Journal(self.filename, pid=999999999)
+        dead.append("dvorak", game(3))
+        Journal(self.filename).append("qwerty", game(8))
+        self.assertEqual(commit(self.filename), 2)
+
+        self.assertEqual([race[6].minute for race in self.races()], [3, 5, 8])
+        self.assertEqual([race[0] for race in self.races()], [1, 2, 3])
+        self.assertFalse(os.path.exists(dead.filename))
+
+    def test_recommit_skips_duplicates(self):
+        Journal(self.filename).append("qwerty", game(1))
+        Journal(self.filename).append("qwerty", game(2))
+        commit(self.filename)
+
+        Journal(self.filename).append("qwerty", game(2))
+        commit(self.filename)
+        self.assertEqual(len(self.races()), 2)
+
+    @unittest.skipIf(journal.fcntl is None, "no advisory locking")
+    def test_concurrent_sessions(self):
+        processes = [multiprocessing.Process(target=session,
+                                             args=(self.filename, 50*n, 50))
+                     for n in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        races = self.races()
+        self.assertEqual(len(races), 200)
+        self.assertEqual(sorted(race[6] for race in races),
+                         [race[6] for race in races])
@@ -0,0 +1,102 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import wpm.keyanalysis as keyanalysis
+from wpm.keyanalysis import KeyAnalysis, Row, bigram_key, latency_bin
+from wpm.keylog import KeyLog
+from wpm.record import Recorder
+
+MS = 1000000
+
+
+def record(strokes):
+    """Records (milliseconds since previous, key) pairs, keeping track of
+    position and errors like the game does."""
+    text = "the cat"
+    recorder = Recorder()
+    now = 10**12
+    position = incorrect = 0
+    for delay, key in strokes:
+        now += delay*MS
+        recorder.add(now, key, position, incorrect)
+        if key == "KEY_BACKSPACE":
+            incorrect -= 1
+        elif incorrect == 0 and text[position] == key:
+            position += 1
+        else:
+            incorrect += 1
+    return recorder
+
+
+class KeyAnalysisTests(unittest.TestCase):
+    strokes = [(0, "t"), (100, "h"), (200, "x"), (300, "KEY_BACKSPACE"),
+               (150, "e"), (120, " "), (110, "c"), (130, "a"), (9000, "t")]
+    numpy = keyanalysis.numpy
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.keys")
+        self.keylog = KeyLog(self.filename)
+        self.when = datetime.datetime(2018, 5, 6, 7, 8, 9)
+
+    def tearDown(self):
+        keyanalysis.numpy = self.numpy
+        shutil.rmtree(self.directory)
+
+    def analyze(self):
+        self.keylog.append(self.when, 1, None, record(self.strokes))
+        with self.keylog:
+            return keyanalysis.analyze(
+                [self.keylog.read(entry.offset)
+                 for entry in self.keylog.index()])
+
+    def check(self, chars, bigrams):
+        e = chars.rows[ord("e")]
+        self.assertEqual((e.attempts, e.errors, e.count), (2, 1, 0))
+
+        h = chars.rows[ord("h")]
+        self.assertEqual((h.attempts, h.errors, h.count, h.total),
+                         (1, 0, 1, 100*1000))
+
+        # The pause before the last "t" is too long to be timed
+        t = chars.rows[ord("t")]
+        self.assertEqual((t.attempts, t.count), (2, 0))
+
+        self.assertEqual(bigrams.rows[bigram_key(ord(" "), ord("c"))].total,
+                         110*1000)
+        self.assertEqual(bigrams.rows[bigram_key(ord("h"), ord("e"))].errors,
+                         1)
+        self.assertNotIn(ord("x"), chars.rows)
+
+    def test_python(self):
+        keyanalysis.numpy = None
+        self.check(*self.analyze())
+
+    @unittest.skipIf(keyanalysis.numpy is None, "NumPy is not installed")
+    def test_numpy(self):
+        self.check(*self.analyze())
+
+    def test_quantiles(self):
+        row = Row()
+        for millis in range(100, 200):
+            row.add(millis*1000, False)
+        self.assertAlmostEqual(row.quantile(0.5) / 1000.0, 150, delta=6)
+        self.assertAlmostEqual(row.mean, 149500.0)
+        self.assertEqual(latency_bin(0), 0)
+        self.assertEqual(Row.from_list(row.to_list()).bins, row.bins)
+
+    def test_incremental(self):
+        self.keylog.append(self.when, 1, None, record(self.strokes))
+        analysis = KeyAnalysis()
+        self.assertEqual(analysis.update(self.filename), 1)
+        analysis.save(self.filename)
+
+        self.keylog.append(self.when, 2, None, record(self.strokes))
+        analysis = KeyAnalysis.load(self.filename)
+        self.assertEqual(analysis.update(self.filename), 1)
+        self.assertEqual(analysis.update(self.filename), 0)
+        self.assertEqual(analysis.races, 2)
+        self.assertEqual(analysis.chars.rows[ord("h")].count, 2)
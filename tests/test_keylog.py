@@ -0,0 +1,95 @@
+# -*- encoding: utf-8 -*-
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.keylog import KeyLog, from_micros, to_micros
+from wpm.record import Recorder
+
+
+def record(text, start=10**12, step=120000000):
+    recorder = Recorder()
+    for position, key in enumerate(text):
+        recorder.add(start + position*step, key, position, 0)
+    return recorder
+
+
+class KeyLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.keys")
+        self.when = datetime.datetime(2018, 3, 4, 5, 6, 7, 891011)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_micros(self):
+        self.assertEqual(from_micros(to_micros(self.when)), self.when)
+
+    def test_roundtrip(self):
+        keylog = KeyLog(self.filename)
+        keylog.append(self.when, 7, "qwerty", record("hello"))
+        keylog.append(self.when, 8, None, record(u"wørld"))
+
+        self.assertEqual([entry.text_id for entry in keylog.index()], [7, 8])
+        self.assertEqual(keylog.find(8), [keylog.index()[1].offset])
+
+        with keylog:
+            recording = keylog.read(keylog.find(7)[0])
+            self.assertEqual(recording.timestamp, self.when)
+            self.assertEqual(recording.tag, "qwerty")
+            strokes = list(recording)
+            self.assertEqual([key for _, key, _, _ in strokes], list("hello"))
+            self.assertEqual([pos for _, _, pos, _ in strokes], [0, 1, 2, 3, 4])
+            self.assertAlmostEqual(strokes[-1][0], 0.48)
+
+            other = keylog.read(keylog.find(8)[0])
+            self.assertIsNone(other.tag)
+            self.assertEqual(u"".join(key for _, key, _, _ in other), u"wørld")
+
+        # Header, tag and one byte per column for each keystroke, except
+        # the deltas which need four
+        size = os.path.getsize(self.filename)
+        self.assertLess(size, 2*(40 + 6) + 7*10 + 10)
+
+    def test_rebuilds_index(self):
+        keylog = KeyLog(self.filename)
+        for text_id in range(3):
+            keylog.append(self.when, text_id, "tag", record("abc"))
+
+        os.remove(keylog.index_filename)
+        self.assertEqual([entry.text_id for entry in keylog.index()], [0, 1, 2])
+
+        # A partly written entry is cut off
+        with open(self.filename, "ab") as file_obj:
+            file_obj.write(b"WK\x01")
+        keylog.append(self.when, 3, "tag", record("abc"))
+        self.assertEqual([entry.text_id for entry in keylog.index()],
+                         [0, 1, 2, 3])
+        with keylog:
+            self.assertEqual(len(keylog.read(keylog.find(3)[0])), 3)
+
+    def test_skips_corrupt_entries(self):
+        keylog = KeyLog(self.filename)
+        for text_id in range(3):
+            keylog.append(self.when, text_id, "tag", record("abc"))
+        offsets = [entry.offset for entry in keylog.index()]
+        size = os.path.getsize(self.filename)
+
+        # Damage the header of the middle entry
+        with open(self.filename, "r+b") as file_obj:
+            file_obj.seek(offsets[1])
+            file_obj.write(b"XX")
+        os.remove(keylog.index_filename)
+
+        self.assertEqual([entry.text_id for entry in keylog.index()], [0, 2])
+        self.assertEqual(os.path.getsize(self.filename), size)
+
+        keylog.append(self.when, 3, "tag", record("abc"))
+        self.assertEqual([entry.text_id for entry in keylog.index()],
+                         [0, 2, 3])
+        with keylog:
+            self.assertEqual(len(keylog.read(keylog.find(2)[0])), 3)
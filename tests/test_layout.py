@@ -0,0 +1,41 @@
+import unittest
+
+from wpm.layout import Layout, LayoutCache, word_wrap
+
+
+class LayoutTests(unittest.TestCase):
+    def test_word_wrap(self):
+        starts, lengths = word_wrap("the quick brown fox", 10)
+        self.assertEqual(list(starts), [0, 10])
+        self.assertEqual(list(lengths), [9, 9])
+
+        # Words longer than the width are not broken up
+        self.assertEqual(list(word_wrap("abcdefghij kl", 5)[1]), [13])
+        self.assertEqual(list(word_wrap("", 5)[1]), [])
+
+    def test_coordinates(self):
+        text = "the quick brown fox"
+        layout = Layout(text, 10)
+        self.assertEqual(len(layout), 2)
+        self.assertEqual(list(layout.lines(text)), ["the quick", "brown fox"])
+        self.assertEqual(list(layout.lines(text, 1, 5)), ["brown fox"])
+        self.assertEqual(layout[0], (0, 0))
+        self.assertEqual(layout[9], (9, 0))
+        self.assertEqual(layout[10], (0, 1))
+        self.assertEqual(layout[len(text)], (9, 1))
+
+    def test_cache(self):
+        cache = LayoutCache(size=2)
+        first = cache.get(1, "one two", 4)
+        self.assertIs(cache.get(1, "one two", 4), first)
+        self.assertIsNot(cache.get(1, "one two", 5), first)
+
+        # The least recently used layout is dropped
+        cache.get(1, "one two", 4)
+        cache.get(2, "three", 4)
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(1, "one two", 4), first)
+        self.assertEqual(sorted(cache.layouts), [(1, 4), (2, 4)])
+
+        # A different text with the same ID is laid out anew
+        self.assertEqual(len(cache.get(1, "one two three", 4)), 3)
@@ -0,0 +1,111 @@
+import csv
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.error import WpmError
+from wpm.merge import merge_files
+from wpm.stats import Stats
+from wpm.summary import Summary
+
+
+class MergeTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        start = datetime.datetime(2018, 3, 1, 12, 0, 0, 1)
+        self.rows = []
+        for n in range(30):
+            timestamp = start + datetime.timedelta(minutes=n)
+            self.rows.append([n + 1, 60.0 + n, 0.97, 1, 1, n % 4, timestamp,
+                              "default", "qwerty" if n % 2 else "dvorak"])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, rows, header=False):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "wt") as file_obj:
+            writer = csv.writer(file_obj)
+            if header:
+                writer.writerow(["Race #", "WPM", "Accuracy", "Rank",
+                                 "# Racers", "Text ID", "Date/Time (UTC)"])
+            writer.writerows(rows)
+        return filename
+
+    def test_merge_with_duplicates(self):
+        first = self.write("a.csv", self.rows[:20])
+        second = self.write("b.csv", self.rows[10:])
+        output = os.path.join(self.directory, "out.csv")
+
+        self.assertEqual(merge_files([first, second], output), 30)
+
+        races = list(Stats.iter_rows(output))
+        self.assertEqual([game[0] for _, game in races], list(range(1, 31)))
+        self.assertEqual([game[1] for _, game in races],
+                         [row[1] for row in self.rows])
+
+        summary = Stats.load_summary(output)
+        self.assertEqual(len(summary.results("qwerty")), 15)
+
+    def summarized(self, name, rows):
+        filename = self.write(name, rows)
+        Summary.build(Stats.iter_rows(filename)).save(filename)
+        return filename
+
+    def assertSameSummary(self, first, second):
+        self.assertEqual(sorted(first.keys()), sorted(second.keys()))
+        for tag in first.keys():
+            mine, theirs = first.tags[tag], second.tags[tag]
+            self.assertEqual(mine.wpm.to_list(), theirs.wpm.to_list())
+            self.assertEqual(list(mine.tail), list(theirs.tail))
+            self.assertEqual(len(mine.digest), len(theirs.digest))
+            self.assertEqual(sorted(mine.texts), sorted(theirs.texts))
+            for text_id, text in mine.texts.items():
+                self.assertEqual(text.last, theirs.texts[text_id].last)
+                self.assertEqual(text.histogram.counts,
+                                 theirs.texts[text_id].histogram.counts)
+
+    def test_merge_summaries(self):
+        first = self.summarized("a.csv", self.rows[::3])
+        second = self.summarized("b.csv", self.rows[1::3])
+        stale = self.summarized("c.csv", self.rows[2::3][:5])
+        self.write("c.csv", self.rows[2::3])
+        self.assertIsNone(Summary.load(stale))
+        output = os.path.join(self.directory, "out.csv")
+
+        self.assertEqual(merge_files([first, second, stale], output), 30)
+        summary = Summary.load(output)
+        self.assertIsNotNone(summary)
+        self.assertSameSummary(summary,
+                               Summary.build(Stats.iter_rows(output)))
+
+    def test_merge_overlapping_summaries(self):
+        first = self.summarized("a.csv", self.rows[:20])
+        second = self.summarized("b.csv", self.rows[10:])
+        output = os.path.join(self.directory, "out.csv")
+
+        self.assertEqual(merge_files([first, second], output), 30)
+        summary = Summary.load(output)
+        self.assertEqual(len(summary.results("qwerty")), 15)
+        self.assertSameSummary(summary,
+                               Summary.build(Stats.iter_rows(output)))
+
+    def test_merge_newest_first_with_header(self):
+        first = self.write("a.csv", self.rows[::2])
+        second = self.write("b.csv", list(reversed(self.rows[1::2])),
+                            header=True)
+        output = os.path.join(self.directory, "out.csv")
+
+        self.assertEqual(merge_files([first, second], output), 30)
+        timestamps = [game[6] for _, game in Stats.iter_rows(output)]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_unsorted(self):
+        rows = self.rows[:5] + [self.rows[0]] + self.rows[5:]
+        filename = self.write("a.csv", rows)
+        output = os.path.join(self.directory, "out.csv")
+
+        with self.assertRaises(WpmError):
+            merge_files([filename], output)
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.mistakes import MistakeLog, Mistakes
+
+
+class MistakesTests(unittest.TestCase):
+    def test_runs(self):
+        mistakes = Mistakes(10)
+        for _ in range(10):
+            mistakes.add([2, 3, 7], [3])
+        mistakes.add([3, 4, 9, 99], [])
+
+        self.assertEqual(mistakes.races, 11)
+        self.assertEqual(mistakes.errors, {2: 10, 3: 11, 4: 1, 7: 10, 9: 1})
+        self.assertEqual(mistakes.runs(),
+                         [(2, 2, 3), (4, 1, 1), (7, 1, 3), (9, 1, 1)])
+
+    def test_bytes(self):
+        mistakes = Mistakes(5)
+        mistakes.add([0, 4], [4, 4])
+        data = mistakes.to_bytes()
+        copy = Mistakes.from_bytes(data)
+        self.assertEqual((copy.races, copy.length), (1, 5))
+        self.assertEqual(copy.errors, {0: 1, 4: 1})
+        self.assertEqual(copy.corrections, {4: 2})
+
+        # Only the mistyped offsets are stored
+        self.assertEqual(len(Mistakes(10**6, 1, {7: 1}).to_bytes()),
+                         len(data) - 16)
+        self.assertIsNone(Mistakes.from_bytes(data[:-1]))
+
+
+class MistakeLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.mistakes")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_log(self):
+        log = MistakeLog(self.filename)
+        self.assertIsNone(log.get("qwerty", 1))
+
+        log.add("qwerty", 1, 10, [1], [1])
+        log.add("qwerty", 1, 10, [1, 2], [])
+        log.add(None, 1, 10, [5], [])
+
+        mistakes = log.get("qwerty", 1)
+        self.assertEqual(mistakes.races, 2)
+        self.assertEqual(mistakes.errors, {1: 2, 2: 1})
+        self.assertEqual(mistakes.corrections, {1: 1})
+        self.assertEqual(log.get(None, 1).errors, {5: 1})
+
+        # Counts for an older version of a quote are dropped
+        self.assertIsNone(log.get("qwerty", 1, length=12))
+        log.add("qwerty", 1, 12, [11], [])
+        self.assertEqual(log.get("qwerty", 1).races, 1)
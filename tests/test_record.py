@@ -0,0 +1,64 @@
+# -*- encoding: utf-8 -*-
+
+import unittest
+
+from wpm.record import (Playback, Recorder, UNKNOWN_KEY, clock_ns, decode_key,
+                        encode_key)
+
+
+class RecorderTests(unittest.TestCase):
+    def test_keys(self):
+        for key in ("a", " ", "\n", u"æ", "KEY_BACKSPACE", "KEY_RESIZE"):
+            self.assertEqual(decode_key(encode_key(key)), key)
+        self.assertEqual(encode_key("KEY_UNHEARD_OF"), UNKNOWN_KEY)
+        self.assertIsNone(decode_key(UNKNOWN_KEY))
+
+    def test_record(self):
+        recorder = Recorder(capacity=2)
+        start = 10**12
+        for n, key in enumerate("hello"):
+            recorder.add(start + n*150000000, key, n, 0)
+
+        self.assertEqual(len(recorder), 5)
+        self.assertGreaterEqual(len(recorder.timestamps), 5)
+        elapsed, key, position, incorrect = recorder[4]
+        self.assertAlmostEqual(elapsed, 0.6)
+        self.assertEqual((key, position, incorrect), ("o", 4, 0))
+        self.assertEqual(recorder[-1], recorder[4])
+        with self.assertRaises(IndexError):
+            recorder[5]
+
+        recorder.reset()
+        self.assertEqual(len(recorder), 0)
+        recorder.add(start, "x", 0, 1)
+        self.assertEqual(recorder[0], (0.0, "x", 0, 1))
+
+    def test_playback(self):
+        recorder = Recorder()
+        recorder.add(clock_ns(), "a", 0, 0)
+        recorder.add(clock_ns(), "b", 1, 0)
+        playback = Playback(recorder)
+        self.assertEqual(playback.next()[1], "a")
+        self.assertEqual(playback.next()[1], "b")
+        self.assertEqual(playback.next()[1], "a")
+
+    def test_clock(self):
+        first = clock_ns()
+        self.assertLessEqual(first, clock_ns())
+
+    def test_playback_offsets(self):
+        recorder = Recorder()
+        second = 10**9
+        strokes = [(0, "h", 0, 0), (1, "x", 1, 0), (2, "KEY_BACKSPACE", 1, 1),
+                   (3, "e", 1, 0), (5, "y", 2, 0)]
+        for elapsed, key, position, incorrect in strokes:
+            recorder.add(elapsed*second, key, position, incorrect)
+
+        playback = Playback(recorder, length=3)
+        self.assertEqual(list(playback.offsets), [1, 2, 3])
+        self.assertEqual(playback.offset(-1.0), 0)
+        self.assertEqual(playback.offset(0.0), 1)
+        self.assertEqual(playback.offset(2.9), 1)
+        self.assertEqual(playback.offset(3.0), 2)
+        self.assertEqual(playback.offset(60.0), 3)
+        self.assertEqual(playback.duration, 5.0)
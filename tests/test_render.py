@@ -0,0 +1,82 @@
+import unittest
+
+from wpm.render import Renderer, changed_span
+
+
+class FakeScreen(object):
+    """Records the drawing calls the renderer makes."""
+    def __init__(self, quote):
+        self.quote = quote
+        self.quote_coords = [(offset, 0) for offset in range(len(quote) + 1)]
+        self.quote_columns = 80
+        self.cheight = 5
+        self.encoding = "utf-8"
+        self.quote_top = 0
+        self.scrolled = False
+        self.refreshes = 0
+        self.calls = []
+
+    def scroll_to(self, offset):
+        scrolled, self.scrolled = self.scrolled, False
+        return scrolled
+
+    def refresh(self):
+        self.refreshes += 1
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name,) + args)
+        return record
+
+
+class RenderTests(unittest.TestCase):
+    def test_changed_span(self):
+        self.assertIsNone(changed_span("abc", "abc"))
+        self.assertEqual(changed_span("abc", "abd"), (2, 3))
+        self.assertEqual(changed_span("abc", "ab"), (2, 3))
+        self.assertEqual(changed_span("1.0 wpm 2.0s", "1.5 wpm 2.1s"), (2, 11))
+
+    def test_only_changes_are_drawn(self):
+        screen = FakeScreen("hello world")
+        renderer = Renderer(screen)
+
+        renderer.show_race("10 wpm", 1, 0, "h")
+        names = [call[0] for call in screen.calls]
+        self.assertEqual(names, ["update_header", "show_progress",
+                                 "clear_prompt", "addstr", "set_cursor"])
+        self.assertEqual(screen.calls[1][1:], (0, 1, 1, 0))
+
+        del screen.calls[:]
+        renderer.show_race("10 wpm", 1, 0, "h")
+        self.assertEqual([call[0] for call in screen.calls], ["set_cursor"])
+
+        del screen.calls[:]
+        renderer.show_race("12 wpm", 3, 1, "helx")
+        self.assertEqual(screen.calls[0], ("addstr", 1, 0, "2", 8))
+        self.assertEqual(screen.calls[1], ("show_progress", 1, 4, 3, 1))
+        self.assertEqual(screen.calls[2][1:4], (3, 5, b"elx"))
+
+        # Erasing clears the tail of the prompt
+        del screen.calls[:]
+        renderer.show_race("12 wpm", 3, 0, "hel")
+        self.assertEqual(screen.calls[0], ("show_progress", 3, 4, 3, 0))
+        self.assertEqual(screen.calls[1][1:4], (5, 5, b" "))
+
+        renderer.refresh()
+        renderer.refresh()
+        self.assertEqual(screen.refreshes, 1)
+
+    def test_scrolling(self):
+        screen = FakeScreen("hello world")
+        renderer = Renderer(screen)
+        renderer.show_race("10 wpm", 7, 0, "w")
+        renderer.refresh()
+
+        # Lines scrolled into view are drawn and colored from scratch
+        del screen.calls[:]
+        screen.scrolled = True
+        screen.quote_top = 1
+        renderer.show_race("10 wpm", 8, 0, "wo")
+        self.assertEqual(screen.calls[0][0], "update_quote")
+        self.assertEqual(screen.calls[1], ("show_progress", 0, 8, 8, 0))
+        self.assertEqual(screen.calls[-1], ("set_cursor", 8, 1))
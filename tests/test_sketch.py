@@ -0,0 +1,60 @@
+import random
+import unittest
+
+from wpm.sketch import TDigest
+
+
+class TDigestTests(unittest.TestCase):
+    def test_exact_when_small(self):
+        digest = TDigest()
+        for value in range(10, 0, -1):
+            digest.add(float(value))
+        self.assertEqual(digest.quantile(0.5), 5.5)
+        self.assertEqual(digest.quantile(0.0), 1.0)
+        self.assertEqual(digest.quantile(1.0), 10.0)
+        self.assertAlmostEqual(digest.rank(5.0), 0.45)
+        self.assertEqual(digest.rank(0.0), 0.0)
+        self.assertEqual(digest.rank(11.0), 1.0)
+
+    def test_accuracy(self):
+        generator = random.Random(1)
+        values = [generator.gauss(80, 12) for _ in range(20000)]
+        digest = TDigest()
+        for value in values:
+            digest.add(value)
+        values.sort()
+
+        self.assertLessEqual(len(digest.means), digest.compression)
+        for fraction in (0.01, 0.1, 0.5, 0.9, 0.99):
+            exact = values[int(fraction*len(values))]
+            self.assertAlmostEqual(digest.quantile(fraction), exact, delta=0.5)
+            self.assertAlmostEqual(digest.rank(exact), fraction, delta=0.005)
+
+    def test_merge(self):
+        generator = random.Random(2)
+        whole = TDigest()
+        parts = [TDigest(), TDigest()]
+        for n in range(5000):
+            value = generator.uniform(20, 120)
+            whole.add(value)
+            parts[n % 2].add(value)
+        parts[0].merge(parts[1])
+
+        self.assertEqual(len(parts[0]), len(whole))
+        self.assertEqual(parts[0].low, whole.low)
+        for fraction in (0.1, 0.5, 0.9):
+            self.assertAlmostEqual(parts[0].quantile(fraction),
+                                   whole.quantile(fraction), delta=1.0)
+
+    def test_serialization(self):
+        digest = TDigest()
+        for value in range(1000):
+            digest.add(value / 10.0)
+        copy = TDigest.from_list(digest.to_list())
+        self.assertEqual(len(copy), len(digest))
+        self.assertAlmostEqual(copy.quantile(0.9), digest.quantile(0.9),
+                               places=1)
+
+    def test_empty(self):
+        self.assertEqual(TDigest().quantile(0.5), 0.0)
+        self.assertEqual(TDigest().rank(1.0), 0.0)
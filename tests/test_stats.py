@@ -0,0 +1,78 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.stats import Rollup, Stats, Timestamp
+
+
+class TimestampTests(unittest.TestCase):
+    def test_round_trip(self):
+        timestamp = datetime.datetime(2018, 5, 17, 8, 1, 2, 345)
+        self.assertEqual(Timestamp.from_string(Timestamp.to_string(timestamp)),
+                         timestamp)
+
+    def test_without_microseconds(self):
+        timestamp = datetime.datetime(2018, 5, 17, 8, 1, 2)
+        self.assertEqual(Timestamp.from_string(str(timestamp)), timestamp)
+
+
+class CompactTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.csv")
+
+        self.stats = Stats("qwerty")
+        start = datetime.datetime(2018, 1, 1, 8, 0, 0, 1)
+        for n in range(200):
+            timestamp = start + datetime.timedelta(hours=5*n)
+            self.stats.games["qwerty"].append(
+                (0, 40.0 + n % 13, 0.95 + (n % 5) / 100.0, 1, 1, n % 3,
+                 timestamp, "default"))
+        self.stats = Stats("qwerty", self.stats.games)
+        self.cutoff = start + datetime.timedelta(days=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameResults(self, expected, actual):
+        self.assertEqual(len(actual), len(expected))
+        for a, b in zip(actual.averages() + actual.stddevs() + actual.extremals(),
+                        expected.averages() + expected.stddevs() + expected.extremals()):
+            self.assertAlmostEqual(a, b)
+
+    def test_compact_keeps_aggregates_exact(self):
+        before = self.stats.results("qwerty")
+        before_text = self.stats.text_id_results("qwerty", 1)
+        before_last = self.stats.results("qwerty", last_n=10)
+
+        folded = self.stats.compact(self.cutoff, keep_last=50)
+        self.assertEqual(folded, 144)
+        self.assertEqual(len(self.stats.games["qwerty"]), 56)
+
+        self.stats.save(self.filename)
+        stats = Stats.load(self.filename)
+
+        self.assertTrue(all(isinstance(rollup, Rollup)
+                            for rollup in stats.rollups["qwerty"]))
+        self.assertSameResults(before, stats.results("qwerty"))
+        self.assertSameResults(before_text, stats.text_id_results("qwerty", 1))
+        self.assertSameResults(before_last, stats.results("qwerty", last_n=10))
+
+        summary = Stats.load_summary(self.filename)
+        self.assertSameResults(before, summary.results("qwerty"))
+
+    def test_race_numbers_are_kept(self):
+        self.stats.save(self.filename)
+        last = list(Stats.iter_rows(self.filename))[-1][1]
+
+        self.stats.compact(self.cutoff, keep_last=50)
+        self.stats.save(self.filename)
+        self.assertEqual(list(Stats.iter_rows(self.filename))[-1][1], last)
+
+    def test_compact_twice(self):
+        self.stats.compact(self.cutoff, keep_last=50)
+        rollups = len(self.stats.rollups["qwerty"])
+        self.stats.compact(self.cutoff, keep_last=50)
+        self.assertEqual(len(self.stats.rollups["qwerty"]), rollups)
@@ -0,0 +1,113 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.stats import Stats
+from wpm.summary import Aggregate, Summary, TAIL
+
+
+def make_stats(count):
+    stats = Stats("qwerty")
+    start = datetime.datetime(2018, 1, 1, 12, 0, 0, 1)
+    for n in range(count):
+        tag = "qwerty" if n % 3 else "dvorak"
+        timestamp = start + datetime.timedelta(minutes=n)
+        stats.games[tag].append((0, 50.0 + n % 17, 0.9 + (n % 7) / 100.0,
+                                 1, 1, n % 5, timestamp, "default"))
+    return Stats(stats.tag, stats.games)
+
+
+class AggregateTests(unittest.TestCase):
+    def test_merge(self):
+        values = [10.0, 20.5, 3.25, 99.0, 42.0]
+        whole = Aggregate()
+        left = Aggregate()
+        right = Aggregate()
+        for n, value in enumerate(values):
+            whole.add(value)
+            (left if n < 2 else right).add(value)
+        left.merge(right)
+
+        self.assertEqual(left.count, whole.count)
+        self.assertAlmostEqual(left.mean, whole.mean)
+        self.assertAlmostEqual(left.stddev, whole.stddev)
+        self.assertEqual((left.low, left.high), (3.25, 99.0))
+
+    def test_empty(self):
+        self.assertEqual(Aggregate().mean, 0)
+        self.assertEqual(Aggregate().stddev, 0.0)
+
+
+class SummaryTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameResults(self, stats, summary, last_n):
+        for tag in stats.keys():
+            expected = stats.results(tag, last_n=last_n)
+            actual = summary.results(tag, last_n=last_n)
+            self.assertEqual(len(actual), len(expected))
+            for a, b in zip(actual.averages(), expected.averages()):
+                self.assertAlmostEqual(a, b)
+            for a, b in zip(actual.stddevs(), expected.stddevs()):
+                self.assertAlmostEqual(a, b)
+
+    def test_matches_stats(self):
+        stats = make_stats(2*TAIL + 10)
+        stats.save(self.filename)
+        summary = Stats.load_summary(self.filename)
+
+        for last_n in (0, 10, 50, 100, 500, 1000):
+            self.assertSameResults(stats, summary, last_n)
+
+    def test_sidecar_validation(self):
+        stats = make_stats(20)
+        stats.save(self.filename)
+        self.assertIsNotNone(Summary.load(self.filename))
+
+        with open(self.filename, "at") as file_obj:
+            file_obj.write("21,60.0,1.0,1,1,3,2018-02-01 10:00:00.000001,default,qwerty\n")
+        self.assertIsNone(Summary.load(self.filename))
+
+        summary = Stats.load_summary(self.filename)
+        self.assertEqual(len(summary.results("qwerty")), 14)
+        self.assertIsNotNone(Summary.load(self.filename))
+
+    def test_incremental_add(self):
+        stats = make_stats(20)
+        stats.save(self.filename)
+
+        stats = Stats.load(self.filename)
+        stats.add(70.0, 0.95, 3, "default")
+        stats.save(self.filename)
+
+        summary = Summary.load(self.filename)
+        self.assertIsNotNone(summary)
+        self.assertSameResults(Stats.load(self.filename), summary, 0)
+        self.assertSameResults(Stats.load(self.filename), summary, 10)
+
+    def test_text_sketches(self):
+        stats = make_stats(200)
+        stats.save(self.filename)
+        summary = Summary.load(self.filename)
+
+        for tag in ("qwerty", "dvorak"):
+            for text_id in range(5):
+                wpms = sorted(game[1] for game in stats.games[tag]
+                              if game[5] == text_id)
+                text = summary.text(tag, text_id)
+                self.assertEqual(len(text.digest), len(wpms))
+                self.assertEqual(text.last, [game[1] for game in
+                                             stats.games[tag]
+                                             if game[5] == text_id][-1])
+                self.assertAlmostEqual(text.digest.quantile(0.0), wpms[0])
+                self.assertAlmostEqual(text.digest.quantile(1.0), wpms[-1])
+
+        self.assertIsNone(summary.text("qwerty", 99))
+        self.assertEqual(len(summary.digest("qwerty")), 133)
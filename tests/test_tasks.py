@@ -0,0 +1,34 @@
+import sys
+import unittest
+
+if sys.version_info[0:2] >= (3, 5):
+    import asyncio
+    from wpm.tasks import RESIZE_DELAY, TaskGameManager
+else:
+    asyncio = None
+
+
+@unittest.skipIf(asyncio is None, "Needs asyncio tasks")
+class TaskGameManagerTests(unittest.TestCase):
+    def test_resize_debounce(self):
+        # Only the resize handling is needed, not a screen
+        manager = TaskGameManager.__new__(TaskGameManager)
+        manager.resize_handle = None
+        redraws = []
+
+        def resized():
+            manager.resize_handle = None
+            redraws.append(True)
+        manager.resized = resized
+
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(4):
+                manager.schedule_resize(loop)
+                loop.run_until_complete(asyncio.sleep(RESIZE_DELAY / 4))
+            self.assertEqual(redraws, [])
+
+            loop.run_until_complete(asyncio.sleep(RESIZE_DELAY*2))
+            self.assertEqual(redraws, [True])
+        finally:
+            loop.close()
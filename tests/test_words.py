@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wpm.record import Recorder
+from wpm.words import Word, WordIndex, WordStats, segment
+
+
+def record(text, keys, step=100000000):
+    """Types the keys into a recorder the way GameManager tracks position."""
+    recorder = Recorder()
+    position = incorrect = 0
+    for n, key in enumerate(keys):
+        recorder.add(n*step, key, position, incorrect)
+        if key == "KEY_BACKSPACE":
+            if incorrect:
+                incorrect -= 1
+            else:
+                position -= 1
+        elif not incorrect and text[position] == key:
+            position += 1
+        else:
+            incorrect += 1
+    return recorder
+
+
+class SegmentTests(unittest.TestCase):
+    def test_speeds(self):
+        text = "ab cde, fg"
+        words = segment(text, record(text, text))
+        self.assertEqual([word.word for word in words], ["ab", "cde", "fg"])
+        self.assertEqual([word.errors for word in words], [0, 0, 0])
+
+        # Ten keystrokes a second is 120 wpm for every word
+        for word in words:
+            self.assertAlmostEqual(word.wpm, 120.0)
+
+    def test_errors(self):
+        text = "ab cd"
+        keys = ["a", "b", " ", "x", "y", "KEY_BACKSPACE", "KEY_BACKSPACE",
+                "c", "d"]
+        words = segment(text, record(text, keys))
+        self.assertEqual([word.errors for word in words], [0, 2])
+        self.assertAlmostEqual(words[0].wpm, 120.0)
+        self.assertAlmostEqual(words[1].wpm, 12.0*2/0.6)
+
+    def test_separator_errors(self):
+        text = "ab cd"
+        keys = ["a", "b", "x", "KEY_BACKSPACE", " ", "c", "d"]
+        words = segment(text, record(text, keys))
+        self.assertEqual([word.errors for word in words], [1, 0])
+
+    def test_errors_into_next_word(self):
+        text = "ab cd"
+        keys = ["a", "x", "y", "z", "w", "KEY_BACKSPACE", "KEY_BACKSPACE",
+                "KEY_BACKSPACE", "KEY_BACKSPACE", "b", " ", "c", "d"]
+        words = segment(text, record(text, keys))
+        self.assertEqual([word.errors for word in words], [2, 2])
+
+    def test_empty(self):
+        self.assertEqual(segment("abc", Recorder()), [])
+
+
+class WordStatsTests(unittest.TestCase):
+    def test_error_rate(self):
+        stats = WordStats()
+        stats.add(Word("a", None, 1))
+        stats.add(Word("a", 60.0, 0))
+        self.assertEqual(stats.wpm.count, 1)
+        self.assertEqual(stats.typed, 2)
+        self.assertAlmostEqual(stats.error_rate, 0.5)
+
+        copy = WordStats.from_list(stats.to_list())
+        self.assertEqual((copy.errors, copy.typed), (1, 2))
+        self.assertEqual(WordStats.from_list(stats.to_list()[:6]).typed, 1)
+
+
+class WordIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "wpm.words")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_index(self):
+        index = WordIndex(self.filename)
+        self.assertIsNone(index.get("qwerty", "the"))
+        self.assertIsNone(index.drill("qwerty"))
+
+        slow = "the quick brown fox"
+        fast = "a lazy dog"
+        for _ in range(3):
+            index.add("qwerty", segment(slow, record(slow, slow, 200000000)))
+            index.add("qwerty", segment(fast, record(fast, fast)))
+        index.add("dvorak", segment(fast, record(fast, fast)))
+
+        the = index.get("qwerty", "The")
+        self.assertEqual(the.wpm.count, 3)
+        self.assertEqual(index.get("dvorak", "lazy").wpm.count, 1)
+
+        slowest = [word for word, _ in index.slowest("qwerty", count=3)]
+        self.assertEqual(slowest, ["brown", "fox", "quick"])
+
+        drill = index.drill("qwerty", count=3, repeat=2).split(" ")
+        self.assertEqual(sorted(drill), ["brown", "brown", "fox", "fox",
+                                         "quick", "quick"])
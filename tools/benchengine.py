@@ -0,0 +1,24 @@
+"""
+Benchmark of the typing engine, replaying scripted keystrokes headlessly.
+
+Run with ``make bench-engine``.
+"""
+
+import itertools
+import timeit
+
+from wpm.engine import Engine, keystrokes, run
+
+text = u" ".join([u"The quick brown fox jumps over the lazy dog."]*20)
+keys = keystrokes(text, cps=8.0, typos=range(7, len(text), 50))
+
+for name, duration in (("quote", None), ("timed", 3600)):
+    engine = Engine(text, duration=duration)
+
+    def replay():
+        engine.reset()
+        run(engine, keys, itertools.repeat(text))
+
+    number = 100
+    seconds = min(timeit.repeat(replay, number=number, repeat=5))
+    print("%-8s %10.0f keys/s" % (name, number * len(keys) / seconds))
@@ -0,0 +1,17 @@
+"""
+Micro-benchmark of the normal quantile used for confidence intervals.
+
+Run with ``make bench-gauss``.
+"""
+
+import timeit
+
+setup = "from wpm.gauss import phi_inv, z_score, confidence_interval"
+
+for statement in ("phi_inv(0.975)",
+                  "phi_inv(0.9995)",
+                  "z_score(0.05)",
+                  "confidence_interval(80.0, 10.0, 50, 0.05)"):
+    number = 200000
+    seconds = min(timeit.repeat(statement, setup, number=number, repeat=5))
+    print("%-45s %8.3f us/call" % (statement, 1e6 * seconds / number))
@@ -0,0 +1,278 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Time series analytics over the score history.
+
+Races are read in one streaming pass into compact per-tag columns, which are
+then bucketed by day, week or month. Bucketing is vectorized with NumPy if it
+is installed, and done in pure Python otherwise.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import array
+import datetime
+import math
+
+from wpm.summary import Aggregate, tag_name
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PERIODS = ("day", "week", "month")
+
+
+def month_key(date):
+    """Returns a running month number for the given date."""
+    return date.year*12 + date.month - 1
+
+
+def bucket_key(day, month, period):
+    """Returns the bucket key for an ordinal day and running month number."""
+    if period == "month":
+        return month
+    if period == "week":
+        # Ordinal day 1 is a Monday, so weeks start on Mondays
+        return day - (day - 1) % 7
+    return day
+
+
+def bucket_start(key, period):
+    """Converts a bucket key back to the date the bucket starts on."""
+    if period == "month":
+        return datetime.date(key // 12, key % 12 + 1, 1)
+    return datetime.date.fromordinal(key)
+
+
+class Series(object):
+    """Race history of a single tag, stored column-wise.
+
+    Compacted races are kept as a list of rollups on the side. The trend
+    fits are accumulated as the races are added.
+    """
+    def __init__(self):
+        self.days = array.array("d")
+        self.months = array.array("l")
+        self.wpm = array.array("d")
+        self.accuracy = array.array("d")
+        self.rollups = []
+        self.races = 0
+
+        # WPM per day over wall-clock time, and WPM against the logarithm of
+        # the number of races typed (a classic learning curve).
+        self.linear = LinearFit()
+        self.loglinear = LinearFit()
+
+    def __len__(self):
+        return self.races
+
+    def add(self, timestamp, wpm, accuracy):
+        """Appends a race."""
+        seconds = (timestamp.hour*3600 + timestamp.minute*60 +
+                   timestamp.second + timestamp.microsecond*1e-6)
+        day = timestamp.toordinal() + seconds / 86400.0
+        self.days.append(day)
+        self.months.append(month_key(timestamp))
+        self.wpm.append(wpm)
+        self.accuracy.append(accuracy)
+
+        self.races += 1
+        self.linear.add(day, wpm)
+        self.loglinear.add(math.log(self.races), wpm)
+
+    def add_rollup(self, rollup):
+        """Appends a rollup of compacted races."""
+        day = rollup.timestamp.toordinal()
+        self.rollups.append((day, month_key(rollup.timestamp),
+                             rollup.wpm, rollup.accuracy))
+
+        # The races of a rollup are placed at noon with the average WPM
+        self.linear.add(day + 0.5, rollup.wpm.total, rollup.count)
+        for _ in range(rollup.count):
+            self.races += 1
+            self.loglinear.add(math.log(self.races), rollup.wpm.mean)
+
+    def keys(self, period):
+        """Returns the bucket key of each race for the given period."""
+        return array.array("l", (bucket_key(int(day), month, period)
+                                 for day, month in zip(self.days, self.months)))
+
+    def buckets(self, period):
+        """Returns a list of (start date, wpm, accuracy) aggregates."""
+        if period not in PERIODS:
+            raise ValueError("Unknown period: %s" % period)
+
+        buckets = []
+        if self.wpm and numpy is not None:
+            buckets = self._buckets_numpy(period)
+        elif self.wpm:
+            buckets = self._buckets_python(period)
+
+        if not self.rollups:
+            return buckets
+
+        merged = dict((start, (wpm, accuracy))
+                      for start, wpm, accuracy in buckets)
+        for day, month, wpm, accuracy in self.rollups:
+            start = bucket_start(bucket_key(day, month, period), period)
+            if start not in merged:
+                merged[start] = (Aggregate(), Aggregate())
+            merged[start][0].merge(wpm)
+            merged[start][1].merge(accuracy)
+
+        return [(start, wpm, accuracy)
+                for start, (wpm, accuracy) in sorted(merged.items())]
+
+    def _buckets_python(self, period):
+        buckets = {}
+        for key, wpm, accuracy in zip(self.keys(period), self.wpm,
+                                      self.accuracy):
+            if key not in buckets:
+                buckets[key] = (Aggregate(), Aggregate())
+            buckets[key][0].add(wpm)
+            buckets[key][1].add(accuracy)
+
+        return [(bucket_start(key, period), wpm, accuracy)
+                for key, (wpm, accuracy) in sorted(buckets.items())]
+
+    def _buckets_numpy(self, period):
+        if period == "month":
+            keys = numpy.frombuffer(self.months, dtype="l")
+        else:
+            keys = numpy.floor(numpy.frombuffer(self.days)).astype("l")
+            if period == "week":
+                keys -= (keys - 1) % 7
+
+        order = numpy.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+
+        def aggregates(values):
+            values = numpy.frombuffer(values)[order]
+            counts = numpy.diff(numpy.r_[starts, len(values)])
+            return zip(counts,
+                       numpy.add.reduceat(values, starts),
+                       numpy.add.reduceat(values*values, starts),
+                       numpy.minimum.reduceat(values, starts),
+                       numpy.maximum.reduceat(values, starts))
+
+        def aggregate(count, total, squares, low, high):
+            return Aggregate(int(count), float(total), float(squares),
+                             float(low), float(high))
+
+        out = []
+        for key, wpm, accuracy in zip(keys[starts], aggregates(self.wpm),
+                                      aggregates(self.accuracy)):
+            out.append((bucket_start(int(key), period),
+                        aggregate(*wpm),
+                        aggregate(*accuracy)))
+        return out
+
+
+class LinearFit(object):
+    """Least squares fit of y = intercept + slope*x from running sums."""
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+
+    def add(self, x, y, count=1):
+        """Adds ``count`` points at x whose y values sum to y."""
+        self.count += count
+        self.sum_x += count*x
+        self.sum_y += y
+        self.sum_xx += count*x*x
+        self.sum_xy += x*y
+
+    @property
+    def slope(self):
+        """Returns the slope, or zero if there are too few distinct points."""
+        denominator = self.count*self.sum_xx - self.sum_x*self.sum_x
+        if self.count < 2 or denominator <= 0:
+            return 0.0
+        return (self.count*self.sum_xy - self.sum_x*self.sum_y) / denominator
+
+    @property
+    def intercept(self):
+        """Returns the intercept."""
+        if not self.count:
+            return 0.0
+        return (self.sum_y - self.slope*self.sum_x) / self.count
+
+
+def moving_average(values, window):
+    """Returns the simple moving average over at most ``window`` values."""
+    out = []
+    total = 0.0
+    for index, value in enumerate(values):
+        total += value
+        if index >= window:
+            total -= values[index - window]
+        out.append(total / min(index + 1, window))
+    return out
+
+
+def ewma(values, span):
+    """Returns the exponentially weighted moving average with given span."""
+    alpha = 2.0 / (span + 1.0)
+    out = []
+    mean = None
+    for value in values:
+        mean = value if mean is None else alpha*value + (1.0 - alpha)*mean
+        out.append(mean)
+    return out
+
+
+class Trend(object):
+    """Bucketed progress and improvement trend for a single tag."""
+    def __init__(self, series, period, window=4, span=4):
+        self.period = period
+        self.count = len(series)
+        self.buckets = series.buckets(period)
+
+        means = [wpm.mean for _, wpm, _ in self.buckets]
+        self.moving_averages = moving_average(means, window)
+        self.ewmas = ewma(means, span)
+        self.linear = series.linear
+        self.loglinear = series.loglinear
+
+    @property
+    def wpm_per_week(self):
+        """Returns the linear improvement in WPM per week."""
+        return 7.0*self.linear.slope
+
+    @property
+    def wpm_per_doubling(self):
+        """Returns the log-linear improvement in WPM per doubling of races."""
+        return math.log(2.0)*self.loglinear.slope
+
+
+def load_series(rows):
+    """Collects (tag, game) rows into per-tag ``Series`` in a single pass."""
+    series = {}
+    for tag, game in rows:
+        tag = tag_name(tag)
+        if tag not in series:
+            series[tag] = Series()
+        if isinstance(game, tuple):
+            series[tag].add(game[6], game[1], game[2])
+        else:
+            series[tag].add_rollup(game)
+    return series
+
+
+def trends(rows, period="week", window=4, span=4):
+    """Returns a dict of tag to ``Trend`` for the given rows."""
+    return dict((tag, Trend(series, period, window, span))
+                for tag, series in load_series(rows).items())
@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Runs disk writes in order, so that they can be moved off the input path.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import collections
+
+
+class Background(object):
+    """Queue of jobs that are run one at a time, oldest first.
+
+    Jobs are run as soon as they are submitted. ``wpm.tasks.BackgroundTask``
+    runs them on a worker thread instead.
+    """
+    def __init__(self):
+        self.jobs = collections.deque()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def submit(self, job, done=None):
+        """Queues ``job()``, and ``done()`` to be called after it."""
+        self.jobs.append((job, done))
+        self.wakeup()
+
+    def wakeup(self):
+        """Starts on the jobs that have been queued."""
+        self.flush()
+
+    def flush(self):
+        """Runs the queued jobs in this thread."""
+        while self.jobs:
+            job, done = self.jobs.popleft()
+            job()
+            if done is not None:
+                done()
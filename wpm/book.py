@@ -0,0 +1,220 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Long texts typed a section at a time, and where to resume them.
+
+A book is memory mapped rather than read, and split into sections of whole
+paragraphs only as far as you get, so opening one takes the same time and
+memory whatever its size. A section is identified by a checksum of its text,
+which does not depend on how far into the book it was reached. The end of the
+last finished section of each book is kept in a ``dbm`` database, so the next
+session picks up from there.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import mmap
+import os
+import re
+import zlib
+
+try:
+    import dbm
+except ImportError:
+    import anydbm as dbm
+
+from wpm.error import WpmError
+from wpm.journal import locked
+from wpm.quotes import Quote
+
+# A section ends at the first paragraph break this many bytes into it
+SECTION_SIZE = 400
+
+# Paragraphs longer than this many bytes are broken at a space
+SECTION_LIMIT = 2000
+
+# Blank lines between paragraphs
+PARAGRAPH = re.compile(br"\n[ \t\r]*\n")
+
+# Whitespace, including line breaks, is typed as single spaces
+WHITESPACE = re.compile(br"\s+")
+
+
+def section_end(data, start, size=SECTION_SIZE, limit=SECTION_LIMIT):
+    """Returns the offset just after the section starting at ``start``.
+
+    Only the bytes of the section itself are looked at.
+    """
+    length = len(data)
+    match = PARAGRAPH.search(data, min(start + size, length),
+                             min(start + limit, length))
+    if match is not None:
+        return match.end()
+    if start + limit >= length:
+        return length
+
+    # No paragraph break in sight, so break after the last space
+    for match in WHITESPACE.finditer(data, start + limit // 2, start + limit):
+        pass
+    if match is not None:
+        return match.end()
+
+    # Nor a space, but do not split a UTF-8 character
+    end = start + limit
+    while end > start and ord(data[end:end + 1]) & 0xc0 == 0x80:
+        end -= 1
+    return end if end > start else start + limit
+
+
+class Section(Quote):
+    """A part of a book, typed like a quote."""
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, author, title, text, text_id, filename, start, end):
+        super(Section, self).__init__(author, title, text, text_id)
+        self.filename = filename
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "<Section: %s %d-%d>" % (self.filename, self.start, self.end)
+
+
+class Book(object):
+    """A memory mapped text file, read one section at a time."""
+    def __init__(self, filename, start=0):
+        self.filename = filename
+        self.database = "book"
+
+        with open(filename, "rb") as file_obj:
+            if os.fstat(file_obj.fileno()).st_size > 0:
+                self.data = mmap.mmap(file_obj.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            else:
+                self.data = b""
+
+        if not self.section(0).text:
+            raise WpmError("No text in %s" % filename)
+
+        # The book may have changed since the offset was saved
+        if not 0 <= start < len(self.data) or not self.section(start).text:
+            start = 0
+        self.start = start
+
+    def __repr__(self):
+        return "<Book: %s>" % self.filename
+
+    def section(self, start):
+        """Returns the ``Section`` starting at the given offset."""
+        end = section_end(self.data, start)
+        text = u" ".join(self.data[start:end].decode("utf-8",
+                                                     "replace").split())
+        text_id = zlib.crc32(text.encode("utf-8")) & 0xffffffff
+        title = u"%s, %d%%" % (os.path.basename(self.filename),
+                               100 * start // max(len(self.data), 1))
+        return Section(u"", title, text, text_id, self.filename, start, end)
+
+    def random_iterator(self):
+        """Returns an iterator over the sections, in order, for the game."""
+        return BookIterator(self)
+
+
+class BookIterator(object):
+    """Goes through the sections of a book from where it was opened.
+
+    The offsets of the sections seen so far are kept to go back to. The
+    section after the current one is read ahead, and the first call to
+    ``next`` returns the first section.
+    """
+    def __init__(self, book):
+        self.book = book
+        self.starts = [book.start]
+        self.index = -1
+        self.sections = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def database(self):
+        """The quotes database."""
+        return self.book.database
+
+    def _get(self, start):
+        if start not in self.sections:
+            self.sections[start] = self.book.section(start)
+        return self.sections[start]
+
+    def current(self):
+        """Returns the current section, and reads the one after it."""
+        section = self._get(self.starts[max(self.index, 0)])
+        following = self._get(section.end)
+
+        # Forget all but these two
+        for start in list(self.sections):
+            if start not in (section.start, following.start):
+                del self.sections[start]
+        return section
+
+    def next(self):
+        """Goes to the next section, or back to the beginning after the
+        last."""
+        if self.index >= 0 and self.index + 1 == len(self.starts):
+            end = self.current().end
+            if self._get(end).text:
+                self.starts.append(end)
+            else:
+                self.starts = [0]
+                self.index = -1
+        self.index += 1
+        return self.current()
+
+    def previous(self):
+        """Goes back to the previous section seen."""
+        self.index = max(self.index - 1, 0)
+        return self.current()
+
+
+class Bookmarks(object):
+    """Persistent offsets to resume books from, keyed by their path."""
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __repr__(self):
+        return "<Bookmarks: %s>" % self.filename
+
+    @staticmethod
+    def _key(path):
+        return os.path.realpath(path).encode("utf-8")
+
+    def get(self, path):
+        """Returns the offset to resume a book from."""
+        key = self._key(path)
+        try:
+            with locked(self.filename):
+                database = dbm.open(self.filename, "r")
+                try:
+                    if key not in database:
+                        return 0
+                    return int(database[key])
+                finally:
+                    database.close()
+        except dbm.error:
+            # No bookmarks yet
+            return 0
+
+    def set(self, path, offset):
+        """Sets the offset to resume a book from."""
+        with locked(self.filename):
+            database = dbm.open(self.filename, "c")
+            try:
+                database[self._key(path)] = ("%d" % offset).encode("ascii")
+            finally:
+                database.close()
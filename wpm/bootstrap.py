@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Bootstrap confidence intervals for the mean of small or skewed samples.
+
+Resampling is done in vectorized batches with NumPy if it is installed, and
+in pure Python otherwise. Every interval is seeded from what it is computed
+for, so the same history always gives the same interval, and results are
+cached so that redrawing the screen never recomputes them.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import math
+import multiprocessing
+import random
+import zlib
+
+from wpm.config import INTERVAL_METHODS
+from wpm.gauss import phi_inv
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Upper limit on the number of resampled values held in memory at once
+BATCH_VALUES = 1 << 20
+
+_cache = {}
+
+
+def phi(x):
+    """The normal distribution's cumulative distribution function."""
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+def seed_for(key):
+    """Returns a stable random seed for a cache key."""
+    return zlib.crc32(repr(key).encode("utf-8")) & 0xffffffff
+
+
+def resampled_means(values, resamples, seed):
+    """Returns the sorted means of resamples of values, drawn with
+    replacement."""
+    count = len(values)
+
+    if numpy is not None:
+        values = numpy.asarray(values, dtype=float)
+        generator = numpy.random.RandomState(seed)
+        batch = max(1, BATCH_VALUES // count)
+        means = []
+        for start in range(0, resamples, batch):
+            size = min(batch, resamples - start)
+            indices = generator.randint(0, count, size=(size, count))
+            means.append(values[indices].mean(axis=1))
+        return numpy.sort(numpy.concatenate(means)).tolist()
+
+    generator = random.Random(seed)
+    means = []
+    if hasattr(generator, "choices"):
+        for _ in range(resamples):
+            means.append(sum(generator.choices(values, k=count)) / float(count))
+    else:
+        choice = generator.choice
+        for _ in range(resamples):
+            means.append(sum(choice(values) for _ in range(count)) /
+                         float(count))
+    return sorted(means)
+
+
+def percentile(ordered, fraction):
+    """Returns the given fraction from sorted values, with interpolation."""
+    position = fraction * (len(ordered) - 1)
+    low = int(math.floor(position))
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def acceleration(values):
+    """Returns the BCa acceleration of the mean, from the jackknife."""
+    count = len(values)
+    total = float(sum(values))
+    jackknife = [(total - value) / (count - 1) for value in values]
+    mean = sum(jackknife) / count
+
+    squares = sum((mean - value)**2 for value in jackknife)
+    cubes = sum((mean - value)**3 for value in jackknife)
+    if squares == 0:
+        return 0.0
+    return cubes / (6.0 * squares**1.5)
+
+
+def interval(values, alpha, method="percentile", resamples=2000, seed=0):
+    """Returns a bootstrap confidence interval for the mean of values.
+
+    Args:
+        values: The sample.
+        alpha: One minus the confidence level.
+        method: Either "percentile" or "bca" (bias-corrected and
+                accelerated).
+        resamples: Number of bootstrap resamples.
+        seed: Seed for the random number generator.
+    """
+    if method not in INTERVAL_METHODS[1:]:
+        raise ValueError("Unknown bootstrap method: %s" % method)
+
+    count = len(values)
+    if count == 0:
+        return 0, 0
+
+    mean = sum(values) / float(count)
+    if count == 1 or min(values) == max(values):
+        return mean, mean
+
+    means = resampled_means(values, resamples, seed)
+    low, high = alpha / 2.0, 1.0 - alpha / 2.0
+
+    if method == "bca":
+        below = sum(1 for value in means if value < mean)
+        below = min(max(below, 1), len(means) - 1)
+        bias = phi_inv(below / float(len(means)))
+        accel = acceleration(values)
+
+        def adjust(fraction):
+            z = bias + phi_inv(fraction)
+            return phi(bias + z / (1.0 - accel * z))
+
+        low, high = adjust(low), adjust(high)
+
+    return percentile(means, low), percentile(means, high)
+
+
+def _interval(job):
+    """Computes the interval for a job tuple in a worker process."""
+    values, alpha, method, resamples, seed = job
+    return interval(values, alpha, method, resamples, seed)
+
+
+def cached_interval(key, values, alpha, method, resamples=2000):
+    """Returns the interval for values, cached under the given key.
+
+    The key should identify the sample, e.g. (tag, text_id, n), since a
+    history only grows by appending races.
+    """
+    key = (key, alpha, method, resamples)
+    if key not in _cache:
+        _cache[key] = interval(values, alpha, method, resamples, seed_for(key))
+    return _cache[key]
+
+
+def cached_intervals(jobs, alpha, method, resamples=2000, processes=None):
+    """Returns intervals for a list of (key, values) jobs.
+
+    The intervals that are not already cached are computed in parallel over
+    a process pool.
+    """
+    keys = [(key, alpha, method, resamples) for key, _ in jobs]
+    missing = [(key, values) for key, (_, values) in zip(keys, jobs)
+               if key not in _cache]
+
+    work = [(values, alpha, method, resamples, seed_for(key))
+            for key, values in missing]
+
+    if len(work) > 1 and processes != 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_interval, work)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_interval(job) for job in work]
+
+    for (key, _), result in zip(missing, results):
+        _cache[key] = result
+
+    return [_cache[key] for key in keys]
@@ -13,19 +13,40 @@ The quotes database is *not* covered by the AGPL!
 
 import argparse
 import codecs
+import datetime
 import math
 import os
 import random
+import shutil
 import sys
+import zlib
 
 from wpm.convert import wpm_to_cpm
+from wpm.analytics import PERIODS, trends
 from wpm.gauss import (prediction_interval, confidence_interval)
 import wpm
 import wpm.config
 import wpm.error
 import wpm.game
+import wpm.book
+import wpm.bootstrap
+import wpm.journal
+import wpm.keyanalysis
+import wpm.keylog
+import wpm.merge
+import wpm.mistakes
 import wpm.quotes
+import wpm.record
 import wpm.stats
+import wpm.summary
+import wpm.words
+
+if sys.version_info[0:2] >= (3, 5):
+    # The game runs as asyncio tasks where the language supports them
+    import wpm.tasks
+    GameManager = wpm.tasks.TaskGameManager
+else:
+    GameManager = wpm.game.GameManager
 
 def parse_args():
     """Parses command line arguments."""
@@ -41,6 +62,10 @@ The format is
     argp.add_argument("--load", metavar="FILENAME", default=None,
                       help="A pure text file to train on.")
 
+    argp.add_argument("--book", metavar="FILENAME", default=None,
+                      help="""A long text file to type section by section,
+                      resuming where you stopped last time""")
+
     argp.add_argument("-V", "--version", default=False, action="store_true",
                       help="Show program version")
 
@@ -50,12 +75,57 @@ The format is
     argp.add_argument("-s", "--stats", default=False, action="store_true",
                       help="Shows score statistics grouped by tags")
 
+    argp.add_argument("--trend", metavar="PERIOD", default=None, nargs="?",
+                      const="week", choices=PERIODS,
+                      help="Shows progress per day, week (default) or month")
+
+    argp.add_argument("--compact", metavar="DAYS", default=None, nargs="?",
+                      const=-1, type=int,
+                      help="""Folds races older than DAYS (default from .wpmrc)
+                      into daily aggregates to keep the stats file small""")
+
+    argp.add_argument("--key-analysis", default=False, action="store_true",
+                      help="""Shows the slowest keys and key transitions from
+                      your recorded races""")
+
+    argp.add_argument("--drill", metavar="WORDS", default=None, nargs="?",
+                      const=20, type=int,
+                      help="""Practices the given number (default 20) of your
+                      slowest words""")
+
+    argp.add_argument("--merge-stats", metavar="FILENAME", default=None,
+                      nargs="+",
+                      help="Merges the given CSV files into your stats file")
+
     argp.add_argument("--cpm", default=False, action="store_true",
                       help="Shows CPM instead of WPM in stats")
 
     argp.add_argument("--stats-file", default="~/.wpm.csv", type=str,
                       help="File to record score history to (CSV format)")
 
+    argp.add_argument("--keys-file", default="~/.wpm.keys", type=str,
+                      help="File to record keystrokes of each race to")
+
+    argp.add_argument("--words-file", default="~/.wpm.words", type=str,
+                      help="File to record the speed of each typed word to")
+
+    argp.add_argument("--mistakes-file", default="~/.wpm.mistakes", type=str,
+                      help="File to record where in each quote you make typos")
+
+    argp.add_argument("--bookmarks-file", default="~/.wpm.bookmarks",
+                      type=str,
+                      help="File to record where to resume each --book from")
+
+    argp.add_argument("--duration", metavar="SECONDS", default=None,
+                      type=int,
+                      help="""Types quote after quote until the time is up,
+                      and records a single result""")
+
+    argp.add_argument("--ghost", metavar="RACE", default=None, nargs="?",
+                      const="best", choices=("best", "last"),
+                      help="""Races against a replay of your best (default) or
+                      last recorded race on each quote""")
+
     argp.add_argument("--id", "-i", default=None, type=int,
                       help="If specified, jumps to given text ID on start.")
 
@@ -77,14 +147,21 @@ The format is
         sys.exit(0)
 
     opts.stats_file = os.path.expanduser(opts.stats_file)
+    opts.keys_file = os.path.expanduser(opts.keys_file)
+    opts.words_file = os.path.expanduser(opts.words_file)
+    opts.mistakes_file = os.path.expanduser(opts.mistakes_file)
+    opts.bookmarks_file = os.path.expanduser(opts.bookmarks_file)
     return opts
 
 def load_stats(filename, tag):
     """Loads CSV stats from file."""
-    if not os.path.isfile(filename):
-        return wpm.stats.Stats(tag)
-
     try:
+        # Pick up races from sessions that did not exit cleanly
+        wpm.journal.commit(filename)
+
+        if not os.path.isfile(filename):
+            return wpm.stats.Stats(tag)
+
         stats = wpm.stats.Stats.load(filename)
     except ValueError:
         new_name = filename + ".old"
@@ -98,6 +175,19 @@ def load_stats(filename, tag):
 
     return stats
 
+def load_summary(filename):
+    """Loads the stats summary, rebuilding it from the CSV file if stale."""
+    # Pick up races from sessions that did not exit cleanly
+    wpm.journal.commit(filename)
+
+    if not os.path.isfile(filename):
+        return wpm.summary.Summary()
+
+    try:
+        return wpm.stats.Stats.load_summary(filename)
+    except ValueError:
+        raise wpm.error.WpmError("Unsupported format in %s" % filename)
+
 def load_json_quotes(filename):
     """Loads quotes from JSON file."""
     if filename is not None:
@@ -123,14 +213,38 @@ def load_plain_text_quote(quotes, filename):
         quotes.append([author, title, text, text_id])
         return wpm.quotes.Quotes(quotes, database=database)
 
+def load_book(filename, bookmarks):
+    """Opens a book where the last section finished in it ends."""
+    if not os.path.isfile(filename):
+        raise wpm.error.WpmError("No such file: %s" % filename)
+
+    start = wpm.book.Bookmarks(bookmarks).get(filename)
+    return wpm.book.Book(filename, start)
+
+def load_drill_quote(filename, tag, count):
+    """Creates a quote of the slowest words in the word index."""
+    words = wpm.words.WordIndex(filename)
+    text = words.drill(tag, count)
+    if text is None:
+        raise wpm.error.WpmError(
+            "Not enough words recorded in %s yet" % filename)
+
+    # The words are picked anew each time, so identify the text by its
+    # contents
+    text_id = zlib.crc32(text.encode("utf-8")) & 0xffffffff
+    return wpm.quotes.Quotes([["", "Slowest words", text, text_id]],
+                             database="drill")
+
 def print_stats(stats, cpm):
     """Prints table of game results."""
     table = []
 
     config = wpm.config.Config()
     percent = config.wpm.confidence_level
+    method = config.wpm.interval
+    jobs = []
 
-    for tag in sorted(stats.games.keys()):
+    for tag in sorted(stats.keys()):
         name = tag if tag is not None else "n/a"
 
         for last_n in [0, 10, 50, 100, 500, 1000]:
@@ -153,6 +267,11 @@ def print_stats(stats, cpm):
                 ci = confidence_interval(avg, sd, len(results), alpha)
                 pi = prediction_interval(avg, sd, alpha)
 
+                samples = results.samples() if method != "normal" else None
+                if samples is not None:
+                    key = (tag, None, last_n, len(results))
+                    jobs.append((len(table), key, samples[0]))
+
                 table.append([name,
                               label,
                               avg,
@@ -164,6 +283,15 @@ def print_stats(stats, cpm):
                               pi[0],
                               pi[1]])
 
+    if jobs:
+        intervals = wpm.bootstrap.cached_intervals(
+            [(key, values) for _, key, values in jobs], 1.0 - percent, method,
+            config.wpm.bootstrap_samples)
+        for (row, _, _), ci in zip(jobs, intervals):
+            if cpm:
+                ci = wpm_to_cpm(ci[0]), wpm_to_cpm(ci[1])
+            table[row][6:8] = ci
+
     if table:
         width = max(max(len(e[0]) for e in table), 11)
     else:
@@ -192,6 +320,175 @@ def print_stats(stats, cpm):
 
     print("="*len(head1))
 
+def print_percentiles(summary, cpm):
+    """Prints table of WPM percentiles per tag."""
+    head0 = "Tag          Games    %s percentiles" % ("CPM" if cpm else "WPM")
+    head1 = "                         p50     p90     p99"
+
+    tags = sorted(tag for tag in summary.keys() if len(summary.digest(tag)))
+    if not tags:
+        return
+
+    width = max(max(len(tag) for tag in tags), 11)
+
+    print(head0)
+    print(head1)
+    print("-"*len(head1))
+
+    for tag in tags:
+        digest = summary.digest(tag)
+        values = [digest.quantile(q) for q in (0.5, 0.9, 0.99)]
+        if cpm:
+            values = [wpm_to_cpm(value) for value in values]
+        print("%-*s   %6d  %6.1f  %6.1f  %6.1f" %
+              ((width, tag, len(digest)) + tuple(values)))
+
+    print("="*len(head1))
+
+def compact_stats(filename, days):
+    """Folds races older than the given number of days into rollups."""
+    if not os.path.isfile(filename):
+        raise wpm.error.WpmError("No such file: %s" % filename)
+
+    wpm.journal.commit(filename)
+
+    with wpm.journal.locked(filename):
+        try:
+            stats = wpm.stats.Stats.load(filename)
+        except ValueError:
+            raise wpm.error.WpmError("Unsupported format in %s" % filename)
+
+        cutoff = wpm.stats.Timestamp.now() - datetime.timedelta(days=days)
+        folded = stats.compact(cutoff)
+
+        if folded:
+            shutil.copyfile(filename, filename + ".backup")
+            stats.save(filename)
+
+    print("Folded %d races older than %d days into daily aggregates" % (
+        folded, days))
+
+def merge_stats(filename, others):
+    """Merges other stats files into the given one."""
+    for other in others:
+        if not os.path.isfile(other):
+            raise wpm.error.WpmError("No such file: %s" % other)
+
+    with wpm.journal.locked(filename):
+        inputs = list(others)
+        if os.path.isfile(filename):
+            shutil.copyfile(filename, filename + ".backup")
+            inputs.insert(0, filename)
+
+        races = wpm.merge.merge_files(inputs, filename)
+
+    print("Merged %d files into %s with %d races" % (len(inputs), filename,
+                                                     races))
+
+def print_trend(filename, period, cpm, last_n=12):
+    """Prints bucketed progress and improvement trends for each tag."""
+    wpm.journal.commit(filename)
+
+    if not os.path.isfile(filename):
+        return
+
+    try:
+        by_tag = trends(wpm.stats.Stats.iter_rows(filename), period)
+    except ValueError:
+        raise wpm.error.WpmError("Unsupported format in %s" % filename)
+
+    convert = wpm_to_cpm if cpm else (lambda value: value)
+    unit = "cpm" if cpm else "wpm"
+
+    for tag in sorted(by_tag.keys()):
+        trend = by_tag[tag]
+
+        print("%s: %d games, %+.2f %s/week, %+.2f %s per doubling of games" % (
+            tag, trend.count, convert(trend.wpm_per_week), unit,
+            convert(trend.wpm_per_doubling), unit))
+
+        head = "%-10s  Games    avg     sd    sma   ewma   acc" % period.title()
+        print("-"*len(head))
+        print(head)
+        print("-"*len(head))
+
+        rows = list(zip(trend.buckets, trend.moving_averages, trend.ewmas))
+        for (start, wpm_agg, acc_agg), sma, ewm in rows[-last_n:]:
+            print("%-10s %6d %6.1f %6.1f %6.1f %6.1f %5.1f%%" % (
+                start.isoformat(), wpm_agg.count, convert(wpm_agg.mean),
+                convert(wpm_agg.stddev), convert(sma), convert(ewm),
+                100.0*acc_agg.mean))
+        print("")
+
+def display_char(code):
+    """Returns a printable version of a character code."""
+    char = wpm.record.decode_key(code)
+    return {" ": u"\u2423", "\n": u"\u23ce", "\t": u"\u21e5"}.get(char, char)
+
+def print_latency_rows(title, rows, label):
+    """Prints a table of the given (label, ``Row``) pairs."""
+    head = "%-8s  Count   mean  median    p90  errors" % title
+    print(head)
+    print("-"*len(head))
+    for name, row in rows:
+        print(u"%-8s %6d %4.0fms %5.0fms %4.0fms %6.1f%%" % (
+            label(name), row.attempts, row.mean / 1000.0,
+            row.quantile(0.5) / 1000.0, row.quantile(0.9) / 1000.0,
+            100.0*row.error_rate))
+    print("")
+
+def print_heatmap(layout):
+    """Prints median latency per key laid out like a keyboard."""
+    medians = [row.quantile(0.5) for line in layout for _, row in line
+               if row is not None and row.count]
+    if not medians:
+        return
+
+    low, high = min(medians), max(medians)
+    # Green to red background colors of 256-color terminals
+    ramp = (28, 34, 70, 106, 142, 178, 172, 166, 160, 124)
+    color = sys.stdout.isatty() and os.getenv("TERM", "").endswith("256color")
+
+    print("Median latency per key in ms")
+    for indent, line in enumerate(layout):
+        keys = " "*2*indent
+        values = " "*2*indent
+        for key, row in line:
+            cell = " %-3s" % key
+            value = "    " if row is None or not row.count else (
+                "%4.0f" % (row.quantile(0.5) / 1000.0))
+            if color and row is not None and row.count:
+                fraction = (row.quantile(0.5) - low) / ((high - low) or 1.0)
+                code = ramp[min(int(fraction*len(ramp)), len(ramp) - 1)]
+                cell = "\x1b[48;5;%dm%s\x1b[0m" % (code, cell)
+                value = "\x1b[48;5;%dm%s\x1b[0m" % (code, value)
+            keys += cell
+            values += value
+        print(keys)
+        print(values)
+    print("")
+
+def print_key_analysis(keys_filename, count=15):
+    """Prints the slowest characters and bigrams and a keyboard heatmap."""
+    if not os.path.isfile(keys_filename):
+        print("No keystrokes recorded in %s yet" % keys_filename)
+        return
+
+    analysis = wpm.keyanalysis.KeyAnalysis.load(keys_filename)
+    new = analysis.update(keys_filename)
+    if new:
+        analysis.save(keys_filename)
+
+    print("Analyzed %d races (%d new)" % (analysis.races, new))
+    print("")
+
+    print_latency_rows("Bigram", analysis.slowest(analysis.bigrams, count),
+                       lambda key: u"".join(display_char(code) for code in
+                                            wpm.keyanalysis.bigram_codes(key)))
+    print_latency_rows("Key", analysis.slowest(analysis.chars, count),
+                       display_char)
+    print_heatmap(analysis.keyboard())
+
 def search(quotes, query):
     """Returns text IDs for quotes matching query."""
     for quote in iter(quotes):
@@ -243,23 +540,54 @@ def main():
         if config.wpm.cpm:
             opts.cpm = True
 
+        if opts.stats:
+            summary = load_summary(opts.stats_file)
+            print_stats(summary, opts.cpm)
+            print_percentiles(summary, opts.cpm)
+            return
+
+        if opts.merge_stats:
+            merge_stats(opts.stats_file, opts.merge_stats)
+            return
+
+        if opts.compact is not None:
+            if opts.compact < 0:
+                opts.compact = config.wpm.compact_days
+            compact_stats(opts.stats_file, opts.compact)
+            return
+
+        if opts.trend:
+            print_trend(opts.stats_file, opts.trend, opts.cpm)
+            return
+
+        if opts.key_analysis:
+            print_key_analysis(opts.keys_file)
+            return
+
+        if opts.duration is not None and opts.duration <= 0:
+            raise wpm.error.WpmError("The --duration must be positive")
+
         stats = load_stats(opts.stats_file, opts.tag)
 
         if opts.load_json is not None:
             quotes = load_json_quotes(opts.load_json)
         elif opts.load is not None:
             quotes = load_plain_text_quote([], opts.load)
+        elif opts.book is not None:
+            quotes = load_book(opts.book, opts.bookmarks_file)
+        elif opts.drill is not None:
+            quotes = load_drill_quote(opts.words_file, stats.tag,
+                                      opts.drill)
         else:
             # Load default database
             quotes = wpm.quotes.Quotes.load()
 
-        if opts.stats:
-            print_stats(stats, opts.cpm)
-            return
-
         text_ids = None
 
-        if opts.search:
+        if opts.book is not None:
+            # Sections are typed in order
+            pass
+        elif opts.search:
             text_ids = list(search(quotes, opts.search.lower()))
 
             if not text_ids:
@@ -274,12 +602,20 @@ def main():
         sys.exit(1)
 
     try:
-        with wpm.game.GameManager(quotes, stats, opts.cpm, opts.monochrome) as gm:
+        with GameManager(quotes, stats, opts.cpm, opts.monochrome) as gm:
+            gm.journal = wpm.journal.Journal(opts.stats_file)
+            gm.keylog = wpm.keylog.KeyLog(opts.keys_file)
+            gm.ghost_mode = opts.ghost
+            gm.engine.duration = opts.duration
+            gm.words = wpm.words.WordIndex(opts.words_file)
+            gm.mistakes = wpm.mistakes.MistakeLog(opts.mistakes_file)
+            if opts.book is not None:
+                gm.bookmarks = wpm.book.Bookmarks(opts.bookmarks_file)
             try:
                 gm.run(to_front=text_ids)
-                gm.stats.save(opts.stats_file)
+                wpm.journal.commit(opts.stats_file)
             except KeyboardInterrupt:
-                gm.stats.save(opts.stats_file)
+                wpm.journal.commit(opts.stats_file)
                 sys.exit(0)
     except wpm.error.WpmError as error:
         print(error)
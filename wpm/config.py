@@ -22,6 +22,9 @@ except ImportError:
 
 from wpm.error import ConfigError
 
+# Ways to compute confidence intervals, for the interval option
+INTERVAL_METHODS = ("normal", "percentile", "bca")
+
 def int_tuple(s):
     """Parses a string containing a tuple of two ints."""
     try:
@@ -40,14 +43,18 @@ def int_tuple(s):
 DEFAULTS = {
     "curses": {
         "escdelay": (str, 15, "Curses ESCDELAY"),
-        "window_timeout": (int, 20, "Curses window timeout"),
+        "refresh_rate": (int, 10, "Header updates per second while racing"),
     },
 
     "wpm": {
         "confidence_level": (float, 0.95, "Confidence level for statistics from 0.0 to 1.0"),
+        "interval": (str, "normal", "Confidence intervals: normal, percentile or bca (bootstrap)"),
+        "bootstrap_samples": (int, 2000, "Number of resamples for bootstrap intervals"),
         "wrap_width": (int, -1, "Wrap text to this width"),
         "tab_spaces": (int, 1, "Expand tabs to N spaces"),
         "cpm": (int, 0, "Report CPM instead of WPM in stats"),
+        "compact_days": (int, 365, "Keep individual races this many days when compacting"),
+        "error_heatmap": (int, 0, "Shade quotes by where you have made typos"),
     },
 
     "xterm256colors": {
@@ -125,6 +132,13 @@ class Config(object):
         level = self.wpm.confidence_level
         if not 0 < level < 1:
             raise ConfigError("The .wpmrc confidence level must be within [0, 1>")
+        if self.wpm.interval not in INTERVAL_METHODS:
+            raise ConfigError("The .wpmrc interval must be one of: %s" %
+                              ", ".join(INTERVAL_METHODS))
+        if self.curses.refresh_rate < 1:
+            raise ConfigError("The .wpmrc refresh_rate must be positive")
+        if self.wpm.bootstrap_samples < 1:
+            raise ConfigError("The .wpmrc bootstrap_samples must be positive")
 
     def load(self):
         """Loads ~/.wpmrc config settings."""
@@ -0,0 +1,273 @@
+# -*- encoding: utf-8 -*-
+
+"""
+The typing state of a race, without a terminal.
+
+An ``Engine`` is fed keys with the time they were typed, and returns an event
+for each saying what the key did. It keeps track of how far into the text the
+typist is, the typos after that, and the keystrokes, and computes speed and
+accuracy from the key timestamps alone. The game draws the screen from this
+state, and ``run`` drives an engine the same way from scripted keystrokes,
+for tests and benchmarks.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+from wpm.record import Recorder
+
+# What a key did, as returned by ``Engine.type``
+IGNORED = "ignored"
+CORRECT = "correct"
+INCORRECT = "incorrect"
+CORRECTED = "corrected"
+FINISHED = "finished"
+TIME_UP = "time up"
+
+# Keys that erase the last character typed
+BACKSPACES = frozenset(("KEY_BACKSPACE", u"\b", u"\x7f"))
+
+
+class Engine(object):
+    """The state of typing a text, driven by keys and their timestamps in
+    nanoseconds.
+
+    A race starts with the first character typed. It finishes when the last
+    character of the text is typed, or in a timed race, when ``duration``
+    seconds have passed. A timed race goes on with another text from
+    ``next_text`` after each finished one.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, text=u"", duration=None, tab_spaces=None):
+        self.text = text
+        self.duration = duration
+        self.tab_spaces = tab_spaces
+
+        # Keystrokes of the current text
+        self.recorder = Recorder()
+
+        # Text offsets of the typos and corrections in the current text
+        self.error_offsets = []
+        self.correction_offsets = []
+
+        self.reset()
+
+    def __repr__(self):
+        return "<Engine: position=%d incorrect=%d>" % (self.position,
+                                                       self.incorrect)
+
+    def reset(self, text=None):
+        """Cancels the race, optionally switching to another text."""
+        if text is not None:
+            self.text = text
+
+        self.start = None
+        self.stop = None
+
+        self.position = 0
+        self.incorrect = 0
+        self.total_incorrect = 0
+
+        # Characters typed in the texts finished earlier in a timed race
+        self.finished_chars = 0
+
+        # The word being typed, as shown in the prompt
+        self.edit = u""
+
+        del self.error_offsets[:]
+        del self.correction_offsets[:]
+        self.recorder.reset()
+
+    def next_text(self, text):
+        """Goes on with another text in a timed race, with the clock still
+        running."""
+        self.finished_chars += self.position
+        self.text = text
+        self.position = 0
+        self.incorrect = 0
+        self.edit = u""
+        del self.error_offsets[:]
+        del self.correction_offsets[:]
+        self.recorder.reset()
+
+    @property
+    def is_typing(self):
+        """Is a race running?"""
+        return self.start is not None and self.stop is None
+
+    @property
+    def finished(self):
+        """Has a race finished?"""
+        return self.start is not None and self.stop is not None
+
+    def expire(self, now):
+        """Finishes a timed race if its time is up at ``now``.
+
+        Returns:
+            True if the race finished.
+        """
+        if self.duration is None or not self.is_typing:
+            return False
+        end = self.start + int(self.duration * 1e9)
+        if now < end:
+            return False
+        self.stop = end
+        return True
+
+    def type(self, key, timestamp):
+        """Applies a key typed at the given time, in nanoseconds.
+
+        Args:
+            key: A character, or a key name like those from
+                ``Screen.get_key``.
+            timestamp: When the key was typed, from ``clock_ns``.
+
+        Returns:
+            One of the event constants of this module.
+        """
+        if self.stop is not None:
+            return IGNORED
+        if self.duration is not None and self.expire(timestamp):
+            return TIME_UP
+
+        if self.start is None:
+            if key in BACKSPACES:
+                # There is nothing to erase, and the race has not started
+                return IGNORED
+            # The clock starts with the first character
+            self.start = timestamp
+
+        self.recorder.add(timestamp, key, self.position, self.incorrect)
+
+        if key in BACKSPACES:
+            if self.incorrect or self.edit:
+                self.correction_offsets.append(self.position +
+                                               self.incorrect - 1)
+            if self.incorrect:
+                self.incorrect -= 1
+            elif self.edit:
+                self.position -= 1
+            else:
+                return IGNORED
+            self.edit = self.edit[:-1]
+            return CORRECTED
+
+        if key == u"\t" and self.tab_spaces is not None:
+            key = u" "*self.tab_spaces
+
+        if self.incorrect == 0 and self.text[self.position] == key:
+            self.position += 1
+
+            # Reset edit buffer on a correctly finished word
+            if key in (u" ", u"\n"):
+                self.edit = u""
+            else:
+                self.edit += key
+
+            if self.position == len(self.text):
+                if self.duration is None:
+                    self.stop = timestamp
+                return FINISHED
+            return CORRECT
+
+        if self.incorrect + self.position < len(self.text):
+            self.error_offsets.append(self.position + self.incorrect)
+            self.incorrect += 1
+            self.total_incorrect += 1
+            if key == u"\n":
+                key = u" "
+            self.edit += key
+            return INCORRECT
+
+        return IGNORED
+
+    @property
+    def typed(self):
+        """Number of characters typed correctly in the race."""
+        return self.finished_chars + self.position
+
+    def elapsed(self, now):
+        """Returns the seconds from the first key to ``now``, or to the end
+        of a finished race."""
+        if self.start is None:
+            return 0.0
+        if self.stop is not None:
+            now = self.stop
+        return (now - self.start) * 1e-9
+
+    def time_left(self, now):
+        """Returns the seconds left of a timed race at ``now``."""
+        return self.duration - self.elapsed(now)
+
+    def wpm(self, elapsed):
+        """Words per minute, after the given number of seconds."""
+        if self.start is None or elapsed <= 0:
+            return 0
+        return min((60.0 * self.typed / 5.0) / elapsed, 999)
+
+    def cps(self, elapsed):
+        """Characters per second, after the given number of seconds."""
+        if self.start is None or elapsed <= 0:
+            return 0
+        return min(float(self.typed) / elapsed, 99)
+
+    @property
+    def accuracy(self):
+        """Returns typing accuracy."""
+        if self.start is None:
+            return 0
+
+        if self.duration is not None:
+            # Only what was typed of the texts counts
+            length = self.typed
+        else:
+            length = len(self.text)
+        return float(length) / max(length + self.total_incorrect, 1)
+
+
+def keystrokes(text, cps=10.0, start=0, typos=()):
+    """Returns the (key, timestamp) pairs of typing a text at an even pace.
+
+    Args:
+        text: The text to type.
+        cps: Characters per second.
+        start: The timestamp of the first key, in nanoseconds.
+        typos: Offsets into the text where a wrong key is typed first, and
+            then erased.
+    """
+    step = int(1e9 / cps)
+    typos = frozenset(typos)
+    keys = []
+    for offset, char in enumerate(text):
+        if offset in typos:
+            keys.append((u"#" if char != u"#" else u"_", 0))
+            keys.append((u"KEY_BACKSPACE", 0))
+        keys.append((char, 0))
+    return [(key, start + index*step) for index, (key, _) in enumerate(keys)]
+
+
+def run(engine, keys, texts=()):
+    """Drives an engine with keys, like the game does, and returns the
+    events.
+
+    Each (key, timestamp) pair is typed in turn. In a timed race, each
+    finished text is followed by the next one from ``texts``, and the keys
+    after the time is up are not typed.
+    """
+    texts = iter(texts)
+    events = []
+    for key, timestamp in keys:
+        event = engine.type(key, timestamp)
+        events.append(event)
+        if event == FINISHED and engine.duration is not None:
+            engine.next_text(next(texts))
+        elif event == TIME_UP:
+            break
+    return events
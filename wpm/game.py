@@ -14,11 +14,24 @@ The quotes database is *not* covered by the AGPL!
 """
 
 import curses
-import time
+import errno
+import functools
+import select
+import sys
 
+from wpm.background import Background
 from wpm.config import Config
-from wpm.record import Recorder
+from wpm.engine import FINISHED, Engine
+from wpm.keylog import to_micros
+from wpm.record import Playback, Recorder, clock_ns
+from wpm.render import Renderer
 from wpm.screen import Screen
+from wpm.words import segment
+
+# Seconds after a timed race ends during which keys other than escape are
+# ignored, so that typing on for a moment does not start a new race or skip
+# the score
+FINISH_GRACE = 1.0
 
 class GameManager(object):
     """The main game runner."""
@@ -27,25 +40,49 @@ class GameManager(object):
         self.stats = stats
         self.cpm_flag = cpm_flag
         self.average = self.stats.average(self.stats.tag, last_n=10)
-        self.tab_spaces = None
-
-        # Stats
-        self.position = 0
-        self.incorrect = 0
-        self.total_incorrect = 0
         self.cheight = 0
 
-        self.start = None
-        self.stop = None
+        # The typing state of the race. Its duration is set for timed races
+        # through quote after quote.
+        self.engine = Engine()
+
+        # The quote after the current one in a timed race, once it has been
+        # drawn ahead of time
+        self.next_quote = None
 
-        self._edit = ""
-        self.num_quotes = len(quotes)
         self.quotes = quotes.random_iterator()
 
         self.screen = Screen(monochrome)
+        self.renderer = Renderer(self.screen)
         self.set_quote(self.quotes.next())
 
-        self.now = time.time()
+        # Finished races are written to disk by this, off the input path
+        # where it can be
+        self.background = Background()
+
+        # If set, finished races are appended to this ``Journal``
+        self.journal = None
+
+        # If set, the keystrokes of finished races are appended to this
+        # ``KeyLog``
+        self.keylog = None
+
+        # Race against the "best" or "last" recording of each quote
+        self.ghost_mode = None
+
+        # If set, the word speeds of finished races are added to this
+        # ``WordIndex``
+        self.words = None
+
+        # If set, the typos of finished races are added to this
+        # ``MistakeLog``
+        self.mistakes = None
+
+        # If set, the end of each finished ``Section`` of a book is saved to
+        # these ``Bookmarks``, to resume from
+        self.bookmarks = None
+
+        self.now = clock_ns()
 
     def __enter__(self):
         return self
@@ -58,114 +95,318 @@ class GameManager(object):
 
     def set_tab_spaces(self, spaces):
         """Sets how many spaces a tab should expand to."""
-        self.tab_spaces = spaces
+        self.engine.tab_spaces = spaces
 
     def mark_finished(self):
-        """Marks current race as finished."""
-        self.stop = time.time()
-        self.stats.add(self.wpm(self.elapsed),
-                       self.accuracy,
-                       self.quote.text_id,
-                       self.quotes.database)
-
+        """Records the race the engine has finished."""
+        engine = self.engine
+        if engine.duration is not None:
+            database = "timed"
+            quote = None
+        else:
+            database = self.quotes.database
+            quote = self.quote
+        game = self.stats.add(engine.wpm(self.elapsed),
+                              engine.accuracy,
+                              self.text_id,
+                              database)
         self.average = self.stats.average(self.stats.tag, last_n=10)
 
+        # The next race is recorded while this one is saved
+        recorder, engine.recorder = engine.recorder, Recorder()
+        self.background.submit(functools.partial(self.save_race,
+                                                 game,
+                                                 self.stats.tag,
+                                                 quote,
+                                                 recorder,
+                                                 list(engine.error_offsets),
+                                                 list(engine.correction_offsets)),
+                               self.race_saved)
+
+    def save_race(self, game, tag, quote, recorder, errors, corrections):
+        """Writes a finished race to disk. Runs on the background thread."""
+        if self.journal is not None:
+            self.journal.append(tag, game)
+
+        if quote is None:
+            # A timed race, whose keystrokes span several quotes
+            return
+
+        if self.keylog is not None:
+            self.keylog.append(game[6], game[5], tag, recorder)
+
+        if self.words is not None:
+            self.words.add(tag, segment(quote.text, recorder))
+
+        if self.mistakes is not None:
+            self.mistakes.add(tag, quote.text_id, len(quote.text), errors,
+                              corrections)
+
+        if self.bookmarks is not None:
+            self.bookmarks.set(quote.filename, quote.end)
+
+    def race_saved(self):
+        """Picks up what a saved race changed on disk."""
+        # The race just finished may be the new best
+        self.ghost_loaded = False
+        self.heat_loaded = False
+        if not self.is_typing:
+            self.render()
+
     def set_quote(self, quote):
         """Sets current quote."""
         self.screen.redraw = True
         self.quote = quote
-        self.recorder = Recorder()
+        self.engine.text = quote.text
         self.screen.set_quote(self.quote)
 
+        self.ghost = None
+        self.ghost_loaded = False
+        self.heat_loaded = False
+
+    def load_heat(self):
+        """Shades the current quote by where typos have been made."""
+        self.heat_loaded = True
+        if self.mistakes is None or not self.config.wpm.error_heatmap:
+            return
+
+        mistakes = self.mistakes.get(self.stats.tag, self.quote.text_id,
+                                     len(self.quote.text))
+        if mistakes is not None:
+            self.screen.set_heat(mistakes.runs())
+
+    def load_ghost(self):
+        """Loads the recording to race against for the current quote."""
+        self.ghost_loaded = True
+        self.ghost = None
+        if self.ghost_mode is None or self.keylog is None:
+            return
+        if self.engine.duration is not None:
+            # Recordings are of single quotes
+            return
+
+        # Only recordings of races in the stats for the current tag count
+        wpms = {}
+        for game in self.stats.games[self.stats.tag]:
+            if game[5] == self.quote.text_id:
+                wpms[to_micros(game[6])] = game[1]
+
+        entries = [entry for entry in self.keylog.index()
+                   if entry.text_id == self.quote.text_id and
+                   entry.timestamp in wpms]
+        if not entries:
+            return
+
+        if self.ghost_mode == "best":
+            entry = max(entries, key=lambda entry: wpms[entry.timestamp])
+        else:
+            entry = entries[-1]
+
+        with self.keylog:
+            self.ghost = Playback(self.keylog.read(entry.offset),
+                                  len(self.quote.text))
+
+    def prepare_next(self):
+        """Picks the next quote of a timed race and draws it off screen."""
+        self.next_quote = self.quotes.next()
+        self.screen.prepare_quote(self.next_quote)
+
+    def continue_race(self):
+        """Moves on to the next quote of a timed race, with the clock still
+        running."""
+        quote, self.next_quote = self.next_quote, None
+        if quote is None:
+            quote = self.quotes.next()
+        self.engine.next_text(quote.text)
+        self.set_quote(quote)
+
+        self.screen.replace_quote()
+        self.renderer.invalidate()
+
+    @property
+    def text_id(self):
+        """The text ID of the current race in the stats."""
+        if self.engine.duration is not None:
+            # Timed races span several quotes, and are told apart from them
+            # by a negative ID
+            return -self.engine.duration
+        return self.quote.text_id
+
     @property
     def is_typing(self):
         """Is user currently typing a quote?"""
-        return (self.start is not None) and (self.stop is None)
+        return self.engine.is_typing
 
     @property
     def game_done(self):
         """Has user finished a quote?"""
-        return (self.start is not None) and (self.stop is not None)
+        return self.engine.finished
 
     def run(self, to_front=None):
-        """Starts the main game loop."""
+        """Starts the main game loop.
+
+        Returns by raising ``KeyboardInterrupt`` when the user quits, after
+        all races have been saved.
+        """
         self.set_tab_spaces(self.config.wpm.tab_spaces)
 
         if to_front:
             self.quotes.put_to_front(to_front)
             self.set_quote(self.quotes.current())
 
-        key = None
-        while True:
-            self.now = time.time()
+        try:
+            self.run_loop()
+        finally:
+            self.background.flush()
+
+        raise KeyboardInterrupt()
 
-            head = self.get_stats(self.elapsed)
+    def run_loop(self):
+        """Applies keys as they arrive, until the user quits.
 
+        This waits in select for keys, or for the next tick while racing.
+        ``wpm.tasks`` runs the game as asyncio tasks instead, where it can.
+        """
+        self.render()
+        next_tick = None
+        while True:
+            timeout = None
             if self.is_typing:
-                if self.screen.first_key:
-                    self.screen.first_key = False
-                    self.recorder.reset()
-                    self.screen.rerender_race(head)
-
-                self.screen.show_keystroke(head,
-                                           self.position,
-                                           self.incorrect,
-                                           self._edit,
-                                           key)
-            elif self.game_done:
+                if next_tick is None:
+                    next_tick = clock_ns() + int(self.tick_delay()*1e9)
+                timeout = max(0, next_tick - clock_ns())*1e-9
+
+            try:
+                select.select([sys.stdin], [], [], timeout)
+            except select.error as error:
+                # Curses turns resize signals into keys
+                if error.args[0] != errno.EINTR:
+                    raise
+
+            keys = self.read_keys()
+            if keys and not self.apply_keys(keys):
+                return
+
+            if next_tick is not None and clock_ns() >= next_tick:
+                next_tick = None
+                if self.is_typing:
+                    self.tick()
+
+    def tick_delay(self):
+        """Returns the seconds to the next tick while racing."""
+        delay = 1.0 / self.config.curses.refresh_rate
+        if self.engine.duration is not None and self.is_typing:
+            delay = max(0, min(delay, self.engine.time_left(clock_ns())))
+        return delay
+
+    def tick(self):
+        """Updates the clock in the top bar and the ghost while racing.
+
+        In timed races, it also ends the race when the time is up, and draws
+        the next quote ahead of time while the user types the current one.
+        """
+        if self.engine.expire(clock_ns()):
+            self.mark_finished()
+        elif self.engine.duration is not None and self.next_quote is None:
+            self.prepare_next()
+        self.render()
+
+    def render(self):
+        """Draws the current state of the game."""
+        if not self.is_typing and not self.ghost_loaded:
+            self.load_ghost()
+        if not self.is_typing and not self.heat_loaded:
+            self.load_heat()
+
+        self.now = clock_ns()
+
+        head = self.get_stats(self.elapsed)
+
+        if self.is_typing:
+            if self.screen.first_key:
+                self.screen.first_key = False
+                self.screen.rerender_race(head)
+                self.renderer.invalidate()
+
+            ghost = None
+            if self.ghost is not None:
+                ghost = self.ghost.offset(self.elapsed)
+
+            self.renderer.show_race(head,
+                                    self.engine.position,
+                                    self.engine.incorrect,
+                                    self.engine.edit,
+                                    ghost)
+        else:
+            if self.screen.redraw:
+                self.renderer.invalidate()
+            if self.game_done:
                 self.screen.show_score(head,
-                                       self.wpm(self.elapsed),
+                                       self.engine.wpm(self.elapsed),
                                        self.stats,
-                                       self.cpm_flag)
+                                       self.cpm_flag,
+                                       self.text_id)
             else:
                 self.screen.show_browser(head, self.stats, self.cpm_flag)
 
-            self.screen.window.refresh()
-            key = self.screen.get_key()
-            self.handle_key(key)
+        self.renderer.refresh()
+
+    def apply_keys(self, keys):
+        """Applies keys to the game in order, then renders once.
+
+        Args:
+            keys: A list of (key, timestamp) pairs.
+
+        Returns:
+            False if the user quit, otherwise True.
+        """
+        resized = False
+        for key, timestamp in keys:
+            if key == "KEY_RESIZE":
+                # Only the final size matters
+                resized = True
+                continue
+            try:
+                self.handle_key(key, timestamp)
+            except KeyboardInterrupt:
+                return False
+
+        if resized:
+            self.resize()
 
-    def wpm(self, elapsed):
-        """Words per minute."""
-        if self.start is None:
-            return 0
-        return min((60.0 * self.position / 5.0) / elapsed, 999)
+        self.render()
+        return True
 
-    def cps(self, elapsed):
-        """Characters per second."""
-        if self.start is None:
-            return 0
-        return min(float(self.position) / elapsed, 99)
+    def read_keys(self):
+        """Returns all keys that have arrived, each with the time it was
+        read from ``clock_ns``."""
+        keys = []
+        while True:
+            key = self.screen.get_key()
+            if key is None:
+                return keys
+            keys.append((key, clock_ns()))
 
     @property
     def elapsed(self):
         """Elapsed game round time."""
-        if self.start is None:
-            # Typing has not started
-            return 0
-        if self.stop is None:
-            # Currently typing
-            return self.now - self.start
-        # Done typing
-        return self.stop - self.start
-
-    @property
-    def accuracy(self):
-        """Returns typing accuracy."""
-        if self.start is None:
-            return 0
-
-        length = len(self.quote.text)
-        return float(length) / (length + self.total_incorrect)
+        return self.engine.elapsed(self.now)
 
     def get_stats(self, elapsed):
         """Returns the top-bar stats line."""
         kbd = self.stats.tag
 
+        engine = self.engine
+        clock = elapsed
+        if engine.duration is not None:
+            # Count down the time left
+            clock = max(engine.duration - elapsed, 0)
+
         parts = (
-            "%5.1f wpm" % self.wpm(elapsed),
-            " %4.1f cps" % self.cps(elapsed),
-            " %5.2fs" % elapsed,
-            " %5.1f%% acc" % (100.0*self.accuracy),
+            "%5.1f wpm" % engine.wpm(elapsed),
+            " %4.1f cps" % engine.cps(elapsed),
+            " %5.2fs" % clock,
+            " %5.1f%% acc" % (100.0*engine.accuracy),
             " %5.1f avg wpm" % self.average,
             " - " + (kbd if kbd is not None else "Unspecified"),
         )
@@ -180,15 +421,9 @@ class GameManager(object):
 
     def reset(self, direction=0):
         """Cancels current game."""
-        self.start = None
-        self.stop = None
-
-        self.position = 0
-        self.incorrect = 0
-        self.total_incorrect = 0
+        self.engine.reset()
         self.cheight = 0
-
-        self._edit = ""
+        self.next_quote = None
         self.screen.first_key = True
         self.screen.clear_prompt()
 
@@ -203,32 +438,40 @@ class GameManager(object):
         """Handles a resized terminal."""
         self.screen.redraw = True
 
-        max_y, max_x = self.screen.window.getmaxyx()
+        max_y, max_x = self.screen.terminal_size()
         self.screen.clear()
 
         # Check if we have the resizeterm ncurses extension
         if hasattr(curses, "resizeterm"):
+            resized = curses.is_term_resized(max_y, max_x)
+            # Where curses has already seen the new size, this still updates
+            # curses.LINES and curses.COLS
             curses.resizeterm(max_y, max_x)
-            # An ungetch for KEY_RESIZE will be sent to let others handle it.
-            # We'll just pop it off again to prevent endless loops.
-            self.screen.get_key()
+            if resized:
+                # An ungetch for KEY_RESIZE will be sent to let others handle
+                # it. We'll just pop it off again to prevent endless loops.
+                self.screen.get_key()
 
         self.screen.set_quote(self.quote)
+        self.heat_loaded = False
+        self.renderer.invalidate()
 
-        if self.start is not None and self.stop is None:
-            # Resize during typing requires redrawing quote.
+        if self.is_typing:
+            # Resize during typing requires redrawing quote. The renderer
+            # colors what has been typed, with one chgat per color and line.
             self.screen.update_quote(Screen.COLOR_QUOTE)
             self.screen.update_author()
 
-            if self.position + self.incorrect <= len(self.quote.text):
-                for pos in range(self.position + 1):
-                    self.screen.highlight_progress(pos, 0)
-                for inc in range(self.incorrect + 1):
-                    self.screen.highlight_progress(self.position, inc)
+    def handle_key(self, key, timestamp=None):
+        """Dispatches actions based on key and current mode.
 
-    def handle_key(self, key):
-        """Dispatches actions based on key and current mode."""
-        # TODO: Refactor this mess of a function
+        Typing is left to the engine, and this only handles what the keys
+        mean around races.
+
+        Args:
+            key: The key from ``Screen.get_key``.
+            timestamp: When the key arrived, from ``clock_ns``.
+        """
         if key is None:
             return
 
@@ -236,9 +479,18 @@ class GameManager(object):
             self.resize()
             return
 
+        if timestamp is None:
+            timestamp = clock_ns()
+
+        if self.engine.expire(timestamp):
+            self.mark_finished()
+        if (self.engine.duration is not None and self.game_done and
+                timestamp < self.engine.stop + FINISH_GRACE*1e9 and
+                not Screen.is_escape(key)):
+            return
+
         # Browse mode
-        if self.start is None or (self.start is not None and
-                                  self.stop is not None):
+        if not self.is_typing:
             if key in (" ", "KEY_LEFT", "KEY_RIGHT"):
                 self.reset(direction=-1 if key == "KEY_LEFT" else 1)
                 return
@@ -250,54 +502,16 @@ class GameManager(object):
             self.reset()
             return
 
-        self.recorder.add(self.elapsed, key, self.position, self.incorrect)
-
-        if Screen.is_backspace(key):
-            if self.incorrect:
-                self.incorrect -= 1
-                self._edit = self._edit[:-1]
-            elif self._edit:
-                self.position -= 1
-                self._edit = self._edit[:-1]
-            return
-
-        if self.stop is not None:
-            # Use wants to try again immediately after score
+        if self.game_done and not Screen.is_backspace(key):
+            # Use wants to try again immediately after score. The race is
+            # rendered anew before the next frame.
             self.reset()
-            head = self.get_stats(self.elapsed)
-            self.screen.rerender_race(head)
-            self.screen.show_keystroke(head,
-                                       self.position,
-                                       self.incorrect,
-                                       self._edit,
-                                       key)
-
-        # Start recording upon first ordinary key press
-        if self.start is None:
-            self.start = time.time()
 
         if key == curses.KEY_ENTER:
             key = "\n"
-        elif key == "\t" and self.tab_spaces is not None:
-            key = " "*self.tab_spaces
-
-        # Did the user strike the correct key?
-        if self.incorrect == 0 and self.quote.text[self.position] == key:
-            self.position += 1
 
-            # Reset edit buffer on a correctly finished word
-            if key in (" ", "\n"):
-                self.screen.clear_prompt()
-                self._edit = ""
+        if self.engine.type(key, timestamp) == FINISHED:
+            if self.engine.duration is not None:
+                self.continue_race()
             else:
-                self._edit += key
-
-            # Finished typing?
-            if self.position == len(self.quote.text):
                 self.mark_finished()
-        elif self.incorrect + self.position < len(self.quote.text):
-            self.incorrect += 1
-            self.total_incorrect += 1
-            if key == "\n":
-                key = " "
-            self._edit += key
@@ -24,45 +24,86 @@ def memoized(func):
         return result
     return wrap
 
-@memoized
-def c(k):
-    """The MacLaurin coefficient for erf_inv."""
-    if k == 0:
-        return 1
-
-    res = 0
-    for m in range(k):
-        res += (c(m) * c(k - 1 - m)) / float((m + 1) * (2*m + 1))
+# Coefficients for Wichura's algorithm AS241 (PPND16), which gives the normal
+# quantile to about 16 significant digits.
+_CENTRAL_NUM = (3.3871328727963666080e0, 1.3314166789178437745e+2,
+                1.9715909503065514427e+3, 1.3731693765509461125e+4,
+                4.5921953931549871457e+4, 6.7265770927008700853e+4,
+                3.3430575583588128105e+4, 2.5090809287301226727e+3)
+_CENTRAL_DEN = (1.0, 4.2313330701600911252e+1,
+                6.8718700749205790830e+2, 5.3941960214247511077e+3,
+                2.1213794301586595867e+4, 3.9307895800092710610e+4,
+                2.8729085735721942674e+4, 5.2264952788528545610e+3)
+_NEAR_NUM = (1.42343711074968357734e0, 4.63033784615654529590e0,
+             5.76949722146069140550e0, 3.64784832476320460504e0,
+             1.27045825245236838258e0, 2.41780725177450611770e-1,
+             2.27238449892691845833e-2, 7.74545014278341407640e-4)
+_NEAR_DEN = (1.0, 2.05319162663775882187e0,
+             1.67638483018380384940e0, 6.89767334985100004550e-1,
+             1.48103976427480074590e-1, 1.51986665636164571966e-2,
+             5.47593808499534494600e-4, 1.05075007164441684324e-9)
+_TAIL_NUM = (6.65790464350110377720e0, 5.46378491116411436990e0,
+             1.78482653991729133580e0, 2.96560571828504891230e-1,
+             2.65321895265761230930e-2, 1.24266094738807843860e-3,
+             2.71155556874348757815e-5, 2.01033439929228813265e-7)
+_TAIL_DEN = (1.0, 5.99832206555887937690e-1,
+             1.36929880922735805310e-1, 1.48753612908506148525e-2,
+             7.86869131145613259100e-4, 1.84631831751005468180e-5,
+             1.42151175831644588870e-7, 2.04426310338993978564e-15)
 
+def _polynomial(coefficients, x):
+    """Evaluates a polynomial with Horner's method."""
+    res = 0.0
+    for coefficient in reversed(coefficients):
+        res = res*x + coefficient
     return res
 
-def erf_inv(z, steps=300):
-    """THe inverse error function approximated through its MacLaurin series
-    expansion.
+def phi_inv(p):
+    """The normal distribution's quantile function z_p / phi^(-1)(p).
+
+    Uses the rational approximations of Wichura's AS241 algorithm, which are
+    accurate to double precision over all of <0, 1>.
+    """
+    if not 0 < p < 1:
+        raise ValueError(p)
+
+    q = p - 0.5
+    if abs(q) <= 0.425:
+        r = 0.180625 - q*q
+        return q * _polynomial(_CENTRAL_NUM, r) / _polynomial(_CENTRAL_DEN, r)
+
+    r = math.sqrt(-math.log(p if q < 0 else 1.0 - p))
+    if r <= 5.0:
+        r -= 1.6
+        res = _polynomial(_NEAR_NUM, r) / _polynomial(_NEAR_DEN, r)
+    else:
+        r -= 5.0
+        res = _polynomial(_TAIL_NUM, r) / _polynomial(_TAIL_DEN, r)
+
+    return -res if q < 0 else res
+
+def erf_inv(z):
+    """The inverse error function.
 
     The value z must be inside <-1, 1>.
     """
     if not -1 < z < 1:
         raise ValueError(z)
+    return phi_inv((z + 1.0) / 2.0) / math.sqrt(2)
 
-    res = 0
-    for k in range(steps):
-        res += (c(k) / (2*k + 1)) * (math.sqrt(math.pi) * z / 2.0)**(2*k + 1)
-
-    return res
-
-def phi_inv(p):
-    """The normal distribution's quantile function z_p / phi^(-1)(p)."""
-    return math.sqrt(2) * erf_inv(2*p - 1)
+@memoized
+def z_score(alpha):
+    """The two-sided critical value phi^(-1)(1 - alpha/2), cached per alpha."""
+    return phi_inv(1.0 - alpha/2.0)
 
 def confidence_interval(mu, sd, n, alpha):
     """Calculates the confidence interval given the normal distribution."""
     if n == 0:
         return 0, 0
-    z = phi_inv(1.0 - alpha/2.0)
+    z = z_score(alpha)
     return mu - z*sd/math.sqrt(n), mu + z*sd/math.sqrt(n)
 
 def prediction_interval(mu, sd, alpha):
     """Calculates the prediction interval given the normal distribution."""
-    z = phi_inv(1.0 - alpha/2.0)
+    z = z_score(alpha)
     return mu - z*sd, mu + z*sd
@@ -15,6 +15,10 @@ import collections
 import math
 import sys
 
+# Number of bins kept by ``Histogram``, and the initial bin width in WPM
+BINS = 64
+WIDTH = 0.5
+
 def unicode_chr(ordinal):
     if sys.version_info.major >= 3:
         return chr(ordinal)
@@ -36,11 +40,136 @@ def histogram(values, slots):
     width = (high - low) / float(slots)
 
     for value in values:
-        slot = int((value - low) / width)
+        # The maximum belongs in the last slot, not one past it
+        slot = min(int((value - low) / width), slots - 1)
         histo[slot] += 1
 
     return low, width, histo
 
+class Histogram(object):
+    """Incrementally updated histogram with a bounded number of bins.
+
+    Bin ``n`` counts values in ``[n*width, (n + 1)*width>``. When a value
+    does not fit within ``bins`` consecutive bins, neighbouring bins are
+    merged pairwise and the width doubled, so adding a value is amortized
+    O(1) and the bins always stay aligned.
+    """
+    def __init__(self, bins=BINS, width=WIDTH):
+        self.bins = bins
+        self.width = width
+        self.counts = {}
+        self.count = 0
+        self.low = None
+        self.high = None
+        self.first = None
+        self.last = None
+        self._rendered = None
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "<Histogram: n=%d bins=%d width=%g>" % (
+                self.count, len(self.counts), self.width)
+
+    def add(self, value, count=1):
+        """Adds a value, or ``count`` copies of it."""
+        self._insert(int(math.floor(value / self.width)), count)
+        self.count += count
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+        self._rendered = None
+
+    def merge(self, other):
+        """Merges another histogram into this one.
+
+        Both must have started out with the same bin width, or widths that
+        are a power of two apart.
+        """
+        if not other.count:
+            return
+        while self.width < other.width:
+            self._widen()
+        scale = int(round(self.width / other.width))
+        for index, count in other.counts.items():
+            self._insert(index // scale, count)
+
+        self.count += other.count
+        if self.low is None or other.low < self.low:
+            self.low = other.low
+        if self.high is None or other.high > self.high:
+            self.high = other.high
+        self._rendered = None
+
+    def _insert(self, index, count):
+        if self.counts:
+            first = min(self.first, index)
+            last = max(self.last, index)
+            while last - first >= self.bins:
+                self._widen()
+                index //= 2
+                first //= 2
+                last //= 2
+            self.first, self.last = first, last
+        else:
+            self.first = self.last = index
+
+        self.counts[index] = self.counts.get(index, 0) + count
+
+    def _widen(self):
+        counts = {}
+        for index, count in self.counts.items():
+            counts[index // 2] = counts.get(index // 2, 0) + count
+        self.counts = counts
+        self.width *= 2
+        if self.counts:
+            self.first //= 2
+            self.last //= 2
+
+    def render(self, slots):
+        """Returns slots, low, width and frequency dict for ``plot``, grouping
+        bins so that there are at most ``slots`` of them."""
+        if self._rendered is None or self._rendered[0] != slots:
+            self._rendered = slots, self._render(slots)
+        return self._rendered[1]
+
+    def _render(self, slots):
+        histo = collections.defaultdict(int)
+        if not self.counts:
+            return 0, 0, self.width, histo
+
+        span = self.last - self.first + 1
+        group = max(1, -(-span // slots))
+        for index, count in self.counts.items():
+            histo[(index - self.first) // group] += count
+
+        return (-(-span // group), self.first*self.width, group*self.width,
+                histo)
+
+    def to_list(self):
+        """Returns the histogram as a JSON-friendly list of width, low and
+        high values, followed by bin and count pairs."""
+        out = [self.width, self.low, self.high]
+        for index in sorted(self.counts):
+            out.append(index)
+            out.append(self.counts[index])
+        return out
+
+    @staticmethod
+    def from_list(values, bins=BINS):
+        """Creates a histogram from ``to_list`` output."""
+        histo = Histogram(bins, values[0])
+        histo.low = values[1]
+        histo.high = values[2]
+        histo.counts = dict(zip(values[3::2], values[4::2]))
+        histo.count = sum(histo.counts.values())
+        if histo.counts:
+            histo.first = min(histo.counts)
+            histo.last = max(histo.counts)
+        return histo
+
 def plot(slots, low, width, histo):
     # pylint: disable=unused-argument
     chars = [unicode_chr(0x2580 + n) for n in range(1, 9)]
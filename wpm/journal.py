@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Safe recording from several concurrent wpm sessions into one stats file.
+
+Each process appends its finished races to its own journal file next to the
+stats file. When a session ends, its journal is committed to the stats file
+while holding an advisory lock: The races are appended if they are newer than
+everything in the file, and merged in otherwise. Journals left behind by
+sessions that died are picked up by the next commit.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import contextlib
+import csv
+import errno
+import os
+
+from wpm.merge import reversed_lines, sorted_rows, timestamp, write_merged
+from wpm.stats import Rollup, Stats
+from wpm.summary import Summary, tag_name
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locking on Windows
+    fcntl = None
+
+
+@contextlib.contextmanager
+def locked(stats_filename):
+    """Holds an exclusive lock on the stats file for the duration of a
+    with-block."""
+    with open(stats_filename + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def is_running(pid):
+    """Checks if a process is still running."""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+
+class Journal(object):
+    """Append-only journal of the races finished by one process."""
+    def __init__(self, stats_filename, pid=None):
+        self.pid = os.getpid() if pid is None else pid
+        self.filename = "%s.%d.journal" % (stats_filename, self.pid)
+
+    def __repr__(self):
+        return "<Journal: %s>" % self.filename
+
+    def append(self, tag, game):
+        """Appends a finished race and flushes it to disk."""
+        with open(self.filename, "at") as file_obj:
+            csv.writer(file_obj).writerow(list(game) + [tag_name(tag)])
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+
+    def rows(self):
+        """Returns the journalled (tag, game) pairs."""
+        if not os.path.isfile(self.filename):
+            return []
+        return list(Stats.iter_rows(self.filename))
+
+    def remove(self):
+        """Deletes the journal file."""
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    @staticmethod
+    def committable(stats_filename):
+        """Returns the journal of this process and those of dead processes."""
+        journals = []
+        directory, basename = os.path.split(stats_filename)
+        prefix = basename + "."
+        try:
+            names = os.listdir(directory or os.curdir)
+        except OSError:
+            return journals
+        for name in names:
+            if not (name.startswith(prefix) and name.endswith(".journal")):
+                continue
+            try:
+                pid = int(name[len(prefix):-len(".journal")])
+            except ValueError:
+                continue
+            if pid == os.getpid() or not is_running(pid):
+                journals.append(Journal(stats_filename, pid))
+        return journals
+
+
+def last_race(stats_filename):
+    """Returns the timestamp and race number of the last row in the file."""
+    skipped = 0
+    for _, game in Stats.parse_rows(csv.reader(reversed_lines(stats_filename))):
+        if isinstance(game, Rollup):
+            # Rollups are older than the races kept around them
+            skipped += game.count
+            continue
+        return game[6], game[0] + skipped
+    return None, skipped
+
+
+def append_rows(stats_filename, rows):
+    """Appends (tag, game) pairs newer than anything in the file.
+
+    The summary is updated in place if it was up to date.
+    """
+    summary = Summary.load(stats_filename)
+    _, race = last_race(stats_filename)
+
+    with open(stats_filename, "at") as file_obj:
+        writer = csv.writer(file_obj)
+        for tag, game in rows:
+            race += 1
+            writer.writerow([race] + list(game[1:]) + [tag_name(tag)])
+
+    if summary is not None:
+        for tag, game in rows:
+            summary.add_game(tag, game)
+        summary.save(stats_filename)
+
+
+def commit(stats_filename):
+    """Moves journalled races into the stats file.
+
+    Returns:
+        The number of races committed.
+    """
+    with locked(stats_filename):
+        journals = Journal.committable(stats_filename)
+        rows = sorted((row for journal in journals for row in journal.rows()),
+                      key=timestamp)
+
+        if rows and not os.path.isfile(stats_filename):
+            write_merged([rows], stats_filename)
+        elif rows:
+            last = last_race(stats_filename)[0]
+            if last is None or timestamp(rows[0]) > last:
+                append_rows(stats_filename, rows)
+            else:
+                # Interleaves with races from another session, or was partly
+                # committed before. Merging also skips those already there.
+                write_merged([sorted_rows(stats_filename), rows],
+                             stats_filename,
+                             [Summary.load(stats_filename), None])
+
+        for journal in journals:
+            journal.remove()
+
+    return len(rows)
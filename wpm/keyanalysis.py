@@ -0,0 +1,419 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Per-key and per-bigram latency and error rates from the keystroke log.
+
+Every attempt at typing a character of a text counts towards that character
+and the bigram it ends. Attempts made right after another correct keystroke
+are timed, and their latencies are counted in log-spaced bins, which keeps
+the tables small and mergeable while still giving medians and percentiles.
+
+Recordings are processed in chunks, in parallel and vectorized with NumPy if
+it is installed. The tables are cached next to the keystroke log, so each run
+only processes the races recorded since the last one.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import json
+import math
+import multiprocessing
+import os
+
+from wpm.keylog import KeyLog
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VERSION = 1
+
+# Latencies are binned logarithmically from 10 ms to 5 s. Longer pauses are
+# not timed at all.
+LOW_LATENCY = 10000
+MAX_LATENCY = 5000000
+BINS = 96
+_RATIO = math.log(float(MAX_LATENCY) / LOW_LATENCY) / BINS
+
+# Number of races each worker processes at a time
+CHUNK = 1000
+
+# Bigrams are keyed by both character codes
+_SHIFT = 21
+
+# Codes of keys that are not attempts at typing a character
+BACKSPACES = (8, 127)
+
+KEYBOARD = ("1234567890-=", "qwertyuiop[]", "asdfghjkl;'", "zxcvbnm,./")
+
+
+def latency_bin(micros):
+    """Returns the bin of a latency in microseconds."""
+    if micros <= LOW_LATENCY:
+        return 0
+    return min(int(math.log(float(micros) / LOW_LATENCY) / _RATIO), BINS - 1)
+
+
+def bin_value(index, fraction=0.5):
+    """Returns the latency at a fraction into a bin, in microseconds."""
+    return LOW_LATENCY * math.exp((index + fraction) * _RATIO)
+
+
+def bigram_key(first, second):
+    """Returns the table key of a bigram of character codes."""
+    return (first << _SHIFT) | second
+
+
+def bigram_codes(key):
+    """Returns the character codes of a bigram key."""
+    return key >> _SHIFT, key & ((1 << _SHIFT) - 1)
+
+
+class Row(object):
+    """Attempts, errors and binned latencies for a character or bigram."""
+    __slots__ = ("attempts", "errors", "count", "total", "bins")
+
+    def __init__(self):
+        self.attempts = 0
+        self.errors = 0
+        self.count = 0
+        self.total = 0
+        self.bins = [0]*BINS
+
+    def add(self, latency, error):
+        """Adds an attempt. The latency is None if it was not timed."""
+        self.attempts += 1
+        if error:
+            self.errors += 1
+        elif latency is not None:
+            self.count += 1
+            self.total += latency
+            self.bins[latency_bin(latency)] += 1
+
+    def merge(self, other):
+        """Merges another row into this one."""
+        self.attempts += other.attempts
+        self.errors += other.errors
+        self.count += other.count
+        self.total += other.total
+        self.bins = [a + b for a, b in zip(self.bins, other.bins)]
+
+    @property
+    def error_rate(self):
+        """Returns the fraction of attempts that were wrong."""
+        return float(self.errors) / self.attempts if self.attempts else 0.0
+
+    @property
+    def mean(self):
+        """Returns the mean latency in microseconds."""
+        return float(self.total) / self.count if self.count else 0.0
+
+    def quantile(self, fraction):
+        """Returns the latency at the given fraction, in microseconds."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.bins):
+            if count and seen + count >= rank:
+                return bin_value(index, (rank - seen) / float(count))
+            seen += count
+        return bin_value(BINS - 1, 1.0)
+
+    def to_list(self):
+        """Returns the row as a compact, JSON-friendly list."""
+        out = [self.attempts, self.errors, self.count, self.total]
+        for index, count in enumerate(self.bins):
+            if count:
+                out.extend((index, count))
+        return out
+
+    @staticmethod
+    def from_list(values):
+        """Creates a row from ``to_list`` output."""
+        row = Row()
+        row.attempts, row.errors, row.count, row.total = values[:4]
+        for index, count in zip(values[4::2], values[5::2]):
+            row.bins[index] = count
+        return row
+
+
+class Table(object):
+    """Rows keyed by character code or ``bigram_key``."""
+    def __init__(self):
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row(self, key):
+        """Returns the row for the key, creating it if needed."""
+        if key not in self.rows:
+            self.rows[key] = Row()
+        return self.rows[key]
+
+    def merge(self, other):
+        """Merges another table into this one."""
+        for key, row in other.rows.items():
+            self.row(key).merge(row)
+
+    def to_dict(self):
+        """Returns the table as a JSON-friendly dict."""
+        return dict((str(key), row.to_list()) for key, row in self.rows.items())
+
+    @staticmethod
+    def from_dict(data):
+        """Creates a table from ``to_dict`` output."""
+        table = Table()
+        for key, values in data.items():
+            table.rows[int(key)] = Row.from_list(values)
+        return table
+
+
+def _attempts_python(recording):
+    """Yields (char, previous char, latency or None, error) for each attempt
+    at typing a character of the text."""
+    deltas = recording.deltas
+    keys = recording.keys
+    incorrects = recording.incorrects
+    positions = recording.positions()
+    count = len(positions)
+
+    after = [positions[index + 1] if index + 1 < count else positions[index] + 1
+             for index in range(count)]
+    advanced = [after[index] > positions[index] for index in range(count)]
+
+    # The text is what was typed at each position that was advanced past
+    text = {}
+    for index in range(count):
+        if advanced[index]:
+            text[positions[index]] = keys[index]
+
+    for index in range(count):
+        if incorrects[index] or keys[index] < 0 or keys[index] in BACKSPACES:
+            continue
+        position = positions[index]
+        if position not in text:
+            continue
+
+        error = not advanced[index]
+        latency = None
+        if (not error and index and advanced[index - 1] and
+                deltas[index] <= MAX_LATENCY):
+            latency = deltas[index]
+
+        yield text[position], text.get(position - 1, -1), latency, error
+
+
+def _accumulate_python(recordings, chars, bigrams):
+    for recording in recordings:
+        for char, previous, latency, error in _attempts_python(recording):
+            chars.row(char).add(latency, error)
+            if previous >= 0:
+                bigrams.row(bigram_key(previous, char)).add(latency, error)
+
+
+def _attempts_numpy(recording):
+    """Returns arrays of chars, previous chars, latencies, errors and timed
+    flags for the attempts in a recording."""
+    deltas = numpy.asarray(recording.deltas, dtype=numpy.int64)
+    keys = numpy.asarray(recording.keys, dtype=numpy.int64)
+    incorrects = numpy.asarray(recording.incorrects)
+    positions = numpy.cumsum(numpy.asarray(recording.moves, dtype=numpy.int64))
+
+    after = numpy.empty_like(positions)
+    after[:-1] = positions[1:]
+    after[-1] = positions[-1] + 1
+    advanced = after > positions
+
+    text = numpy.full(int(after.max()) + 1, -1, dtype=numpy.int64)
+    text[positions[advanced]] = keys[advanced]
+
+    attempt = ((incorrects == 0) & (keys >= 0) &
+               ~numpy.isin(keys, BACKSPACES) & (positions >= 0))
+    attempt &= text[numpy.maximum(positions, 0)] >= 0
+
+    previous_advanced = numpy.r_[False, advanced[:-1]]
+    error = attempt & ~advanced
+    timed = (attempt & advanced & previous_advanced &
+             (deltas <= MAX_LATENCY))
+
+    index = positions[attempt]
+    previous = numpy.where(index > 0, text[numpy.maximum(index - 1, 0)], -1)
+    return (text[index], previous, deltas[attempt], error[attempt],
+            timed[attempt])
+
+
+def _accumulate_numpy(recordings, chars, bigrams):
+    parts = [_attempts_numpy(recording) for recording in recordings
+             if len(recording)]
+    if not parts:
+        return
+    char, previous, latency, error, timed = [numpy.concatenate(column)
+                                             for column in zip(*parts)]
+
+    bins = numpy.zeros(len(latency), dtype=numpy.int64)
+    slow = latency > LOW_LATENCY
+    bins[slow] = numpy.minimum(
+        (numpy.log(latency[slow] / float(LOW_LATENCY)) / _RATIO).astype(
+            numpy.int64), BINS - 1)
+
+    def accumulate(table, keys, mask):
+        keys, error_, timed_, latency_, bins_ = (
+            keys[mask], error[mask], timed[mask], latency[mask], bins[mask])
+        unique, inverse = numpy.unique(keys, return_inverse=True)
+        size = len(unique)
+        attempts = numpy.bincount(inverse, minlength=size)
+        errors = numpy.bincount(inverse, weights=error_, minlength=size)
+        counts = numpy.bincount(inverse[timed_], minlength=size)
+        totals = numpy.bincount(inverse[timed_], weights=latency_[timed_],
+                                minlength=size)
+        histogram = numpy.bincount(inverse[timed_]*BINS + bins_[timed_],
+                                   minlength=size*BINS).reshape(size, BINS)
+
+        for index, key in enumerate(unique.tolist()):
+            row = table.row(key)
+            row.attempts += int(attempts[index])
+            row.errors += int(errors[index])
+            row.count += int(counts[index])
+            row.total += int(totals[index])
+            row.bins = [a + int(b) for a, b in zip(row.bins, histogram[index])]
+
+    accumulate(chars, char, numpy.ones(len(char), dtype=bool))
+    accumulate(bigrams, (previous << _SHIFT) | char, previous >= 0)
+
+
+def analyze(recordings):
+    """Returns tables of characters and bigrams for the recordings."""
+    chars = Table()
+    bigrams = Table()
+    if numpy is not None:
+        _accumulate_numpy(recordings, chars, bigrams)
+    else:
+        _accumulate_python(recordings, chars, bigrams)
+    return chars, bigrams
+
+
+def _analyze_chunk(job):
+    """Analyzes the recordings at the given offsets in a worker process."""
+    filename, offsets = job
+    keylog = KeyLog(filename)
+    with keylog:
+        chars, bigrams = analyze([keylog.read(offset) for offset in offsets])
+    return chars.to_dict(), bigrams.to_dict()
+
+
+class KeyAnalysis(object):
+    """Cached per-character and per-bigram tables for a keystroke log."""
+    def __init__(self):
+        self.chars = Table()
+        self.bigrams = Table()
+        self.races = 0
+        self.last_offset = None
+
+    @staticmethod
+    def filename(keys_filename):
+        """Returns the cache filename for the given keystroke log."""
+        return keys_filename + ".analysis"
+
+    @staticmethod
+    def load(keys_filename):
+        """Loads the cache, or returns an empty analysis."""
+        try:
+            with open(KeyAnalysis.filename(keys_filename), "rt") as file_obj:
+                data = json.load(file_obj)
+        except (IOError, OSError, ValueError):
+            return KeyAnalysis()
+
+        if data.get("version") != VERSION:
+            return KeyAnalysis()
+
+        analysis = KeyAnalysis()
+        analysis.chars = Table.from_dict(data["chars"])
+        analysis.bigrams = Table.from_dict(data["bigrams"])
+        analysis.races = data["races"]
+        analysis.last_offset = data["last_offset"]
+        return analysis
+
+    def save(self, keys_filename):
+        """Writes the cache."""
+        filename = KeyAnalysis.filename(keys_filename)
+        data = {
+            "version": VERSION,
+            "races": self.races,
+            "last_offset": self.last_offset,
+            "chars": self.chars.to_dict(),
+            "bigrams": self.bigrams.to_dict(),
+        }
+        with open(filename + ".tmp", "wt") as file_obj:
+            json.dump(data, file_obj, separators=(",", ":"))
+        os.rename(filename + ".tmp", filename)
+
+    def update(self, keys_filename, processes=None):
+        """Processes the races recorded since the last update.
+
+        Returns:
+            The number of races processed.
+        """
+        entries = KeyLog(keys_filename).index()
+
+        # Start over if the log was replaced or cut short
+        if (self.races > len(entries) or
+                (self.races and
+                 entries[self.races - 1].offset != self.last_offset)):
+            self.__init__()
+
+        offsets = [entry.offset for entry in entries[self.races:]]
+        if not offsets:
+            return 0
+
+        jobs = [(keys_filename, offsets[start:start + CHUNK])
+                for start in range(0, len(offsets), CHUNK)]
+
+        if len(jobs) > 1 and processes != 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_analyze_chunk, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_analyze_chunk(job) for job in jobs]
+
+        for chars, bigrams in results:
+            self.chars.merge(Table.from_dict(chars))
+            self.bigrams.merge(Table.from_dict(bigrams))
+
+        self.races = len(entries)
+        self.last_offset = entries[-1].offset
+        return len(offsets)
+
+    def slowest(self, table, count=15, minimum=5):
+        """Returns the (key, row) pairs with the highest median latency."""
+        rows = [(key, row) for key, row in table.rows.items()
+                if row.count >= minimum]
+        rows.sort(key=lambda item: item[1].quantile(0.5), reverse=True)
+        return rows[:count]
+
+    def keyboard(self):
+        """Returns rows of (key, row) pairs laid out like a keyboard, merging
+        upper and lower case letters. The row is None for unseen keys."""
+        layout = []
+        for keys in KEYBOARD:
+            line = []
+            for key in keys:
+                row = Row()
+                for char in set((key, key.upper())):
+                    if ord(char) in self.chars.rows:
+                        row.merge(self.chars.rows[ord(char)])
+                line.append((key, row if row.attempts else None))
+            layout.append(line)
+        return layout
@@ -0,0 +1,433 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Compact binary log of the keystrokes of every finished race.
+
+Each entry is a fixed-size header followed by the race's tag and four packed
+columns: microseconds since the previous keystroke, change in position, key
+code and number of incorrect characters. Each column is stored with the
+smallest item size that fits the race, which typically makes a keystroke
+seven bytes. A side index of (timestamp, text_id, offset) records makes it
+possible to find the recordings of a quote without scanning the log, and
+columns are read straight out of a memory map with ``memoryview``.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import array
+import collections
+import datetime
+import mmap
+import os
+import struct
+import sys
+
+from wpm.error import WpmError
+from wpm.journal import locked
+from wpm.record import TIMESTAMP_TYPE, decode_key
+
+MAGIC = b"WK"
+VERSION = 1
+
+# Magic, version, timestamp in microseconds, text ID, keystroke count, tag
+# length and the typecodes of the four columns
+HEADER = struct.Struct("<2sBxqqIH4s")
+
+# Timestamp in microseconds, text ID and offset of the entry in the log
+INDEX = struct.Struct("<qqQ")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Candidate typecodes for each column, from smallest to largest
+SIGNED = ("b", "h", "i", "q")
+UNSIGNED = ("B", "H", "I", "Q")
+
+# The start of every entry
+MARKER = MAGIC + struct.pack("B", VERSION)
+
+IndexEntry = collections.namedtuple("IndexEntry",
+                                    ["timestamp", "text_id", "offset"])
+
+
+def to_micros(timestamp):
+    """Converts a datetime to microseconds since the epoch."""
+    delta = timestamp - EPOCH
+    return (delta.days*86400 + delta.seconds)*1000000 + delta.microseconds
+
+
+def from_micros(micros):
+    """Converts microseconds since the epoch to a datetime."""
+    return EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def typecode(values, candidates):
+    """Returns the smallest typecode that can hold all the values."""
+    low = min(values) if values else 0
+    high = max(values) if values else 0
+    for code in candidates:
+        bits = 8*itemsize(code)
+        if code in SIGNED:
+            fits = -(1 << (bits - 1)) <= low and high < (1 << (bits - 1))
+        else:
+            fits = low >= 0 and high < (1 << bits)
+        if fits:
+            return code
+    raise ValueError("Values do not fit in 64 bits")
+
+
+def itemsize(code):
+    """Returns the size in the log of an item of the given typecode."""
+    return struct.calcsize("<" + code)
+
+
+def pack(values, code):
+    """Returns the values as little-endian bytes of the given typecode."""
+    try:
+        column = array.array(code, values)
+    except ValueError:
+        # Python 2 has no arrays of 64-bit integers
+        return struct.pack("<%d%s" % (len(values), code), *values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    if sys.version_info.major >= 3:
+        return column.tobytes()
+    return column.tostring()
+
+
+def unpack(data, code):
+    """Returns a column of the given typecode from little-endian bytes."""
+    try:
+        column = array.array(code)
+    except ValueError:
+        return struct.unpack("<%d%s" % (len(data) // itemsize(code), code),
+                             data)
+    if sys.version_info.major >= 3:
+        column.frombytes(data)
+    else:
+        column.fromstring(data)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+class Recording(object):
+    """Keystrokes of a single race, read from the log.
+
+    The columns are views into the memory mapped log, so they are only valid
+    while the ``KeyLog`` that returned the recording is open.
+    """
+    def __init__(self, timestamp, text_id, tag, deltas, moves, keys,
+                 incorrects):
+        self.timestamp = timestamp
+        self.text_id = text_id
+        self.tag = tag
+        self.deltas = deltas
+        self.moves = moves
+        self.keys = keys
+        self.incorrects = incorrects
+
+    def __repr__(self):
+        return "<Recording: %s text_id=%d keys=%d>" % (
+                self.timestamp, self.text_id, len(self))
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def elapsed(self):
+        """Returns the microseconds from the first keystroke to each one."""
+        out = array.array(TIMESTAMP_TYPE, self.deltas)
+        for index in range(1, len(out)):
+            out[index] += out[index - 1]
+        return out
+
+    def positions(self):
+        """Returns the position in the text before each keystroke."""
+        out = array.array("i", self.moves)
+        for index in range(1, len(out)):
+            out[index] += out[index - 1]
+        return out
+
+    def __iter__(self):
+        """Yields (seconds, key, position, incorrect) like ``Recorder``."""
+        for micros, code, position, incorrect in zip(self.elapsed(),
+                                                     self.keys,
+                                                     self.positions(),
+                                                     self.incorrects):
+            yield micros * 1e-6, decode_key(code), position, incorrect
+
+
+class KeyLog(object):
+    """Append-only binary log of keystroke recordings."""
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+        self._map = None
+        self._index = []
+        self._index_size = 0
+
+    def __repr__(self):
+        return "<KeyLog: %s>" % self.filename
+
+    @property
+    def index_filename(self):
+        """Returns the filename of the offset index."""
+        return self.filename + ".index"
+
+    def append(self, timestamp, text_id, tag, recorder):
+        """Appends the keystrokes of a ``Recorder`` for a finished race."""
+        count = len(recorder)
+        if not count:
+            return
+
+        start = recorder.timestamps[0]
+        elapsed = [int(recorder.timestamps[index] - start) // 1000
+                   for index in range(count)]
+        deltas = [0] + [elapsed[index] - elapsed[index - 1]
+                        for index in range(1, count)]
+        positions = recorder.positions[:count]
+        moves = [0] + [positions[index] - positions[index - 1]
+                       for index in range(1, count)]
+        keys = recorder.keys[:count]
+        incorrects = recorder.incorrects[:count]
+
+        codes = (typecode(deltas, UNSIGNED), typecode(moves, SIGNED),
+                 typecode(keys, SIGNED), typecode(incorrects, UNSIGNED))
+
+        tag = (tag or "").encode("utf-8")[:0xffff]
+        micros = to_micros(timestamp)
+        entry = [HEADER.pack(MAGIC, VERSION, micros, text_id, count, len(tag),
+                             "".join(codes).encode("ascii")), tag]
+        for values, code in zip((deltas, moves, keys, incorrects), codes):
+            entry.append(pack(values, code))
+
+        with locked(self.filename):
+            self._check_index()
+            with open(self.filename, "ab") as file_obj:
+                offset = file_obj.tell()
+                file_obj.write(b"".join(entry))
+            with open(self.index_filename, "ab") as file_obj:
+                file_obj.write(INDEX.pack(micros, text_id, offset))
+
+    def _check_index(self):
+        """Rebuilds the index if it does not end with the last entry of the
+        log."""
+        size = 0
+        if os.path.isfile(self.filename):
+            size = os.path.getsize(self.filename)
+
+        end = 0
+        last = self._last_index_entry()
+        if last is not None and last.offset >= size:
+            end = -1
+        elif last is not None:
+            with open(self.filename, "rb") as file_obj:
+                file_obj.seek(last.offset)
+                data = file_obj.read(HEADER.size)
+            try:
+                end = last.offset + self._entry_size(data, 0)
+            except WpmError:
+                end = -1
+
+        if end != size:
+            self.rebuild_index()
+
+    def _last_index_entry(self):
+        if not os.path.isfile(self.index_filename):
+            return None
+        with open(self.index_filename, "rb") as file_obj:
+            file_obj.seek(0, os.SEEK_END)
+            size = file_obj.tell()
+            if size < INDEX.size or size % INDEX.size:
+                return None
+            file_obj.seek(size - INDEX.size)
+            return IndexEntry(*INDEX.unpack(file_obj.read(INDEX.size)))
+
+    def _read_index(self):
+        """Returns the index, reading only what was added since last time."""
+        size = 0
+        if os.path.isfile(self.index_filename):
+            size = os.path.getsize(self.index_filename)
+        if size < self._index_size:
+            self._index = []
+            self._index_size = 0
+
+        if size > self._index_size:
+            with open(self.index_filename, "rb") as file_obj:
+                file_obj.seek(self._index_size)
+                data = file_obj.read(size - self._index_size)
+            data = data[:len(data) - len(data) % INDEX.size]
+            self._index.extend(IndexEntry(*INDEX.unpack_from(data, offset))
+                               for offset in range(0, len(data), INDEX.size))
+            self._index_size += len(data)
+
+        return list(self._index)
+
+    def index(self):
+        """Returns a list of ``IndexEntry`` for all the recordings."""
+        with locked(self.filename):
+            self._check_index()
+            return self._read_index()
+
+    def rebuild_index(self):
+        """Rebuilds the index by scanning the entry headers of the log.
+
+        Corrupt entries are skipped, and the entries after them are found by
+        looking for the next valid header. A partly written entry at the end
+        of the log is cut off, but nothing else is removed.
+        """
+        entries = []
+        if os.path.isfile(self.filename) and os.path.getsize(self.filename):
+            with open(self.filename, "rb") as file_obj:
+                data = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    offset = 0
+                    size = len(data)
+                    while offset < size:
+                        end = self._entry_end(data, offset)
+                        if end is not None and end <= size:
+                            _, micros, text_id = self._header(data,
+                                                              offset)[:3]
+                            entries.append(INDEX.pack(micros, text_id,
+                                                      offset))
+                            offset = end
+                            continue
+                        following = self._find_entry(data, offset + 1)
+                        if following is None:
+                            break
+                        offset = following
+                    partial = self._partial(data, offset)
+                finally:
+                    data.close()
+
+            if partial:
+                with open(self.filename, "r+b") as file_obj:
+                    file_obj.truncate(offset)
+
+        with open(self.index_filename + ".tmp", "wb") as file_obj:
+            file_obj.write(b"".join(entries))
+        os.rename(self.index_filename + ".tmp", self.index_filename)
+        self._index = []
+        self._index_size = 0
+
+    def _entry_end(self, data, offset):
+        """Returns where the entry at the offset ends, which is past the end
+        of the data if it was partly written, or None if there is no valid
+        header there."""
+        try:
+            return offset + self._entry_size(data, offset)
+        except WpmError:
+            return None
+
+    def _find_entry(self, data, start):
+        """Returns the offset of the next whole entry from ``start``, or
+        None."""
+        offset = data.find(MARKER, start)
+        while offset != -1:
+            end = self._entry_end(data, offset)
+            if end is not None and end <= len(data):
+                return offset
+            offset = data.find(MARKER, offset + 1)
+        return None
+
+    def _partial(self, data, offset):
+        """Is the rest of the data from the offset a partly written entry?"""
+        if offset >= len(data):
+            return False
+        if len(data) - offset < HEADER.size:
+            return MARKER.startswith(data[offset:offset + len(MARKER)])
+        end = self._entry_end(data, offset)
+        return end is not None and end > len(data)
+
+    def find(self, text_id, tag=None):
+        """Returns the offsets of the recordings of a text, oldest first."""
+        offsets = [entry.offset for entry in self.index()
+                   if entry.text_id == text_id]
+        if tag is None:
+            return offsets
+
+        was_open = self._map is not None
+        self.open()
+        try:
+            return [offset for offset in offsets
+                    if self.read(offset).tag == tag]
+        finally:
+            if not was_open:
+                self.close()
+
+    def open(self):
+        """Memory maps the log for reading. Entries appended later are not
+        seen until it is opened again."""
+        if self._map is None:
+            self._file = open(self.filename, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Unmaps the log. Recordings that were read become invalid."""
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Recordings still refer to it, so it is unmapped when they
+                # are garbage collected
+                pass
+            self._file.close()
+        self._map = None
+        self._file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, error_type, error_value, error_traceback):
+        self.close()
+
+    def _header(self, data, offset):
+        try:
+            magic, version, micros, text_id, count, tag_length, codes = (
+                HEADER.unpack_from(data, offset))
+        except struct.error:
+            raise WpmError("Truncated entry in %s" % self.filename)
+        if magic != MAGIC or version != VERSION:
+            raise WpmError("Corrupt entry in %s at offset %d" % (
+                self.filename, offset))
+        return version, micros, text_id, count, tag_length, codes.decode(
+            "ascii")
+
+    def _entry_size(self, data, offset):
+        _, _, _, count, tag_length, codes = self._header(data, offset)
+        return (HEADER.size + tag_length +
+                count*sum(itemsize(code) for code in codes))
+
+    def read(self, offset):
+        """Returns the ``Recording`` at the given offset of an open log."""
+        _, micros, text_id, count, tag_length, codes = self._header(
+            self._map, offset)
+        position = offset + HEADER.size
+        tag = self._map[position:position + tag_length].decode("utf-8")
+        position += tag_length
+
+        # Columns are used in place where memoryview can cast them, and
+        # copied otherwise, as on Python 2
+        view = None
+        if sys.byteorder == "little" and hasattr(memoryview, "cast"):
+            view = memoryview(self._map)
+
+        columns = []
+        for code in codes:
+            size = count*itemsize(code)
+            if view is not None:
+                columns.append(view[position:position + size].cast(code))
+            else:
+                columns.append(unpack(self._map[position:position + size],
+                                      code))
+            position += size
+
+        return Recording(from_micros(micros), text_id, tag or None, *columns)
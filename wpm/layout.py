@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Word wrapping of quotes and the screen position of every offset into them.
+
+A layout is computed in a single pass over the text into compact arrays, and
+recently used layouts are kept in a small cache keyed by text ID and width,
+so browsing back and forth between quotes or resizing the terminal to a size
+it has had before does not compute them again.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import array
+import collections
+
+# Number of layouts to keep in the cache
+CACHE_SIZE = 32
+
+
+def word_wrap(text, width):
+    """Returns the start offsets and lengths of lines that can be printed
+    without wrapping.
+
+    Lines are broken at the last space that fits. The space itself is not
+    part of either line. If a line has no space to break at, the rest of the
+    text is kept as one line.
+    """
+    starts = array.array("i")
+    lengths = array.array("i")
+
+    start = 0
+    while len(text) - start > width:
+        end = text.rfind(" ", start, start + width + 1)
+        if end == -1:
+            break
+        starts.append(start)
+        lengths.append(end - start)
+        start = end + 1
+
+    if start < len(text):
+        starts.append(start)
+        lengths.append(len(text) - start)
+
+    return starts, lengths
+
+
+class Layout(object):
+    """Line breaks of a text and the (x, y) position of each offset into it,
+    including the one just past the end.
+
+    The space a line was broken at is placed just after the end of the line.
+    """
+    def __init__(self, text, width):
+        self.width = width
+        self.length = len(text)
+        self.starts, self.lengths = word_wrap(text, width)
+
+        self.xs = array.array("i")
+        self.ys = array.array("i")
+        for y_pos, length in enumerate(self.lengths):
+            self.xs.extend(range(length + 1))
+            self.ys.extend([y_pos] * (length + 1))
+
+        # Offsets past the last line continue on it
+        last = max(len(self.lengths) - 1, 0)
+        covered = len(self.xs)
+        for offset in range(covered, len(text) + 1):
+            self.xs.append(offset - covered)
+            self.ys.append(last)
+
+    def __repr__(self):
+        return "<Layout: width=%d length=%d lines=%d>" % (
+                self.width, self.length, len(self))
+
+    def __len__(self):
+        """Returns the number of lines."""
+        return len(self.lengths)
+
+    def __getitem__(self, offset):
+        """Returns the (x, y) position of an offset."""
+        return self.xs[offset], self.ys[offset]
+
+    def lines(self, text, first=0, last=None):
+        """Yields lines ``first`` up to ``last`` of the text this layout was
+        made for."""
+        if last is None:
+            last = len(self)
+        for y_pos in range(first, min(last, len(self))):
+            start = self.starts[y_pos]
+            yield text[start:start + self.lengths[y_pos]]
+
+
+class LayoutCache(object):
+    """Least recently used cache of layouts, keyed by text ID and width."""
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.layouts = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.layouts)
+
+    def get(self, text_id, text, width):
+        """Returns the layout of a text, computing it if it is not cached."""
+        key = (text_id, width)
+        layout = self.layouts.pop(key, None)
+        if layout is None or layout.length != len(text):
+            layout = Layout(text, width)
+        self.layouts[key] = layout
+        while len(self.layouts) > self.size:
+            self.layouts.popitem(last=False)
+        return layout
+
+
+_cache = LayoutCache()
+
+
+def layout(text_id, text, width):
+    """Returns the cached layout of a quote."""
+    return _cache.get(text_id, text, width)
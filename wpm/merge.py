@@ -0,0 +1,200 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Streaming k-way merge of several score history files.
+
+Every input is read as a stream in time order, so memory use does not depend
+on the size of the files. Files that are sorted newest first, like some
+exports, are read backwards.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import csv
+import heapq
+import itertools
+import os
+import sys
+
+from wpm.error import WpmError
+from wpm.stats import Rollup, Stats
+from wpm.summary import Summary
+
+
+def reversed_lines(filename, block_size=1 << 16):
+    """Yields the lines of a file from the last to the first."""
+    with open(filename, "rb") as file_obj:
+        file_obj.seek(0, os.SEEK_END)
+        position = file_obj.tell()
+        rest = b""
+
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            file_obj.seek(position)
+            lines = (file_obj.read(size) + rest).split(b"\n")
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8")
+
+        if rest:
+            yield rest.decode("utf-8")
+
+
+def timestamp(item):
+    """Returns the timestamp of a (tag, game or ``Rollup``) pair."""
+    game = item[1]
+    return game.timestamp if isinstance(game, Rollup) else game[6]
+
+
+def is_descending(filename):
+    """Checks if a stats file is sorted newest first."""
+    first = list(itertools.islice(Stats.iter_rows(filename), 2))
+    return len(first) == 2 and timestamp(first[0]) > timestamp(first[1])
+
+
+def sorted_rows(filename):
+    """Yields the (tag, game) pairs of a file in time order.
+
+    Raises:
+        WpmError: If the file is not sorted by time.
+    """
+    if is_descending(filename):
+        if sys.version_info.major >= 3:
+            rows = Stats.parse_rows(csv.reader(reversed_lines(filename)))
+        else:
+            rows = Stats.parse_rows(csv.reader(
+                line.encode("utf-8") for line in reversed_lines(filename)))
+    else:
+        rows = Stats.iter_rows(filename)
+
+    previous = None
+    for item in rows:
+        current = timestamp(item)
+        if previous is not None and current < previous:
+            raise WpmError("%s is not sorted by time" % filename)
+        previous = current
+        yield item
+
+
+def identity(item):
+    """Returns what makes two races the same race."""
+    tag, game = item
+    if isinstance(game, Rollup):
+        return tag, game.text_id, game.count, game.wpm.total
+    return game[5], game[1]
+
+
+def merge_sources(iterables):
+    """Merges time ordered (tag, game) iterables, marking duplicates.
+
+    Races are the same if they have the same timestamp, text ID and WPM.
+    Since the input is ordered by time, only the races sharing the current
+    timestamp need to be remembered. The first input a race is found in keeps
+    it.
+
+    Yields:
+        (input number, (tag, game), is duplicate) triples in time order.
+    """
+    def decorate(number, iterable):
+        # Ties are broken by input and position, never by comparing races
+        for position, item in enumerate(iterable):
+            yield timestamp(item), number, position, item
+
+    current = None
+    seen = set()
+    decorated = [decorate(n, iterable) for n, iterable in enumerate(iterables)]
+
+    for when, number, _, item in heapq.merge(*decorated):
+        if when != current:
+            current = when
+            seen.clear()
+
+        key = identity(item)
+        yield number, item, key in seen
+        seen.add(key)
+
+
+def merge_rows(iterables):
+    """Merges time ordered (tag, game) iterables, skipping duplicates.
+
+    Yields:
+        (tag, game) pairs in time order.
+    """
+    for _, item, duplicate in merge_sources(iterables):
+        if not duplicate:
+            yield item
+
+
+def write_merged(iterables, output, summaries=None):
+    """Merges time ordered (tag, game) iterables into the output file.
+
+    The merged file and its summary are written in a single streaming pass.
+    Where ``summaries`` has a ``Summary`` for an input, its aggregates and
+    sketches are merged instead of being rebuilt from its races. If an input
+    with a summary shares races with an earlier input, the summary is rebuilt
+    from the output file, since those races would be counted twice.
+
+    Returns:
+        The number of races written.
+    """
+    if summaries is None:
+        summaries = [None]*len(iterables)
+
+    summary = Summary()
+    counter = [0]
+    overlap = [False]
+
+    def count(rows):
+        for number, (tag, game), duplicate in rows:
+            if duplicate:
+                overlap[0] = overlap[0] or summaries[number] is not None
+                continue
+
+            if summaries[number] is not None:
+                summary.add_recent(tag, game)
+            elif isinstance(game, Rollup):
+                summary.add_rollup(tag, game)
+            else:
+                summary.add_game(tag, game)
+
+            counter[0] += game.count if isinstance(game, Rollup) else 1
+            yield tag, game
+
+    try:
+        Stats.write_rows(output, count(merge_sources(iterables)))
+    except ValueError as error:
+        raise WpmError("Could not merge stats files: %s" % error)
+
+    if overlap[0]:
+        summary = Summary.build(Stats.iter_rows(output))
+    else:
+        for other in summaries:
+            if other is not None:
+                summary.merge(other)
+
+    summary.save(output)
+    return counter[0]
+
+
+def merge_files(filenames, output):
+    """Merges stats files into output, which may be one of the inputs.
+
+    The summaries of the inputs are used where they are up to date, and the
+    rest are rebuilt from their races.
+
+    Returns:
+        The number of races written.
+    """
+    # Loaded before the output, which may be one of them, is overwritten
+    summaries = [Summary.load(filename) for filename in filenames]
+    return write_merged([sorted_rows(filename) for filename in filenames],
+                        output, summaries)
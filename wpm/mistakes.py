@@ -0,0 +1,175 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Where in each quote you make mistakes.
+
+Every race records the text offsets of its typos and of the characters that
+were erased with backspace. They are added to per-offset counters for each
+tag and quote in a ``dbm`` database, so that quotes can be shaded by how
+often you have stumbled on each part of them. Only the offsets that have
+been mistyped are stored, so adding a race costs as much as the number of
+such offsets, not the length of the quote.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import struct
+
+try:
+    import dbm
+except ImportError:
+    import anydbm as dbm
+
+from wpm.journal import locked
+from wpm.keylog import pack, unpack
+from wpm.summary import tag_name
+
+# Number of races, length of the text, and number of offsets with typos and
+# with corrections
+HEADER = struct.Struct("<IIII")
+
+# Typos per race at an offset for it to be shaded at each level
+LEVELS = (0.0, 0.1, 0.25)
+
+
+def pack_counts(counts):
+    """Returns a dict of offsets to counts packed for storage."""
+    offsets = sorted(counts)
+    return pack(offsets, "I") + pack([counts[offset] for offset in offsets],
+                                     "I")
+
+
+def unpack_counts(data, size):
+    """Returns a dict of ``size`` offsets to counts from ``pack_counts``
+    output."""
+    offsets = unpack(data[:4*size], "I")
+    counts = unpack(data[4*size:8*size], "I")
+    return dict(zip(offsets, counts))
+
+
+class Mistakes(object):
+    """Per-offset counts of typos and corrections for a single quote.
+
+    The counts are dicts keyed by the offsets with at least one.
+    """
+    def __init__(self, length, races=0, errors=None, corrections=None):
+        self.length = length
+        self.races = races
+        self.errors = errors if errors is not None else {}
+        self.corrections = corrections if corrections is not None else {}
+
+    def __repr__(self):
+        return "<Mistakes: races=%d errors=%d corrections=%d>" % (
+                self.races, sum(self.errors.values()),
+                sum(self.corrections.values()))
+
+    def add(self, errors, corrections):
+        """Adds the offsets of the typos and corrections of a race."""
+        self.races += 1
+        for counts, offsets in ((self.errors, errors),
+                                (self.corrections, corrections)):
+            for offset in offsets:
+                if 0 <= offset < self.length:
+                    counts[offset] = counts.get(offset, 0) + 1
+
+    def level(self, offset):
+        """Returns how much to shade an offset, from 0 (not at all) to
+        ``len(LEVELS)``."""
+        if not self.races:
+            return 0
+        density = float(self.errors.get(offset, 0)) / self.races
+        return sum(1 for threshold in LEVELS if density > threshold)
+
+    def runs(self):
+        """Returns (offset, length, level) for each run of offsets that are
+        shaded at the same level."""
+        runs = []
+        for offset in sorted(self.errors):
+            level = self.level(offset)
+            if not level:
+                continue
+            if runs:
+                start, count, previous = runs[-1]
+                if start + count == offset and previous == level:
+                    runs[-1] = (start, count + 1, level)
+                    continue
+            runs.append((offset, 1, level))
+        return runs
+
+    def to_bytes(self):
+        """Returns the counters packed for storage."""
+        return b"".join((HEADER.pack(self.races, self.length,
+                                     len(self.errors), len(self.corrections)),
+                         pack_counts(self.errors),
+                         pack_counts(self.corrections)))
+
+    @staticmethod
+    def from_bytes(data):
+        """Creates counters from ``to_bytes`` output, or returns None if the
+        data is not in that format."""
+        if len(data) < HEADER.size:
+            return None
+        races, length, errors, corrections = HEADER.unpack_from(data)
+        if len(data) != HEADER.size + 8*(errors + corrections):
+            return None
+        data = data[HEADER.size:]
+        return Mistakes(length, races, unpack_counts(data, errors),
+                        unpack_counts(data[8*errors:], corrections))
+
+
+class MistakeLog(object):
+    """Persistent per-tag and per-quote ``Mistakes``."""
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __repr__(self):
+        return "<MistakeLog: %s>" % self.filename
+
+    @staticmethod
+    def _key(tag, text_id):
+        return (u"%s\x00%d" % (tag_name(tag), text_id)).encode("utf-8")
+
+    def add(self, tag, text_id, length, errors, corrections):
+        """Adds the offsets of the typos and corrections of a race."""
+        key = self._key(tag, text_id)
+        with locked(self.filename):
+            database = dbm.open(self.filename, "c")
+            try:
+                mistakes = None
+                if key in database:
+                    mistakes = Mistakes.from_bytes(database[key])
+                if mistakes is None or mistakes.length != length:
+                    # The quote has changed since it was last typed
+                    mistakes = Mistakes(length)
+                mistakes.add(errors, corrections)
+                database[key] = mistakes.to_bytes()
+            finally:
+                database.close()
+        return mistakes
+
+    def get(self, tag, text_id, length=None):
+        """Returns the ``Mistakes`` of a quote, or None."""
+        try:
+            with locked(self.filename):
+                database = dbm.open(self.filename, "r")
+                try:
+                    data = database.get(self._key(tag, text_id))
+                finally:
+                    database.close()
+        except dbm.error:
+            return None
+
+        if data is None:
+            return None
+        mistakes = Mistakes.from_bytes(data)
+        if mistakes is None or (length is not None and
+                                mistakes.length != length):
+            return None
+        return mistakes
@@ -11,38 +11,147 @@ source software.
 The quotes database is *not* covered by the AGPL!
 """
 
-import collections
+import array
+import bisect
+import sys
+import time
+
+try:
+    from time import perf_counter_ns as clock_ns
+except ImportError:
+    def clock_ns():
+        """Returns a monotonic clock in integer nanoseconds."""
+        clock = getattr(time, "perf_counter", time.time)
+        return int(clock() * 1e9)
+
+# Number of keystrokes to preallocate room for
+CAPACITY = 1024
+
+try:
+    TIMESTAMP_TYPE = array.array("q").typecode
+except ValueError:
+    # Python 2 arrays have no 64-bit integers on all platforms, but doubles
+    # still hold the nanosecond clock to well within a microsecond
+    TIMESTAMP_TYPE = "d"
+
+# Keys that are not single characters are encoded as negative numbers
+KEY_NAMES = ("KEY_BACKSPACE", "KEY_LEFT", "KEY_RIGHT", "KEY_RESIZE",
+             "KEY_ENTER")
+UNKNOWN_KEY = -1
+
+_KEY_CODES = dict((name, -2 - index) for index, name in enumerate(KEY_NAMES))
+
+
+def encode_key(key):
+    """Returns an integer code for a key as returned by ``Screen.get_key``."""
+    if len(key) == 1:
+        return ord(key)
+    return _KEY_CODES.get(key, UNKNOWN_KEY)
+
+
+def decode_key(code):
+    """Returns the key for a code from ``encode_key``, or None if it was
+    not known."""
+    if code >= 0:
+        if sys.version_info.major >= 3:
+            return chr(code)
+        return unichr(code)  # pylint: disable=undefined-variable
+    if code == UNKNOWN_KEY:
+        return None
+    return KEY_NAMES[-2 - code]
+
 
 class Recorder(object):
-    """Class for recording keystrokes."""
-    def __init__(self):
-        self.reset()
+    """Class for recording keystrokes.
 
-    def add(self, elapsed, key, position, incorrect):
-        """Adds a time stamp."""
-        self.elapsed.append(elapsed)
-        self.keys.append(key)
-        self.position.append((position, incorrect))
+    Keystrokes are stored column-wise in preallocated arrays, with timestamps
+    in nanoseconds from ``clock_ns`` and keys encoded by ``encode_key``. The
+    arrays are only grown, by doubling, when they fill up.
+    """
+    def __init__(self, capacity=CAPACITY):
+        self.count = 0
+        self.timestamps = array.array(TIMESTAMP_TYPE, [0]) * capacity
+        self.keys = array.array("i", [0]) * capacity
+        self.positions = array.array("i", [0]) * capacity
+        self.incorrects = array.array("i", [0]) * capacity
+
+    def add(self, timestamp, key, position, incorrect):
+        """Adds a keystroke, timestamped in nanoseconds."""
+        index = self.count
+        if index == len(self.timestamps):
+            self._grow()
+        self.timestamps[index] = timestamp
+        self.keys[index] = encode_key(key)
+        self.positions[index] = position
+        self.incorrects[index] = incorrect
+        self.count = index + 1
+
+    def _grow(self):
+        for column in (self.timestamps, self.keys, self.positions,
+                       self.incorrects):
+            column.extend(column)
 
     def reset(self):
-        """Destroys all time stamps."""
-        self.elapsed = collections.deque()
-        self.keys = collections.deque()
-        self.position = collections.deque()
+        """Destroys all time stamps, keeping the allocated space."""
+        self.count = 0
+
+    def elapsed(self, index):
+        """Returns the seconds from the first keystroke to the given one."""
+        return (self.timestamps[index] - self.timestamps[0]) * 1e-9
 
     def __getitem__(self, index):
-        elapsed = self.elapsed[index]
-        key = self.keys[index]
-        position, incorrect = self.position[index]
-        return elapsed, key, position, incorrect
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Recorder index out of range")
+        return (self.elapsed(index), decode_key(self.keys[index]),
+                self.positions[index], self.incorrects[index])
 
     def __len__(self):
-        return len(self.elapsed)
+        return self.count
 
 class Playback(object):
-    def __init__(self, recorder):
+    """Replays a recording against the clock.
+
+    The recording can be a ``Recorder`` or anything else that yields
+    (seconds, key, position, incorrect) tuples. The offset into the text
+    after each keystroke is precomputed, so finding where the recording was
+    at a given time is a binary search.
+    """
+    def __init__(self, recorder, length=None):
         self.recorder = recorder
         self.index = 0
+        self.times = array.array("d")
+        self.offsets = array.array("i")
+
+        strokes = list(recorder)
+        for index, (elapsed, _, position, _) in enumerate(strokes):
+            if index + 1 < len(strokes):
+                offset = strokes[index + 1][2]
+            elif length is not None:
+                offset = length
+            else:
+                offset = position + 1
+
+            if not self.offsets or offset != self.offsets[-1]:
+                self.times.append(elapsed)
+                self.offsets.append(offset)
+
+    def __len__(self):
+        return len(self.times)
+
+    def offset(self, elapsed):
+        """Returns how far into the text the recording was after the given
+        number of seconds."""
+        index = bisect.bisect_right(self.times, elapsed)
+        if not index:
+            return 0
+        return self.offsets[index - 1]
+
+    @property
+    def duration(self):
+        """Returns the seconds from the first to the last keystroke."""
+        return self.times[-1] if self.times else 0.0
 
     def next(self):
         values = self.recorder[self.index]
@@ -0,0 +1,155 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Draws a running race, only touching the parts of the screen that changed.
+
+The renderer remembers the header, prompt, progress and ghost it last drew.
+For each frame it compares them with the new state, redraws only the cells
+that differ, and only updates the terminal if anything was drawn at all. When
+the cursor moves off the visible lines of a long quote, the quote is scrolled
+and its new lines are drawn.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+from wpm.screen import Screen
+
+
+def changed_span(old, new):
+    """Returns the (start, end) slice where two strings differ, padding the
+    shorter one with spaces, or None if they are equal."""
+    length = max(len(old), len(new))
+    old = old.ljust(length)
+    new = new.ljust(length)
+    if old == new:
+        return None
+
+    start = 0
+    while old[start] == new[start]:
+        start += 1
+    end = length
+    while old[end - 1] == new[end - 1]:
+        end -= 1
+    return start, end
+
+
+class Renderer(object):
+    """Damage-tracking drawing of a race on a ``Screen``."""
+    def __init__(self, screen):
+        self.screen = screen
+        self.header = None
+        self.prompt = None
+        self.progress = None
+        self.ghost = None
+        self.damaged = True
+        self.invalidate()
+
+    def invalidate(self):
+        """Forgets what was drawn, after the screen was drawn some other
+        way."""
+        self.header = None
+        self.prompt = None
+        self.progress = None
+        self.ghost = None
+        self.damaged = True
+
+    def show_header(self, text):
+        """Draws the top bar, writing only the characters that changed."""
+        if self.header is None:
+            self.screen.update_header(text)
+        else:
+            span = changed_span(self.header, text)
+            if span is None:
+                return
+            start, end = span
+            self.screen.addstr(start, 0, text.ljust(end)[start:end],
+                               Screen.COLOR_STATUS)
+        self.header = text
+        self.damaged = True
+
+    def show_prompt(self, text):
+        """Draws the prompt, writing only the characters that changed."""
+        if self.prompt is None:
+            self.screen.clear_prompt()
+            span = (0, len(text))
+        else:
+            span = changed_span(self.prompt, text)
+            if span is None:
+                return
+        start, end = span
+        self.screen.addstr(start, self.screen.cheight,
+                           text.ljust(end)[start:end].encode(
+                               self.screen.encoding),
+                           Screen.COLOR_PROMPT)
+        self.prompt = text
+        self.damaged = True
+
+    def show_progress(self, position, incorrect):
+        """Colors the characters whose state changed since the last frame.
+
+        If nothing was drawn since the quote was rendered, all characters up
+        to the current one are colored.
+        """
+        old_position, old_incorrect = self.progress or (0, 0)
+        end = position + incorrect
+        old_end = old_position + old_incorrect
+        if self.progress is not None and (position, incorrect) == self.progress:
+            return
+
+        low = min(position, old_position)
+        high = min(max(end, old_end), len(self.screen.quote))
+        self.screen.show_progress(low, high, position, incorrect)
+        if self.ghost is not None and low <= self.ghost <= high:
+            # The ghost was painted over
+            self.ghost = None
+        self.progress = (position, incorrect)
+        self.damaged = True
+
+    def show_ghost(self, offset, position, incorrect):
+        """Moves the ghost cursor if it has moved or was painted over."""
+        if offset == self.ghost:
+            return
+        self.screen.show_ghost(offset, self.ghost, position, incorrect)
+        self.ghost = offset
+        self.damaged = True
+
+    def show_race(self, head, position, incorrect, typed, ghost=None):
+        """Draws a frame of a running race.
+
+        Args:
+            head: The top bar.
+            position: Number of characters typed correctly.
+            incorrect: Number of characters typed incorrectly after them.
+            typed: The text in the prompt.
+            ghost: The offset of the ghost cursor, or None.
+        """
+        self.show_header(head)
+        if self.screen.scroll_to(position + incorrect):
+            self.screen.update_quote(Screen.COLOR_QUOTE)
+            self.progress = None
+            self.ghost = None
+            self.damaged = True
+        if position + incorrect <= len(self.screen.quote):
+            self.show_progress(position, incorrect)
+            self.show_prompt("> " + typed)
+        if ghost is not None:
+            self.show_ghost(ghost, position, incorrect)
+
+        # Move cursor to current position in text before refreshing
+        xpos, ypos = self.screen.quote_coords[position + incorrect]
+        self.screen.set_cursor(min(xpos, self.screen.quote_columns - 1),
+                               2 + ypos - self.screen.quote_top)
+
+    def refresh(self):
+        """Sends what was drawn to the terminal, if anything."""
+        if not self.damaged:
+            return
+        self.screen.refresh()
+        self.damaged = False
@@ -17,12 +17,17 @@ import locale
 import os
 import sys
 
+from wpm.bootstrap import cached_interval
 from wpm.config import Config
 from wpm.convert import wpm_to_cpm
 from wpm.error import WpmError
 from wpm.gauss import confidence_interval, prediction_interval
-from wpm.histogram import histogram, plot
-import wpm.devfeature as devfeature
+from wpm.histogram import plot
+from wpm.layout import Layout, layout
+
+# Number of terminal lines kept free for the header, author and prompt when a
+# quote is too long to be shown in full
+QUOTE_MARGIN = 8
 
 class Screen(object):
     """Renders the terminal screen."""
@@ -36,6 +41,9 @@ class Screen(object):
     COLOR_QUOTE = 7
     COLOR_STATUS = 8
 
+    # Attributes for each level of error density, from ``wpm.mistakes``
+    COLOR_HEAT = ()
+
     def __init__(self, monochrome):
         self.config = Config()
 
@@ -77,7 +85,8 @@ class Screen(object):
 
             self.window = curses.newwin(self.lines, self.columns, 0, 0)
             self.window.keypad(True)
-            self.window.timeout(self.config.curses.window_timeout)
+            # Keys are only read once the game loop has seen input arrive
+            self.window.nodelay(True)
             self.window.bkgd(" ", Screen.COLOR_BACKGROUND)
 
 
@@ -89,58 +98,40 @@ class Screen(object):
             self.quote_author = ""
             self.quote_columns = 0
             self.quote_coords = tuple()
+            self.quote_heat = tuple()
             self.quote_height = 0
             self.quote_id = 0
             self.quote_lengths = tuple()
             self.quote_title = ""
-        except:
-            curses.endwin()
-            raise
-
-    @staticmethod
-    def _word_wrap(text, width):
-        """Returns lengths of lines that can be printed without wrapping."""
-        lengths = []
-        while len(text) > width:
-            try:
-                end = text[:width + 1].rindex(" ")
-            except ValueError:
-                break
-
-            # We can't divide the input nicely, so just display it as-is
-            if end == -1:
-                return [len(text)]
-
-            lengths.append(end)
-            text = text[end + 1:]
-
-        if text:
-            lengths.append(len(text))
-
-        return lengths
-
-    @staticmethod
-    def _screen_coords(lengths, position):
-        """Translates quote offset into screen coordinates.
 
-        Args:
-            lengths: List of line lengths for the word-wrapped quote.
-            position: Offset into the quote that we want to translate to screen
-                      coordinates.
+            # The visible lines of the quote are drawn in a pad, starting with
+            # line quote_top, and copied below the header on each refresh
+            self.pad = None
+            self.quote_top = 0
+            self.quote_view = 0
 
-        Returns:
-            Tuple containing X and Y screen coordinates.
-        """
-        y_position = 0
+            # A quote drawn ahead of time by prepare_quote, in its own pad
+            self.prepared = None
+            self.prepared_coords = None
+            self.spare_pad = None
 
-        for y_position, line_length in enumerate(lengths):
-            if position <= line_length:
-                break
-            position -= line_length + 1
-
-        return position, y_position
+            # Whether the pad holds the quote, as after preparing it
+            self.quote_drawn = False
 
+            # Where the cursor is put after a refresh, as (y, x)
+            self.cursor = (0, 0)
+        except:
+            curses.endwin()
+            raise
 
+    def terminal_size(self):
+        """Returns the number of lines and columns of the terminal, which
+        curses does not know about after a resize until ``resizeterm``."""
+        try:
+            size = os.get_terminal_size(sys.__stdout__.fileno())
+            return size.lines, size.columns
+        except (AttributeError, OSError, ValueError):
+            return self.window.getmaxyx()
 
     @property
     def columns(self):
@@ -192,6 +183,10 @@ class Screen(object):
             Screen.COLOR_QUOTE |= curses.A_BOLD
             Screen.COLOR_STATUS |= curses.A_BOLD
 
+        Screen.COLOR_HEAT = (Screen.COLOR_QUOTE | curses.A_UNDERLINE,
+                             Screen.COLOR_INCORRECT,
+                             Screen.COLOR_INCORRECT | curses.A_BOLD)
+
     @staticmethod
     def is_escape(key):
         """Checks for escape key."""
@@ -289,34 +284,73 @@ class Screen(object):
             if x_pos >= 0 and (x_pos + length) <= self.columns:
                 self.window.chgat(y_pos, x_pos, length, color)
 
+    def chgat_pad(self, x_pos, y_pos, length, color):
+        """Wraps call around chgat on the pad, for a line of the quote that
+        may not be visible."""
+        row = y_pos - self.quote_top
+        if self.quote_view > row >= 0:
+            if x_pos >= 0 and (x_pos + length) <= self.columns:
+                self.pad.chgat(row, x_pos, length, color)
+
     def set_cursor(self, x_pos, y_pos):
         """Sets cursor position."""
         if (y_pos < self.lines) and (x_pos < self.columns):
             self.window.move(y_pos, x_pos)
+            self.cursor = (y_pos, x_pos)
+
+    def refresh(self):
+        """Sends the window and the visible lines of the quote to the
+        terminal."""
+        self.window.noutrefresh()
+        if self.quote_view > 0:
+            self.pad.noutrefresh(0, 0, 2, 0, 1 + self.quote_view,
+                                 self.columns - 1)
+        curses.setsyx(*self.cursor)
+        curses.doupdate()
 
     def right_column(self, y_pos, x_pos, width, text):
         """Writes text to screen in coumns."""
-        lengths = Screen._word_wrap(text, width)
+        lines = Layout(text, width)
 
-        for cur_y, length in enumerate(lengths, y_pos):
-            self.addstr(x_pos - length, cur_y,
-                        text[:length].encode(self.encoding),
+        for cur_y, line in enumerate(lines.lines(text), y_pos):
+            self.addstr(x_pos - len(line), cur_y,
+                        line.encode(self.encoding),
                         Screen.COLOR_AUTHOR)
-            text = text[1+length:]
 
-        return len(lengths)
+        return len(lines)
+
+    def draw_quote(self, pad, text, coords, first, count, color):
+        """Draws ``count`` lines of a quote, from line ``first``, in a pad."""
+        pad.erase()
+        for row, line in enumerate(coords.lines(text, first, first + count)):
+            line = line.encode(self.encoding)
+            if len(line) < self.columns:
+                pad.addstr(row, 0, line, color)
 
     def update_quote(self, color):
-        """Renders complete quote on screen."""
-        quote = self.quote[:]
-        for y_pos, length in enumerate(self.quote_lengths, 2):
-            self.addstr(0, y_pos, quote[:length].encode(self.encoding), color)
-            quote = quote[1 + length:]
+        """Renders the visible lines of the quote."""
+        self.draw_quote(self.pad, self.quote, self.quote_coords,
+                        self.quote_top, self.quote_view, color)
+
+    def scroll_to(self, offset):
+        """Scrolls the quote so that the line of an offset is visible, with
+        the line before it if there is room.
+
+        Returns:
+            True if other lines are visible now, and must be drawn.
+        """
+        _, ypos = self.quote_coords[offset]
+        if self.quote_top <= ypos < self.quote_top + self.quote_view:
+            return False
+        margin = 1 if self.quote_view > 1 else 0
+        self.quote_top = max(0, min(ypos - margin,
+                                    self.quote_height - self.quote_view))
+        return True
 
     def update_author(self):
         """Renders author on screen."""
         author = u"— %s, %s" % (self.quote_author, self.quote_title)
-        self.cheight = 4 + self.quote_height
+        self.cheight = 4 + self.quote_view
         self.cheight += self.right_column(self.cheight - 1,
                                           self.quote_columns - 10,
                                           self.quote_columns // 2,
@@ -328,29 +362,79 @@ class Screen(object):
         self.chgat(0, 0, self.columns, Screen.COLOR_STATUS)
         #self.window.chgat(0, 0, self.columns, Screen.COLOR_STATUS)
 
+    def wrap_columns(self):
+        """Returns the width to wrap quotes at."""
+        if self.config.wpm.wrap_width > 0:
+            return min(self.columns, self.config.wpm.wrap_width)
+        return self.columns
+
+    def view_lines(self, coords):
+        """Returns how many lines of a quote laid out as given are shown.
+        Long quotes scroll, so only as many lines as fit are drawn."""
+        return min(len(coords), max(1, self.lines - QUOTE_MARGIN))
+
+    def make_pad(self, pad, lines):
+        """Returns the given pad, or a new one if it does not have room for
+        the given number of lines."""
+        size = (max(lines, 1), self.columns)
+        if pad is None or pad.getmaxyx() != size:
+            pad = curses.newpad(*size)
+            pad.bkgd(" ", Screen.COLOR_BACKGROUND)
+        return pad
+
+    def prepare_quote(self, quote):
+        """Lays out a quote and draws it in a spare pad, so that setting it
+        next takes no time."""
+        coords = layout(quote.text_id, quote.text, self.wrap_columns() - 1)
+        lines = self.view_lines(coords)
+        self.spare_pad = self.make_pad(self.spare_pad, lines)
+        self.draw_quote(self.spare_pad, quote.text, coords, 0, lines,
+                        Screen.COLOR_QUOTE)
+        self.prepared = quote
+        self.prepared_coords = coords
+
     def set_quote(self, quote):
         """Sets up variables used for a new quote."""
         # TODO: Move this stuff elsewhere
-        if self.config.wpm.wrap_width > 0:
-            self.quote_columns = min(self.columns, self.config.wpm.wrap_width)
-        else:
-            self.quote_columns = self.columns
+        self.quote_columns = self.wrap_columns()
 
         self.cheight = 0
         self.quote = quote.text
         self.quote_author = quote.author
         self.quote_id = quote.text_id
         self.quote_title = quote.title
-        self.quote_lengths = tuple(Screen._word_wrap(self.quote,
-                                                     self.quote_columns - 1))
+
+        # The (x, y) position of each quote offset
+        self.quote_coords = layout(self.quote_id, self.quote,
+                                   self.quote_columns - 1)
+        self.quote_lengths = self.quote_coords.lengths
         self.quote_height = len(self.quote_lengths)
+        self.quote_heat = tuple()
 
-        # Remember (x, y) position for each quote offset.
-        self.quote_coords = []
-        for offset in range(len(self.quote)+1):
-            x_pos, y_pos = Screen._screen_coords(self.quote_lengths, offset)
-            self.quote_coords.append((x_pos, y_pos))
-        self.quote_coords = tuple(self.quote_coords)
+        self.quote_top = 0
+        self.quote_view = self.view_lines(self.quote_coords)
+
+        # The layout is the same object if it is still cached for this width
+        self.quote_drawn = (quote is self.prepared and
+                            self.quote_coords is self.prepared_coords)
+        if self.quote_drawn:
+            self.pad, self.spare_pad = self.spare_pad, self.pad
+        else:
+            self.pad = self.make_pad(self.pad, self.quote_view)
+            self.pad.erase()
+        self.prepared = None
+        self.prepared_coords = None
+
+    def replace_quote(self):
+        """Shows a quote set while racing, clearing what was drawn for the
+        previous one. A prepared quote is not drawn again."""
+        self.window.move(2, 0)
+        self.window.clrtobot()
+        if self.quote_drawn:
+            self.pad.touchwin()
+        else:
+            self.update_quote(Screen.COLOR_QUOTE)
+        self.update_author()
 
     def clear_prompt(self):
         self.set_cursor(0, self.cheight)
@@ -367,26 +451,66 @@ class Screen(object):
             return
         self.update_header(head)
         self.update_quote(Screen.COLOR_QUOTE)
+        self.show_heat()
         self.update_author()
         self.show_help()
         self.show_stats(stats, cpm_flag)
         self.set_cursor(0, 2)
         self.redraw = False
 
-    def show_histogram(self, stats):
-        results = stats.text_id_results(stats.tag, self.quote_id)
-        wpms = [x.wpm for x in results.results]
+    def set_heat(self, runs):
+        """Sets the (offset, length, level) runs to shade the quote with."""
+        self.quote_heat = tuple(runs)
+        self.redraw = True
+
+    def show_heat(self):
+        """Shades the quote by error density, with one ``chgat`` per run and
+        line."""
+        for offset, length, level in self.quote_heat:
+            color = Screen.COLOR_HEAT[min(level, len(Screen.COLOR_HEAT)) - 1]
+            self.chgat_quote(offset, length, color)
+
+    def chgat_quote(self, offset, length, color):
+        """Colors the visible part of the quote, with one ``chgat`` per screen
+        line."""
+        if self.quote_view == 0:
+            return
 
-        cols = self.columns // 4
-        low, width, histo = histogram(wpms, cols)
+        # Clip to the offsets on the visible lines
+        last = self.quote_top + self.quote_view - 1
+        if last == self.quote_height - 1:
+            end = len(self.quote) + 1
+        else:
+            end = self.quote_coords.starts[last + 1]
+        start = max(offset, self.quote_coords.starts[self.quote_top])
+        length = min(offset + length, end) - start
+        offset = start
+
+        while length > 0:
+            xpos, ypos = self.quote_coords[offset]
+            count = min(length, self.quote_lengths[ypos] - xpos)
+            if count <= 0:
+                # Skip the space the line was wrapped at
+                count = 1
+            else:
+                self.chgat_pad(xpos, ypos, count, color)
+            offset += count
+            length -= count
+
+    def show_histogram(self, stats, text_id):
+        """Shows the WPM histogram of a text."""
+        text = stats.summary.text(stats.tag, text_id)
+        if text is None or len(text.histogram) < 2:
+            return
 
-        line = "".join(plot(cols, low, width, histo))
+        histo = text.histogram
+        line = "".join(plot(*histo.render(self.columns // 4)))
 
         self.cheight += 2
         xpos = ((self.columns - len(line)) // 2) - 1
         color = Screen.COLOR_PROMPT
-        self.addstr(xpos - 6, self.cheight, "%5.1f" % min(wpms), color)
-        self.addstr(xpos + len(line) + 1, self.cheight, "%5.1f" % max(wpms), color)
+        self.addstr(xpos - 6, self.cheight, "%5.1f" % histo.low, color)
+        self.addstr(xpos + len(line) + 1, self.cheight, "%5.1f" % histo.high, color)
         self.addstr_u8(xpos, self.cheight, line, color)
 
     def show_help(self):
@@ -397,9 +521,11 @@ class Screen(object):
                     "Start typing, hit SPACE/ARROWS to browse or ESC to quit.",
                     Screen.COLOR_PROMPT)
 
-    def show_stats(self, stats, cpm_flag):
-        """Shows statistics for the current quote."""
-        results = stats.text_id_results(stats.tag, self.quote_id)
+    def show_stats(self, stats, cpm_flag, text_id=None):
+        """Shows statistics for a text, by default the current quote."""
+        if text_id is None:
+            text_id = self.quote_id
+        results = stats.text_id_results(stats.tag, text_id)
 
         if len(results) < 2:
             return
@@ -419,6 +545,16 @@ class Screen(object):
         acc_ci0, acc_ci1 = confidence_interval(acc_avg, acc_sd, samples, alpha)
         acc_pi0, acc_pi1 = prediction_interval(acc_avg, acc_sd, alpha)
 
+        method = self.config.wpm.interval
+        values = results.samples() if method != "normal" else None
+        if values is not None:
+            key = (stats.tag, text_id, samples)
+            resamples = self.config.wpm.bootstrap_samples
+            wpm_ci0, wpm_ci1 = cached_interval(key + ("wpm",), values[0],
+                                               alpha, method, resamples)
+            acc_ci0, acc_ci1 = cached_interval(key + ("accuracy",), values[1],
+                                               alpha, method, resamples)
+
         if cpm_flag:
             wpm_avg = wpm_to_cpm(wpm_avg)
             wpm_sd = wpm_to_cpm(wpm_sd)
@@ -446,10 +582,22 @@ class Screen(object):
         self.addstr(0, self.cheight, msg, Screen.COLOR_CORRECT)
         self.cheight += 1
 
-        if devfeature.histogram:
-            self.show_histogram(stats)
-
-    def show_score(self, head, wpm_score, stats, cpm_flag):
+        text = stats.summary.text(stats.tag, text_id)
+        if text is not None and len(text.digest) > 1:
+            digest = text.digest
+            values = [digest.quantile(q) for q in (0.5, 0.9, 0.99)]
+            last = text.last
+            if cpm_flag:
+                values = [wpm_to_cpm(value) for value in values]
+                last = wpm_to_cpm(last)
+            msg = "pct p50 %5.1f p90 %5.1f p99 %5.1f, last %5.1f at percentile %d" % (
+                    tuple(values) + (last, int(100*digest.rank(text.last))))
+            self.addstr(0, self.cheight, msg, Screen.COLOR_CORRECT)
+            self.cheight += 1
+
+        self.show_histogram(stats, text_id)
+
+    def show_score(self, head, wpm_score, stats, cpm_flag, text_id=None):
         """Show score screen after typing has finished."""
         if not self.redraw:
             return
@@ -471,37 +619,43 @@ class Screen(object):
                        Screen.COLOR_HISCORE)
 
         self.show_help()
-        self.show_stats(stats, cpm_flag)
+        self.show_stats(stats, cpm_flag, text_id)
         self.set_cursor(0, 2)
         self.redraw = False
 
-    def highlight_progress(self, position, incorrect):
-        """Colors finished and incorrectly typed parts of the quote."""
-        if incorrect:
-            color = Screen.COLOR_INCORRECT
-        else:
-            color = Screen.COLOR_CORRECT
-
-        # Highlight correct / incorrect character in quote
-        ixpos, iypos = self.quote_coords[position + incorrect - 1]
-        color = Screen.COLOR_INCORRECT if incorrect else Screen.COLOR_CORRECT
-        self.chgat(max(ixpos, 0), 2 + iypos, 1, color)
-
-        # Highlight next as correct, in case of backspace
-        xpos, ypos = self.quote_coords[position + incorrect]
-        self.chgat(xpos, 2 + ypos, 1, Screen.COLOR_QUOTE)
-
-    def show_keystroke(self, head, position, incorrect, typed, key):
-        """Updates the screen while typing."""
-        self.update_header(head)
-
-        if key and (position + incorrect) <= len(self.quote):
-            self.highlight_progress(position, incorrect)
-            self.update_prompt("> " + typed)
-
-        # Move cursor to current position in text before refreshing
-        xpos, ypos = self.quote_coords[position + incorrect]
-        self.set_cursor(min(xpos, self.quote_columns - 1), 2 + ypos)
+    def show_ghost(self, offset, previous, position, incorrect):
+        """Moves the ghost cursor from the previous offset to the given one,
+        restoring the color of the character it leaves."""
+        if previous is not None and offset != previous < len(self.quote):
+            if previous < position:
+                color = Screen.COLOR_CORRECT
+            elif previous < position + incorrect:
+                color = Screen.COLOR_INCORRECT
+            else:
+                color = Screen.COLOR_QUOTE
+            xpos, ypos = self.quote_coords[previous]
+            self.chgat_pad(xpos, ypos, 1, color)
+
+        if offset < len(self.quote):
+            xpos, ypos = self.quote_coords[offset]
+            if offset < position:
+                color = Screen.COLOR_CORRECT
+            else:
+                color = Screen.COLOR_QUOTE
+            self.chgat_pad(xpos, ypos, 1, color | curses.A_REVERSE)
+
+    def show_progress(self, low, high, position, incorrect):
+        """Colors the quote from offset ``low`` to ``high``, inclusive, by
+        what has been typed."""
+        end = position + incorrect
+        for start, stop, color in ((low, min(high + 1, position),
+                                    Screen.COLOR_CORRECT),
+                                   (max(low, position), min(high + 1, end),
+                                    Screen.COLOR_INCORRECT),
+                                   (max(low, end), high + 1,
+                                    Screen.COLOR_QUOTE)):
+            if stop > start:
+                self.chgat_quote(start, stop - start, color)
 
     def rerender_race(self, head):
         """Re-renders currently running game."""
@@ -515,6 +669,9 @@ class Screen(object):
         """Clears the screen."""
         self.redraw = True
         self.window.clear()
+        if self.pad is not None:
+            # The window is drawn over the quote, so copy it again
+            self.pad.touchwin()
 
     def deinit(self):
         """Deinitializes curses."""
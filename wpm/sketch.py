@@ -0,0 +1,201 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Mergeable streaming quantile sketch.
+
+This is the merging variant of Ted Dunning's t-digest. Values are buffered
+and merged into a bounded number of weighted centroids, which are small near
+the tails and larger around the median. Histories shorter than about a third
+of the compression factor are kept exactly.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import bisect
+import math
+
+COMPRESSION = 100
+
+
+class TDigest(object):
+    """Streaming quantile sketch with bounded memory.
+
+    Adding a value costs amortized O(log k) for k centroids, and quantile and
+    rank queries are O(log k).
+    """
+    def __init__(self, compression=COMPRESSION):
+        self.compression = compression
+        self.means = []
+        self.counts = []
+        self.buffer = []
+        self.count = 0
+        self.low = None
+        self.high = None
+
+        # Piecewise linear mapping between values and ranks, for queries
+        self._values = None
+        self._ranks = None
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "<TDigest: n=%d centroids=%d>" % (self.count, len(self.means))
+
+    def add(self, value, count=1):
+        """Adds a value, or ``count`` copies of it."""
+        self.buffer.append((value, count))
+        self.count += count
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+        self._values = None
+        if len(self.buffer) >= 5*self.compression:
+            self.compress()
+
+    def merge(self, other):
+        """Merges another digest into this one."""
+        if not other.count:
+            return
+        other.compress()
+        for mean, count in zip(other.means, other.counts):
+            self.buffer.append((mean, count))
+        self.count += other.count
+        if self.low is None or other.low < self.low:
+            self.low = other.low
+        if self.high is None or other.high > self.high:
+            self.high = other.high
+        self.compress()
+
+    def _scale(self, fraction):
+        """The k1 scale function, which bounds the size of the centroids."""
+        fraction = min(max(fraction, 0.0), 1.0)
+        return self.compression / (2.0*math.pi) * math.asin(2.0*fraction - 1.0)
+
+    def compress(self):
+        """Merges the buffered values into the centroids."""
+        self._values = None
+        if not self.buffer:
+            return
+
+        items = sorted(list(zip(self.means, self.counts)) + self.buffer)
+        self.buffer = []
+        self.means = []
+        self.counts = []
+
+        total = float(self.count)
+        below = 0
+        limit = self._scale(0.0) + 1.0
+        mean, count = items[0]
+
+        for item_mean, item_count in items[1:]:
+            if self._scale((below + count + item_count) / total) <= limit:
+                count += item_count
+                mean += (item_mean - mean) * item_count / float(count)
+            else:
+                self.means.append(mean)
+                self.counts.append(count)
+                below += count
+                limit = self._scale(below / total) + 1.0
+                mean, count = item_mean, item_count
+
+        self.means.append(mean)
+        self.counts.append(count)
+
+    def _prepare(self):
+        if self._values is not None:
+            return
+        self.compress()
+
+        # Each centroid sits at the middle of the ranks it covers
+        values = []
+        ranks = []
+        if self.low < self.means[0]:
+            values.append(self.low)
+            ranks.append(0.0)
+
+        below = 0.0
+        for mean, count in zip(self.means, self.counts):
+            values.append(mean)
+            ranks.append(below + count / 2.0)
+            below += count
+
+        if self.high > self.means[-1]:
+            values.append(self.high)
+            ranks.append(float(self.count))
+
+        self._values = values
+        self._ranks = ranks
+
+    def quantile(self, fraction):
+        """Returns the value at the given fraction from 0 to 1."""
+        if not self.count:
+            return 0.0
+        self._prepare()
+
+        rank = min(max(fraction, 0.0), 1.0) * self.count
+        values, ranks = self._values, self._ranks
+
+        index = bisect.bisect_right(ranks, rank)
+        if index == 0:
+            return values[0]
+        if index == len(ranks):
+            return values[-1]
+
+        span = ranks[index] - ranks[index - 1]
+        part = (rank - ranks[index - 1]) / span if span else 0.0
+        return values[index - 1] + (values[index] - values[index - 1]) * part
+
+    def rank(self, value):
+        """Returns the fraction from 0 to 1 of values below the given one,
+        counting equal values as half below."""
+        if not self.count:
+            return 0.0
+        self._prepare()
+
+        values, ranks = self._values, self._ranks
+        left = bisect.bisect_left(values, value)
+        right = bisect.bisect_right(values, value)
+
+        if left < right:
+            rank = (ranks[left] + ranks[right - 1]) / 2.0
+        elif left == 0:
+            rank = 0.0
+        elif left == len(values):
+            rank = float(self.count)
+        else:
+            part = ((value - values[left - 1]) /
+                    (values[left] - values[left - 1]))
+            rank = ranks[left - 1] + (ranks[left] - ranks[left - 1]) * part
+
+        return rank / self.count
+
+    def to_list(self, digits=2):
+        """Returns the digest as a compact, JSON-friendly list of the
+        compression, low and high values, followed by mean and count pairs."""
+        self.compress()
+        out = [self.compression, self.low, self.high]
+        for mean, count in zip(self.means, self.counts):
+            out.append(round(mean, digits))
+            out.append(count)
+        return out
+
+    @staticmethod
+    def from_list(values):
+        """Creates a digest from ``to_list`` output."""
+        digest = TDigest(values[0])
+        digest.low = values[1]
+        digest.high = values[2]
+        digest.means = list(values[3::2])
+        digest.counts = list(values[4::2])
+        digest.count = sum(digest.counts)
+        return digest
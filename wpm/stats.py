@@ -17,6 +17,8 @@ import datetime
 import math
 import os
 
+from wpm.summary import Aggregate, Summary, TAIL, tag_name
+
 class Timestamp(object):
     """Methods for dealing with timestamps."""
     DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
@@ -24,8 +26,16 @@ class Timestamp(object):
     @staticmethod
     def from_string(string):
         """Parses timestamp from string in ``Timestamp.DATETIME_FORMAT``."""
+        if "." not in string:
+            # str(datetime) leaves out the microseconds if they are zero
+            string += ".0"
         return datetime.datetime.strptime(string, Timestamp.DATETIME_FORMAT)
 
+    @staticmethod
+    def to_string(timestamp):
+        """Formats timestamp in ``Timestamp.DATETIME_FORMAT``."""
+        return timestamp.strftime(Timestamp.DATETIME_FORMAT)
+
     @staticmethod
     def now():
         """Returns current UTC time."""
@@ -52,11 +62,79 @@ class GameResult(object):
                 self.timestamp, self.wpm, self.accuracy, self.text_id)
 
 
+class Rollup(object):
+    """Aggregate of all races of one text on one day, for compacted history.
+
+    In the CSV file, a rollup is stored as a single row starting with
+    ``Rollup.MARKER``, followed by the day, text ID, database, tag and the
+    count, sum, sum of squares, min and max of WPM and accuracy.
+    """
+    MARKER = "rollup"
+
+    def __init__(self, timestamp, text_id, database, wpm=None, accuracy=None):
+        self.timestamp = timestamp
+        self.text_id = text_id
+        self.database = database
+        self.wpm = Aggregate() if wpm is None else wpm
+        self.accuracy = Aggregate() if accuracy is None else accuracy
+
+    def __repr__(self):
+        return "<Rollup: %s n=%d wpm=%.1f id=%d>" % (
+                self.timestamp.date(), self.count, self.wpm.mean, self.text_id)
+
+    @property
+    def count(self):
+        """Number of races in this rollup."""
+        return self.wpm.count
+
+    @property
+    def key(self):
+        """Races with the same key are folded into the same rollup."""
+        return self.timestamp.date(), self.text_id, self.database
+
+    @staticmethod
+    def for_game(game):
+        """Returns an empty rollup with the key of the given game."""
+        day = game[6].replace(hour=0, minute=0, second=0, microsecond=0)
+        return Rollup(day, game[5], game[7])
+
+    def add(self, game):
+        """Folds a game tuple into the rollup."""
+        self.wpm.add(game[1])
+        self.accuracy.add(game[2])
+
+    def merge(self, other):
+        """Folds another rollup into this one."""
+        self.wpm.merge(other.wpm)
+        self.accuracy.merge(other.accuracy)
+
+    def to_row(self, tag):
+        """Returns the CSV row for this rollup."""
+        return ([Rollup.MARKER, Timestamp.to_string(self.timestamp),
+                 self.text_id, self.database, tag] +
+                self.wpm.to_list() + self.accuracy.to_list()[1:])
+
+    @staticmethod
+    def parse_row(row):
+        """Converts a CSV rollup row to a (tag, rollup) pair."""
+        count = int(row[5])
+        wpm = Aggregate(count, *map(float, row[6:10]))
+        accuracy = Aggregate(count, *map(float, row[10:14]))
+        rollup = Rollup(Timestamp.from_string(row[1]), int(row[2]), row[3],
+                        wpm, accuracy)
+        return row[4], rollup
+
+
 class GameResults(object):
-    """Container for several GameResult objects."""
-    def __init__(self, tag, games):
+    """Container for several GameResult objects.
+
+    Compacted races are given as ``Rollup`` objects. They count towards the
+    aggregates, but are not yielded by ``results``.
+    """
+    def __init__(self, tag, games, rollups=None):
         self.tag = tag
         self.games = games
+        self.rollups = [] if rollups is None else rollups
 
     @property
     def results(self):
@@ -65,15 +143,42 @@ class GameResults(object):
             yield GameResult(game)
 
     def __repr__(self):
-        return "<GameResults: len=%d tag=%r>" % (len(self.games), self.tag)
+        return "<GameResults: len=%d tag=%r>" % (len(self), self.tag)
 
     def append(self, game):
         self.games.append(game)
 
     def __len__(self):
-        return len(self.games)
+        return len(self.games) + sum(rollup.count for rollup in self.rollups)
+
+    def aggregates(self):
+        """Returns a tuple of WPM and accuracy ``Aggregate`` objects."""
+        wpm = Aggregate()
+        accuracy = Aggregate()
+
+        for result in self.results:
+            wpm.add(result.wpm)
+            accuracy.add(result.accuracy)
+
+        for rollup in self.rollups:
+            wpm.merge(rollup.wpm)
+            accuracy.merge(rollup.accuracy)
+
+        return wpm, accuracy
+
+    def samples(self):
+        """Returns lists of WPMs and accuracies, or None if some of the
+        races have been compacted."""
+        if self.rollups:
+            return None
+        return ([game[1] for game in self.games],
+                [game[2] for game in self.games])
 
     def extremals(self):
+        if self.rollups:
+            wpm, accuracy = self.aggregates()
+            return wpm.low, wpm.high, accuracy.low, accuracy.high
+
         init = 999999
         min_wpm = init
         max_wpm = 0
@@ -95,6 +200,10 @@ class GameResults(object):
 
     def averages(self):
         """Returns a tuple of WPM and accuracy averages."""
+        if self.rollups:
+            wpm, accuracy = self.aggregates()
+            return wpm.mean, accuracy.mean
+
         if not self.games:
             return 0, 0
 
@@ -117,6 +226,10 @@ class GameResults(object):
         if samples <= 1:
             return 0.0, 0.0
 
+        if self.rollups:
+            wpm, accuracy = self.aggregates()
+            return wpm.stddev, accuracy.stddev
+
         wpm_sd = 0
         acc_sd = 0
 
@@ -132,21 +245,37 @@ class GameResults(object):
 
 class Stats(object):
     """Typing statistics"""
-    def __init__(self, current_tag=None, games=None):
+    def __init__(self, current_tag=None, games=None, summary=None,
+                 rollups=None):
         self.tag = current_tag
         if games is None:
             self.games = collections.defaultdict(list)
         else:
             self.games = games
+        if rollups is None:
+            self.rollups = collections.defaultdict(list)
+        else:
+            self.rollups = rollups
+        if summary is None:
+            self.summary = Summary.from_games(self.games, self.rollups)
+        else:
+            self.summary = summary
 
     def __repr__(self):
         return "<Stats: tag=%d current=%r>" % (len(self), self.tag)
 
     def results(self, tag=None, last_n=0):
-        """Returns the ``GameResults``."""
+        """Returns the ``GameResults``.
+
+        Compacted races are only included if ``last_n`` reaches past the
+        races that are still kept individually.
+        """
         if tag is None:
             tag = self.tag
-        return GameResults(tag, self.games[tag][-last_n:])
+        games = self.games[tag]
+        if last_n and last_n <= len(games):
+            return GameResults(tag, games[-last_n:])
+        return GameResults(tag, games[:], self.rollups[tag])
 
     def text_id_results(self, tag, text_id):
         results = GameResults(self.tag, [])
@@ -155,6 +284,10 @@ class Stats(object):
             if game[5] == text_id:
                 results.append(game)
 
+        for rollup in self.rollups[tag]:
+            if rollup.text_id == text_id:
+                results.rollups.append(rollup)
+
         return results
 
     def add(self, wpm, accuracy, text_id, database):
@@ -163,15 +296,19 @@ class Stats(object):
         rank = 1
         racers = 1
 
-        self.games[self.tag].append((
-            race,
-            wpm,
-            accuracy,
-            rank,
-            racers,
-            text_id,
-            Timestamp.now(),
-            database))
+        game = (race,
+                wpm,
+                accuracy,
+                rank,
+                racers,
+                text_id,
+                Timestamp.now(),
+                database)
+
+        self.games[self.tag].append(game)
+        self.summary.add_game(self.tag, game)
+
+        return game
 
     def average(self, tag=None, last_n=None):
         """Returns the average WPM."""
@@ -195,6 +332,72 @@ class Stats(object):
         """Returns tuple of keys and values for this dict-like object."""
         return self.games.items()
 
+    @staticmethod
+    def parse_row(row):
+        """Converts CSV row to a (tag, game) pair of internal types.
+
+        Compacted rows are returned as (tag, ``Rollup``) pairs.
+        """
+        if row[0] == Rollup.MARKER:
+            return Rollup.parse_row(row)
+
+        race = int(row[0])
+        wpm = float(row[1])
+        accuracy = float(row[2])
+        rank = int(row[3])
+        racers = int(row[4])
+        text_id = int(row[5])
+        timestamp = Timestamp.from_string(row[6])
+
+        # TypeRacer exports end with the timestamp
+        database = row[7] if len(row) > 7 else "typeracer"
+        tag = row[8] if len(row) > 8 else "Unspecified"
+
+        return tag, (race, wpm, accuracy, rank, racers, text_id, timestamp,
+                     database)
+
+    @staticmethod
+    def is_header(row):
+        """Checks for empty rows and column headings, which are skipped."""
+        return not row or not (row[0].isdigit() or row[0] == Rollup.MARKER)
+
+    @staticmethod
+    def parse_rows(reader):
+        """Yields (tag, game or ``Rollup``) pairs from CSV rows."""
+        for row in reader:
+            if not Stats.is_header(row):
+                yield Stats.parse_row(row)
+
+    @staticmethod
+    def iter_rows(filename):
+        """Yields (tag, game or ``Rollup``) pairs from a CSV file, in file
+        order."""
+        with open(filename, "rt") as file_obj:
+            for item in Stats.parse_rows(csv.reader(file_obj)):
+                yield item
+
+    @staticmethod
+    def write_rows(filename, rows):
+        """Writes (tag, game or ``Rollup``) pairs to a CSV file, numbering the
+        races in the order they are given."""
+        # Write to a temp file just in case we get an exception
+        with open(filename + ".tmp", "wt") as file_obj:
+            writer = csv.writer(file_obj)
+
+            race = 0
+            for tag, game in rows:
+                if isinstance(game, Rollup):
+                    # Skip race numbers so later races keep theirs
+                    race += game.count
+                    writer.writerow(game.to_row(tag_name(tag)))
+                    continue
+
+                # The timestamp is the race number, so use that instead.
+                race += 1
+                writer.writerow([race] + list(game[1:]) + [tag_name(tag)])
+
+        os.rename(filename + ".tmp", filename)
+
     @staticmethod
     def load(filename=None):
         """Loads stats from a CSV file."""
@@ -203,55 +406,77 @@ class Stats(object):
             filename = os.path.expanduser("~/.wpm.csv")
 
         games = collections.defaultdict(list)
+        rollups = collections.defaultdict(list)
         current_tag = None
 
-        def parse(row):
-            """Converts CSV row to internal types."""
-            race = int(row[0])
-            wpm = float(row[1])
-            accuracy = float(row[2])
-            rank = int(row[3])
-            racers = int(row[4])
-            text_id = int(row[5])
-            timestamp = Timestamp.from_string(row[6])
-            database = row[7]
-            tag = row[8]
-
-            return (race, wpm, accuracy, rank, racers, text_id, timestamp,
-                    database, tag)
+        for tag, game in Stats.iter_rows(filename):
+            if isinstance(game, Rollup):
+                rollups[tag].append(game)
+            else:
+                games[tag].append(game)
+            current_tag = tag
 
-        with open(filename, "rt") as file_obj:
-            reader = csv.reader(file_obj)
+        # Reuse the persisted summary if it still matches the CSV file
+        return Stats(current_tag, games, Summary.load(filename), rollups)
 
-            for row in reader:
-                result = parse(row)
-                tag = result[-1]
-                games[tag].append(result[:-1])
-                current_tag = tag
+    @staticmethod
+    def load_summary(filename):
+        """Returns the summary of a CSV file without loading all the games.
+
+        The summary sidecar is rebuilt in a single streaming pass if it is
+        missing or out of date.
+        """
+        summary = Summary.load(filename)
+        if summary is None:
+            summary = Summary.build(Stats.iter_rows(filename))
+            summary.save(filename)
+        return summary
+
+    def compact(self, cutoff, keep_last=TAIL):
+        """Folds races older than cutoff into per-day, per-text rollups.
+
+        The last ``keep_last`` races of each tag are always kept, so that the
+        "last n" statistics stay exact.
+
+        Returns:
+            The number of races that were folded into rollups.
+        """
+        folded = 0
+
+        for tag, games in self.games.items():
+            rollups = dict((rollup.key, rollup) for rollup in self.rollups[tag])
+            keep = []
+
+            for index, game in enumerate(games):
+                if game[6] >= cutoff or index >= len(games) - keep_last:
+                    keep.append(game)
+                    continue
+
+                rollup = Rollup.for_game(game)
+                rollup = rollups.setdefault(rollup.key, rollup)
+                rollup.add(game)
+                folded += 1
 
-        return Stats(current_tag, games)
+            games[:] = keep
+            self.rollups[tag] = sorted(rollups.values(),
+                                       key=lambda rollup: rollup.timestamp)
+
+        return folded
 
     def save(self, filename):
         """Writes game results to a CSV file compatible with the one from
         TypeRacer."""
         allgames = []
         for tag, games in self.items():
-            if tag is None:
-                tag = "Unspecified"
-
             for game in games:
-                allgames.append(list(game) + [tag])
+                allgames.append((game[6], tag, game))
 
-        by_time = lambda row: row[6]
-        games = sorted(allgames, key=by_time)
-
-        # Write to a temp file just in case we get an exception
-        with open(filename + ".tmp", "wt") as file_obj:
-            writer = csv.writer(file_obj)
+        for tag, rollups in self.rollups.items():
+            for rollup in rollups:
+                allgames.append((rollup.timestamp, tag, rollup))
 
-            for race, game in enumerate(games):
-                # The timestamp is the race number, so use that instead.
-                game[0] = 1 + race
-                writer.writerow(game)
+        by_time = lambda row: row[0]
+        games = sorted(allgames, key=by_time)
 
-        os.rename(filename + ".tmp", filename)
+        Stats.write_rows(filename, ((tag, game) for _, tag, game in games))
+        self.summary.save(filename)
@@ -0,0 +1,427 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Persisted summary of the score history, kept next to the CSV file.
+
+The summary holds mergeable aggregates, a quantile sketch and a tail window
+of recent races for each tag, which is everything ``wpm --stats`` needs, and a
+quantile sketch and histogram for each text typed with the tag. It is
+validated against the size and modification time of the CSV file it
+summarizes.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import collections
+import itertools
+import json
+import math
+import os
+
+from wpm.histogram import Histogram
+from wpm.sketch import TDigest
+
+# Number of most recent races kept per tag. Must be at least as large as the
+# biggest "last n" window shown by ``wpm --stats``.
+TAIL = 1000
+
+VERSION = 3
+
+# Per-text sketches hold few races each, so they can be coarser
+TEXT_COMPRESSION = 50
+
+
+def tag_name(tag):
+    """Returns the tag as it is written to the CSV file."""
+    return "Unspecified" if tag is None else tag
+
+
+def file_signature(filename):
+    """Returns the (size, mtime) pair used to validate the summary."""
+    stat = os.stat(filename)
+    mtime = getattr(stat, "st_mtime_ns", stat.st_mtime)
+    return stat.st_size, mtime
+
+
+class Aggregate(object):
+    """Mergeable count, sum, sum of squares, min and max of a series."""
+    __slots__ = ("count", "total", "squares", "low", "high")
+
+    def __init__(self, count=0, total=0.0, squares=0.0, low=None, high=None):
+        self.count = count
+        self.total = total
+        self.squares = squares
+        self.low = low
+        self.high = high
+
+    def add(self, value):
+        """Adds a single value."""
+        self.count += 1
+        self.total += value
+        self.squares += value*value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+    def merge(self, other):
+        """Merges another aggregate into this one."""
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+        if self.low is None or other.low < self.low:
+            self.low = other.low
+        if self.high is None or other.high > self.high:
+            self.high = other.high
+
+    @property
+    def mean(self):
+        """Returns the average value."""
+        if not self.count:
+            return 0
+        return self.total / self.count
+
+    @property
+    def stddev(self):
+        """Returns the root of the sample variance."""
+        if self.count <= 1:
+            return 0.0
+        variance = (self.squares - self.total*self.total/self.count)
+        return math.sqrt(max(variance, 0.0) / (self.count - 1))
+
+    def to_list(self):
+        """Returns the aggregate as a JSON-friendly list."""
+        return [self.count, self.total, self.squares, self.low, self.high]
+
+    @staticmethod
+    def from_list(values):
+        """Creates an aggregate from ``to_list`` output."""
+        return Aggregate(*values)
+
+    def __repr__(self):
+        return "<Aggregate: n=%d mean=%.2f sd=%.2f>" % (
+                self.count, self.mean, self.stddev)
+
+
+class SummaryResults(object):
+    """Quacks like ``GameResults`` for the parts ``print_stats`` needs."""
+    def __init__(self, wpm, accuracy, values=None):
+        self.wpm = wpm
+        self.accuracy = accuracy
+        self.values = values
+
+    @staticmethod
+    def from_values(values):
+        """Creates results from a sequence of (wpm, accuracy) pairs."""
+        values = list(values)
+        wpm = Aggregate()
+        accuracy = Aggregate()
+        for wpm_value, acc_value in values:
+            wpm.add(wpm_value)
+            accuracy.add(acc_value)
+        return SummaryResults(wpm, accuracy, values)
+
+    def samples(self):
+        """Returns lists of WPMs and accuracies, or None if the summary does
+        not hold every race."""
+        if self.values is None:
+            return None
+        return ([wpm for wpm, _ in self.values],
+                [accuracy for _, accuracy in self.values])
+
+    def __len__(self):
+        return self.wpm.count
+
+    def averages(self):
+        """Returns a tuple of WPM and accuracy averages."""
+        return self.wpm.mean, self.accuracy.mean
+
+    def stddevs(self):
+        """Returns a tuple of WPM and accuracy standard deviations."""
+        return self.wpm.stddev, self.accuracy.stddev
+
+    def extremals(self):
+        """Returns min and max of WPM and accuracy."""
+        return (self.wpm.low or 0, self.wpm.high or 0,
+                self.accuracy.low or 0, self.accuracy.high or 0)
+
+
+class TextSummary(object):
+    """WPM sketch, histogram and last result for a single text."""
+    def __init__(self, digest=None, histogram=None, last=None):
+        if digest is None:
+            digest = TDigest(TEXT_COMPRESSION)
+        if histogram is None:
+            histogram = Histogram()
+        self.digest = digest
+        self.histogram = histogram
+        self.last = last
+
+    def add(self, wpm, count=1):
+        """Adds a race result, or ``count`` races at the given WPM."""
+        self.digest.add(wpm, count)
+        self.histogram.add(wpm, count)
+        self.last = wpm
+
+    def merge(self, other):
+        """Merges the sketch and histogram of another text summary into this
+        one. The last result is kept, since it depends on the order of the
+        races."""
+        self.digest.merge(other.digest)
+        self.histogram.merge(other.histogram)
+
+    def to_dict(self):
+        """Returns the text summary as a JSON-friendly dict."""
+        return {
+            "last": self.last,
+            "digest": self.digest.to_list(),
+            "histogram": self.histogram.to_list(),
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """Creates a text summary from ``to_dict`` output."""
+        return TextSummary(TDigest.from_list(data["digest"]),
+                           Histogram.from_list(data["histogram"]),
+                           data["last"])
+
+
+class TagSummary(object):
+    """Aggregates, WPM sketches and recent races for a single tag."""
+    def __init__(self):
+        self.wpm = Aggregate()
+        self.accuracy = Aggregate()
+        self.digest = TDigest()
+        self.texts = {}
+        self.tail = collections.deque(maxlen=TAIL)
+
+    def text(self, text_id):
+        """Returns the ``TextSummary`` for a text, creating it if needed."""
+        if text_id not in self.texts:
+            self.texts[text_id] = TextSummary()
+        return self.texts[text_id]
+
+    def add(self, wpm, accuracy, text_id=None):
+        """Adds a race result."""
+        self.wpm.add(wpm)
+        self.accuracy.add(accuracy)
+        self.digest.add(wpm)
+        self.tail.append((wpm, accuracy))
+        if text_id is not None:
+            self.text(text_id).add(wpm)
+
+    def add_rollup(self, rollup):
+        """Adds the aggregates of compacted races.
+
+        The sketches only see the average WPM of the rollup.
+        """
+        self.wpm.merge(rollup.wpm)
+        self.accuracy.merge(rollup.accuracy)
+        self.digest.add(rollup.wpm.mean, rollup.count)
+        self.text(rollup.text_id).add(rollup.wpm.mean, rollup.count)
+
+    def add_recent(self, wpm, accuracy=None, text_id=None):
+        """Adds a race to the tail window and the last result of its text
+        only. Leave out the accuracy for rollups, which are not in the tail
+        window."""
+        if accuracy is not None:
+            self.tail.append((wpm, accuracy))
+        if text_id is not None:
+            self.text(text_id).last = wpm
+
+    def merge(self, other):
+        """Merges the aggregates and sketches of another tag summary into this
+        one. The tail window and last results are kept, since they depend on
+        the order of the races."""
+        self.wpm.merge(other.wpm)
+        self.accuracy.merge(other.accuracy)
+        self.digest.merge(other.digest)
+        for text_id, text in other.texts.items():
+            self.text(text_id).merge(text)
+
+    def results(self, last_n=0):
+        """Returns ``SummaryResults`` for all or the last N races."""
+        if not last_n or last_n >= self.wpm.count:
+            values = None
+            if len(self.tail) == self.wpm.count:
+                values = list(self.tail)
+            return SummaryResults(self.wpm, self.accuracy, values)
+
+        if last_n > len(self.tail):
+            raise ValueError("The summary only keeps the last %d races" % TAIL)
+
+        start = len(self.tail) - last_n
+        return SummaryResults.from_values(
+            itertools.islice(self.tail, start, None))
+
+    def to_dict(self):
+        """Returns the tag summary as a JSON-friendly dict."""
+        return {
+            "wpm": self.wpm.to_list(),
+            "accuracy": self.accuracy.to_list(),
+            "digest": self.digest.to_list(),
+            "texts": dict((str(text_id), text.to_dict())
+                          for text_id, text in self.texts.items()),
+            "tail": list(self.tail),
+        }
+
+    @staticmethod
+    def from_dict(data):
+        """Creates a tag summary from ``to_dict`` output."""
+        summary = TagSummary()
+        summary.wpm = Aggregate.from_list(data["wpm"])
+        summary.accuracy = Aggregate.from_list(data["accuracy"])
+        summary.digest = TDigest.from_list(data["digest"])
+        summary.texts = dict((int(text_id), TextSummary.from_dict(text))
+                             for text_id, text in data["texts"].items())
+        summary.tail.extend(tuple(entry) for entry in data["tail"])
+        return summary
+
+
+class Summary(object):
+    """Per-tag summary of a whole score history."""
+    def __init__(self):
+        self.tags = {}
+
+    def __repr__(self):
+        return "<Summary: tags=%d>" % len(self.tags)
+
+    def add(self, tag, wpm, accuracy, text_id=None):
+        """Adds a single race result."""
+        self._tag(tag).add(wpm, accuracy, text_id)
+
+    def add_game(self, tag, game):
+        """Adds a game tuple as stored by ``Stats``."""
+        self.add(tag, game[1], game[2], game[5])
+
+    def add_rollup(self, tag, rollup):
+        """Adds a ``Rollup`` of compacted races as stored by ``Stats``."""
+        self._tag(tag).add_rollup(rollup)
+
+    def add_recent(self, tag, game):
+        """Adds a game tuple or ``Rollup`` to the tail window and last results
+        only, for races whose aggregates and sketches are merged from the
+        summary of another file with ``merge``."""
+        tag_summary = self._tag(tag)
+        if isinstance(game, tuple):
+            tag_summary.add_recent(game[1], game[2], game[5])
+        else:
+            tag_summary.add_recent(game.wpm.mean, text_id=game.text_id)
+
+    def merge(self, other):
+        """Merges the aggregates and sketches of another summary into this
+        one."""
+        for tag, tag_summary in other.tags.items():
+            self._tag(tag).merge(tag_summary)
+
+    def _tag(self, tag):
+        tag = tag_name(tag)
+        if tag not in self.tags:
+            self.tags[tag] = TagSummary()
+        return self.tags[tag]
+
+    def keys(self):
+        """Returns the tags."""
+        return self.tags.keys()
+
+    def digest(self, tag):
+        """Returns the WPM sketch of the given tag."""
+        tag = tag_name(tag)
+        if tag not in self.tags:
+            return TDigest()
+        return self.tags[tag].digest
+
+    def text(self, tag, text_id):
+        """Returns the ``TextSummary`` of a text typed with the tag, or
+        None."""
+        tag = tag_name(tag)
+        if tag not in self.tags:
+            return None
+        return self.tags[tag].texts.get(text_id)
+
+    def results(self, tag, last_n=0):
+        """Returns ``SummaryResults`` for the given tag."""
+        tag = tag_name(tag)
+        if tag not in self.tags:
+            return SummaryResults(Aggregate(), Aggregate())
+        return self.tags[tag].results(last_n)
+
+    @staticmethod
+    def build(rows):
+        """Builds a summary from an iterable of (tag, game) pairs.
+
+        Games are tuples, anything else is taken to be a rollup.
+        """
+        summary = Summary()
+        for tag, game in rows:
+            if isinstance(game, tuple):
+                summary.add_game(tag, game)
+            else:
+                summary.add_rollup(tag, game)
+        return summary
+
+    @staticmethod
+    def from_games(games, rollups=None):
+        """Builds a summary from ``Stats.games`` and ``Stats.rollups`` style
+        dicts."""
+        summary = Summary()
+        for tag, tag_rollups in (rollups or {}).items():
+            for rollup in tag_rollups:
+                summary.add_rollup(tag, rollup)
+        for tag, tag_games in games.items():
+            for game in tag_games:
+                summary.add_game(tag, game)
+        return summary
+
+    @staticmethod
+    def filename(stats_filename):
+        """Returns the sidecar filename for the given CSV file."""
+        return stats_filename + ".summary"
+
+    @staticmethod
+    def load(stats_filename):
+        """Loads the sidecar for the given CSV file.
+
+        Returns:
+            A ``Summary`` or None if the sidecar is missing or out of date.
+        """
+        try:
+            with open(Summary.filename(stats_filename), "rt") as file_obj:
+                data = json.load(file_obj)
+            signature = file_signature(stats_filename)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if data.get("version") != VERSION:
+            return None
+        if list(signature) != data.get("signature"):
+            return None
+
+        summary = Summary()
+        for tag, tag_data in data["tags"].items():
+            summary.tags[tag] = TagSummary.from_dict(tag_data)
+        return summary
+
+    def save(self, stats_filename):
+        """Writes the sidecar, stamped with the signature of the CSV file."""
+        filename = Summary.filename(stats_filename)
+        data = {
+            "version": VERSION,
+            "signature": list(file_signature(stats_filename)),
+            "tags": dict((tag, summary.to_dict())
+                         for tag, summary in self.tags.items()),
+        }
+
+        with open(filename + ".tmp", "wt") as file_obj:
+            json.dump(data, file_obj, separators=(",", ":"))
+
+        os.rename(filename + ".tmp", filename)
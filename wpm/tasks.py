@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Runs the game as asyncio tasks, on Python 3.5 and later.
+
+The input reader, the ticker that updates the clock while racing and the
+writing of finished races are tasks on one event loop, and finished races are
+saved on a worker thread, so that disk writes never hold up keystrokes. On
+older versions of Python, ``GameManager`` runs a select loop of its own and
+saves races as they finish.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import asyncio
+import concurrent.futures
+import signal
+import sys
+
+from wpm.background import Background
+from wpm.game import GameManager
+from wpm.record import clock_ns
+
+# Seconds to wait for more resize signals before redrawing, so that dragging
+# the corner of a window redraws once instead of for every step
+RESIZE_DELAY = 0.05
+
+
+class BackgroundTask(Background):
+    """Queue of jobs that are run one at a time, oldest first.
+
+    While the ``run`` coroutine is running on an event loop, each job runs on
+    a worker thread and its ``done`` callback on the event loop. Otherwise
+    jobs are run as soon as they are submitted.
+    """
+    def __init__(self):
+        super(BackgroundTask, self).__init__()
+        self.executor = None
+        self._wakeup = None
+
+    def wakeup(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+        else:
+            self.flush()
+
+    async def run(self):
+        """Runs queued jobs until cancelled."""
+        loop = asyncio.get_event_loop()
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                self._wakeup.clear()
+                while self.jobs:
+                    job, done = self.jobs.popleft()
+                    await loop.run_in_executor(self.executor, job)
+                    if done is not None:
+                        done()
+                await self._wakeup.wait()
+        finally:
+            self._wakeup = None
+
+    def flush(self):
+        """Waits for the job on the worker thread to finish and runs the rest
+        in this thread."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        super(BackgroundTask, self).flush()
+
+
+class TaskGameManager(GameManager):
+    """The game runner, with the game loop as asyncio tasks."""
+    def __init__(self, quotes, stats, cpm_flag, monochrome):
+        super(TaskGameManager, self).__init__(quotes, stats, cpm_flag,
+                                              monochrome)
+        self.background = BackgroundTask()
+
+        # Set while a race is running, for the ticker
+        self.racing = None
+
+        # Pending redraw after the terminal was resized
+        self.resize_handle = None
+
+    def run_loop(self):
+        """Runs the game tasks on a new event loop until the user quits."""
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.main(loop))
+        finally:
+            loop.close()
+
+    async def main(self, loop):
+        """Runs the game tasks until the user quits or one of them fails."""
+        self.racing = asyncio.Event()
+        if hasattr(signal, "SIGWINCH"):
+            loop.add_signal_handler(signal.SIGWINCH, self.schedule_resize,
+                                    loop)
+
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in
+                 (self.read_input(loop), self.background.run(),
+                  self.ticker())]
+        try:
+            self.render()
+            done, _ = await asyncio.wait(tasks,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            if hasattr(signal, "SIGWINCH"):
+                loop.remove_signal_handler(signal.SIGWINCH)
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+
+    async def read_input(self, loop):
+        """Applies keys as they arrive, until the user quits."""
+        ready = asyncio.Event()
+        loop.add_reader(sys.stdin.fileno(), ready.set)
+        try:
+            while True:
+                ready.clear()
+                keys = self.read_keys()
+                if not keys:
+                    await ready.wait()
+                elif not self.apply_keys(keys):
+                    return
+        finally:
+            loop.remove_reader(sys.stdin.fileno())
+
+    async def ticker(self):
+        """Ticks while racing, and sleeps otherwise."""
+        while True:
+            if not self.is_typing:
+                self.racing.clear()
+                await self.racing.wait()
+
+            await asyncio.sleep(self.tick_delay())
+            if self.is_typing:
+                self.tick()
+
+    def apply_keys(self, keys):
+        if not super(TaskGameManager, self).apply_keys(keys):
+            return False
+        if self.is_typing and self.racing is not None:
+            self.racing.set()
+        return True
+
+    def schedule_resize(self, loop):
+        """Handles a SIGWINCH once no more have arrived for a moment.
+
+        Each signal puts off the redraw again, so that only the last one of a
+        burst redraws.
+        """
+        if self.resize_handle is not None:
+            self.resize_handle.cancel()
+        self.resize_handle = loop.call_later(RESIZE_DELAY, self.resized)
+
+    def resized(self):
+        """Redraws the game for the new terminal size."""
+        self.resize_handle = None
+        self.apply_keys([("KEY_RESIZE", clock_ns())])
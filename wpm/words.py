@@ -0,0 +1,256 @@
+# -*- encoding: utf-8 -*-
+
+"""
+Per-word typing speeds and a persistent index of how fast you type each word.
+
+A finished race is split into the words of its text, and the time spent on
+each word is read off the recorded keystrokes: A word starts when the
+separator in front of it was typed and ends when its last character was. The
+index keeps a running aggregate per word and tag in a ``dbm`` database, so
+recording a race only touches the words that were in it.
+
+This file is part of the wpm software.
+Copyright 2017, 2018 Christian Stigen Larsen
+
+Distributed under the GNU Affero General Public License (AGPL) v3 or later. See
+the file LICENSE.txt for the full license text. This software makes use of open
+source software.
+
+The quotes database is *not* covered by the AGPL!
+"""
+
+import collections
+import json
+import random
+import re
+
+try:
+    import dbm
+except ImportError:
+    import anydbm as dbm
+
+from wpm.journal import locked
+from wpm.summary import Aggregate, tag_name
+
+# Characters that are not part of a word in the index
+PUNCTUATION = u".,;:!?\"'()[]{}<>-—–‘’“”"
+
+# Separates the tag from the word in index keys
+SEPARATOR = u"\x00"
+
+WORD = re.compile(r"\S+", re.UNICODE)
+
+Word = collections.namedtuple("Word", ["word", "wpm", "errors"])
+
+
+def normalize(word):
+    """Returns the word as it is stored in the index."""
+    return word.strip(PUNCTUATION).lower()
+
+
+def segment(text, strokes):
+    """Splits a finished race into words.
+
+    Args:
+        text: The text of the race.
+        strokes: A ``Recorder`` or anything else that yields (seconds, key,
+            position, incorrect) tuples.
+
+    Returns:
+        A list of ``Word`` with the speed and number of mistyped keys of each
+        word in the text. The first character of a race starts the clock, so
+        it does not count towards the speed of the first word. Words that
+        took no time, like a single letter at the start, have no speed.
+        Typos are charged to the word at the offset they were made at, or to
+        the word before it if that is a separator.
+    """
+    strokes = list(strokes)
+    if not strokes:
+        return []
+
+    # When each offset into the text was last reached, and which offsets the
+    # typos were made at. Like ``Engine.error_offsets``, a typo is at the
+    # offset of the mistyped key, past the typos already made.
+    reached = [None]*(len(text) + 1)
+    reached[0] = strokes[0][0]
+    typos = collections.Counter()
+
+    for index, (seconds, _, position, incorrect) in enumerate(strokes):
+        if index + 1 < len(strokes):
+            after, after_incorrect = strokes[index + 1][2:4]
+        else:
+            after, after_incorrect = len(text), 0
+        if after > position:
+            reached[after] = seconds
+        if after_incorrect > incorrect:
+            typos[min(position + incorrect, len(text) - 1)] += 1
+
+    matches = [match for match in WORD.finditer(text)
+               if normalize(match.group())]
+
+    words = []
+    for number, match in enumerate(matches):
+        word = normalize(match.group())
+        start, end = match.start(), match.end()
+
+        # Up to the next word, so that typos on separators are counted
+        first = 0 if number == 0 else start
+        if number + 1 < len(matches):
+            last = matches[number + 1].start()
+        else:
+            last = len(text)
+        errors = sum(typos[offset] for offset in range(first, last))
+
+        speed = None
+        chars = end - start - (1 if start == 0 else 0)
+        if reached[start] is not None and reached[end] is not None:
+            seconds = reached[end] - reached[start]
+            if chars > 0 and seconds > 0:
+                speed = 12.0 * chars / seconds
+
+        words.append(Word(word, speed, errors))
+    return words
+
+
+class WordStats(object):
+    """Running statistics for a single word.
+
+    The speed aggregate only holds the times the word had a speed, so the
+    number of times it was typed is counted separately.
+    """
+    def __init__(self, wpm=None, errors=0, typed=0):
+        self.wpm = wpm if wpm is not None else Aggregate()
+        self.errors = errors
+        self.typed = typed
+
+    def add(self, word):
+        """Adds a ``Word`` from a race."""
+        if word.wpm is not None:
+            self.wpm.add(word.wpm)
+        self.errors += word.errors
+        self.typed += 1
+
+    def merge(self, other):
+        """Merges the statistics of another ``WordStats`` into these."""
+        self.wpm.merge(other.wpm)
+        self.errors += other.errors
+        self.typed += other.typed
+
+    @property
+    def error_rate(self):
+        """Returns the average number of typos per time the word was typed."""
+        if not self.typed:
+            return 0.0
+        return float(self.errors) / self.typed
+
+    @property
+    def score(self):
+        """Returns the average speed, discounted by the typos made."""
+        return self.wpm.mean / (1.0 + self.error_rate)
+
+    def to_list(self):
+        """Returns the statistics as a JSON-friendly list."""
+        return self.wpm.to_list() + [self.errors, self.typed]
+
+    @staticmethod
+    def from_list(values):
+        """Creates statistics from ``to_list`` output."""
+        wpm = Aggregate.from_list(values[:5])
+        # Entries written before the count was kept
+        typed = values[6] if len(values) > 6 else wpm.count
+        return WordStats(wpm, values[5], typed)
+
+    def __repr__(self):
+        return "<WordStats: n=%d mean=%.2f errors=%d>" % (
+                self.typed, self.wpm.mean, self.errors)
+
+
+class WordIndex(object):
+    """Persistent index of word to ``WordStats``, per tag."""
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __repr__(self):
+        return "<WordIndex: %s>" % self.filename
+
+    @staticmethod
+    def _key(tag, word):
+        return (u"%s%s%s" % (tag_name(tag), SEPARATOR, word)).encode("utf-8")
+
+    def add(self, tag, words):
+        """Adds the words of a race. Only their own entries are read and
+        written."""
+        totals = collections.OrderedDict()
+        for word in words:
+            if word.word not in totals:
+                totals[word.word] = WordStats()
+            totals[word.word].add(word)
+
+        if not totals:
+            return
+
+        with locked(self.filename):
+            database = dbm.open(self.filename, "c")
+            try:
+                for word, stats in totals.items():
+                    key = self._key(tag, word)
+                    if key in database:
+                        old = WordStats.from_list(json.loads(
+                            database[key].decode("utf-8")))
+                        stats.merge(old)
+                    database[key] = json.dumps(stats.to_list()).encode("utf-8")
+            finally:
+                database.close()
+
+    def items(self, tag):
+        """Yields (word, ``WordStats``) for all words typed with a tag."""
+        prefix = self._key(tag, u"")
+        try:
+            with locked(self.filename):
+                database = dbm.open(self.filename, "r")
+                try:
+                    entries = [(key, database[key]) for key in database.keys()
+                               if key.startswith(prefix)]
+                finally:
+                    database.close()
+        except dbm.error:
+            # No index yet
+            return
+
+        for key, value in entries:
+            yield (key[len(prefix):].decode("utf-8"),
+                   WordStats.from_list(json.loads(value.decode("utf-8"))))
+
+    def get(self, tag, word):
+        """Returns the ``WordStats`` of a word, or None."""
+        try:
+            with locked(self.filename):
+                database = dbm.open(self.filename, "r")
+                try:
+                    value = database.get(self._key(tag, normalize(word)))
+                finally:
+                    database.close()
+        except dbm.error:
+            return None
+
+        if value is None:
+            return None
+        return WordStats.from_list(json.loads(value.decode("utf-8")))
+
+    def slowest(self, tag, count=20, minimum=2):
+        """Returns the (word, ``WordStats``) with the lowest speeds, discounted
+        by typos, of the words typed at least ``minimum`` times."""
+        words = [(word, stats) for word, stats in self.items(tag)
+                 if stats.wpm.count >= minimum]
+        words.sort(key=lambda item: (item[1].score, item[0]))
+        return words[:count]
+
+    def drill(self, tag, count=20, repeat=2, minimum=2):
+        """Returns a practice text of the slowest words in random order, or
+        None if there are not enough words yet."""
+        words = [word for word, _ in self.slowest(tag, count, minimum)]
+        if not words:
+            return None
+        words *= repeat
+        random.shuffle(words)
+        return u" ".join(words)